@@ -1,70 +1,1277 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template, g, has_app_context
 import sqlite3
 import threading
 import time
 import random
 import json
-from datetime import datetime
+import codecs
+import math
+import gzip
+import hashlib
+import calendar
+import mmap
+import bisect
+import re
+import sys
+import struct
+import queue
+import atexit
+from array import array
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from functools import wraps, lru_cache
 import os
-import requests
-from gradio_client import Client
+import importlib
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: single process, no shared locks
+
+# requests, numpy, pyarrow and gradio_client are imported where they are
+# first used, so starting the app (and every test run) does not pay for them
 
 app = Flask(__name__)
 
 # Configuration
 DATABASE = os.environ.get('DATABASE', 'iot.db')
-DUMMY_DATA_ENABLED = False
-WEBHOOK_ENABLED = True  # New config for webhook
-EMAIL_ENABLED = True    # New config for email notifications
+
+# Toggle defaults; the current values are kept in the settings table
+SETTINGS_DEFAULTS = {
+    "webhook_enabled": True,
+    "email_enabled": True,
+    "dummy_data_enabled": False,
+    "dummy_data_config": None,
+    "dummy_data_stats": None
+}
+SETTINGS_REFRESH_INTERVAL = 1.0  # seconds a worker may serve a stale toggle
 
 # Mailgun configuration
 MAILGUN_API_KEY = os.environ.get('MAILGUN_API_KEY', '')
 MAILGUN_DOMAIN = os.environ.get('MAILGUN_DOMAIN', '')
 MAILGUN_SENDER = os.environ.get('MAILGUN_SENDER', '')
 EMAIL_RATE_LIMIT = 60  # seconds
+MAILGUN_API_URL = os.environ.get('MAILGUN_API_URL', 'https://api.mailgun.net/v3')
+MAILGUN_BATCH_SIZE = 1000  # Mailgun's limit on recipients per batch message
 
-# Gradio client
-try:
-    GRADIO_CLIENT = Client("https://datdang-water-quality-predict.hf.space")
-except Exception as e:
-    print(f"Warning: Could not initialize Gradio client: {e}")
-    GRADIO_CLIENT = None
+# Alert dispatcher configuration
+ALERT_WORKERS = int(os.environ.get('ALERT_WORKERS', 2))
+ALERT_QUEUE_SIZE = 1000
+ALERT_DEDUP_WINDOW = int(os.environ.get('ALERT_DEDUP_WINDOW', EMAIL_RATE_LIMIT))  # seconds
+ALERT_TIMEOUT = (5, 15)  # connect, read seconds
+ALERT_MAX_RETRIES = 3
+ALERT_BACKOFF = 1.0  # seconds, doubled on every retry
 
-def predict_water_quality(tds, ph, humidity, temperature):
-    try:
-        if GRADIO_CLIENT is None:
-            # Fallback logic if Gradio client is not available
-            if tds > 1000 or ph < 6.5 or ph > 8.5:
-                return 'BAD'
-            elif tds > 500 or ph < 7.0 or ph > 8.0:
-                return 'WARNING'
-            else:
-                return 'GOOD'
-                
-        # Try to get prediction from Gradio
-        prediction = GRADIO_CLIENT.predict(
-            tds,
-            ph,
-            humidity,
-            temperature,
-            api_name="/predict"
+# Prediction pipeline configuration
+PENDING_STATUS = 'PENDING'
+PREDICTOR = os.environ.get('PREDICTOR', 'gradio')  # gradio | local | stub
+PREDICTION_WORKERS = int(os.environ.get('PREDICTION_WORKERS', 4))
+PREDICTION_CONCURRENCY = int(os.environ.get('PREDICTION_CONCURRENCY', 2))
+PREDICTION_BATCH_SIZE = int(os.environ.get('PREDICTION_BATCH_SIZE', 50))
+PREDICTION_QUEUE_SIZE = int(os.environ.get('PREDICTION_QUEUE_SIZE', 10000))
+PREDICTION_SWEEP_INTERVAL = 5  # seconds
+STUB_PREDICT_LATENCY = float(os.environ.get('STUB_PREDICT_LATENCY', 0.05))  # seconds
+STATUS_LABELS = ('GOOD', 'WARNING', 'BAD')
+
+# Remote predictor configuration
+GRADIO_URL = os.environ.get('GRADIO_URL', "https://datdang-water-quality-predict.hf.space")
+GRADIO_CONNECT_WAIT = float(os.environ.get('GRADIO_CONNECT_WAIT', 10))  # seconds a prediction waits for the client
+GRADIO_FAILURE_THRESHOLD = 3  # consecutive failures that open the circuit
+GRADIO_RETRY_INTERVAL = float(os.environ.get('GRADIO_RETRY_INTERVAL', 60))  # seconds before a re-probe
+
+# Prediction cache configuration
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))  # 0 disables the cache
+PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL', 300))  # seconds
+PREDICTION_CACHE_QUANTUM = (5.0, 0.05, 1.0, 0.5)  # tds, ph, humidity, temperature steps
+
+# Anomaly detection configuration
+ANOMALY_MAX_NODES = int(os.environ.get('ANOMALY_MAX_NODES', 10000))  # nodes tracked at once, 0 disables
+ANOMALY_WINDOW = 32  # readings in the rolling z-score window
+ANOMALY_MIN_SAMPLES = 16  # readings per field before anything is flagged
+ANOMALY_EWMA_ALPHA = 0.005  # long-run baseline the window is compared against
+ANOMALY_RATE_ALPHA = 0.05  # typical rate of change
+ANOMALY_Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', 5.0))  # spike: window standard deviations
+ANOMALY_DRIFT_THRESHOLD = float(os.environ.get('ANOMALY_DRIFT_THRESHOLD', 1.0))  # drift: baseline standard deviations
+ANOMALY_RATE_THRESHOLD = float(os.environ.get('ANOMALY_RATE_THRESHOLD', 8.0))  # rate: multiples of the typical rate
+ANOMALY_RESOLUTION = (1.0, 0.01, 0.1, 0.05)  # tds, ph, humidity, temperature: smallest meaningful change
+ANOMALY_LOG_SIZE = 1000
+
+# SQLite tuning
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 16))
+DB_POOL_TIMEOUT = 30  # seconds to wait for a free pooled connection
+DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', 5000))  # milliseconds
+DB_BUSY_RETRIES = 3
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))  # bytes
+DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', -16000))  # negative = KiB
+DB_STATEMENT_CACHE_SIZE = 256
+
+# Status checker configuration
+STATUS_CHECK_BATCH_SIZE = int(os.environ.get('STATUS_CHECK_BATCH_SIZE', 5000))
+STATUS_CHECK_MIN_INTERVAL = 0.2  # seconds, while working through a backlog
+STATUS_CHECK_MAX_INTERVAL = 30  # seconds, when idle
+
+# Rollup configuration
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)  # bucket widths in seconds, finest first
+ROLLUP_FIELDS = ('tds', 'ph', 'humidity', 'temp')
+ROLLUP_INTERVAL = int(os.environ.get('ROLLUP_INTERVAL', 10))  # seconds
+ROLLUP_CHUNK_SIZE = 50000  # sensor_data rows per refresh transaction
+HISTORY_DEFAULT_POINTS = 500
+
+# Dashboard stream configuration
+STREAM_COALESCE_INTERVAL = float(os.environ.get('STREAM_COALESCE_INTERVAL', 1.0))  # seconds
+STREAM_HEARTBEAT_INTERVAL = 15  # seconds
+# Each open stream holds one server thread (gunicorn --threads WEB_THREADS
+# per worker); beyond STREAM_MAX_SUBSCRIBERS per worker streams are refused
+# with 503 and dashboards fall back to polling, leaving the remaining
+# threads for ingest and API requests
+WEB_THREADS = int(os.environ.get('WEB_THREADS', 32))
+STREAM_MAX_SUBSCRIBERS = int(os.environ.get('STREAM_MAX_SUBSCRIBERS', max(1, WEB_THREADS * 3 // 4)))
+STREAM_RELAY_INTERVAL = 0.5  # seconds between checks for other workers' writes
+
+# Response cache configuration
+GZIP_LEVEL = 6
+GZIP_MIN_SIZE = 512  # bytes; smaller bodies are sent uncompressed
+
+# Retention configuration (0 keeps data forever)
+RETENTION_RAW_DAYS = int(os.environ.get('RETENTION_RAW_DAYS', 30))
+ROLLUP_RETENTION_DAYS = {
+    60: int(os.environ.get('RETENTION_MINUTE_DAYS', 90)),
+    3600: int(os.environ.get('RETENTION_HOUR_DAYS', 730)),
+    86400: 0
+}
+RETENTION_INTERVAL = int(os.environ.get('RETENTION_INTERVAL', 3600))  # seconds
+RETENTION_CHUNK_SIZE = 5000  # rows per delete transaction
+RETENTION_CHUNK_PAUSE = 0.05  # seconds between chunks, lets other writers in
+RETENTION_VACUUM_PAGES = 1000  # pages per incremental_vacuum step
+RETENTION_VACUUM_STEPS = 50
+
+# Partitioned storage configuration
+PARTITION_DAYS = int(os.environ.get('PARTITION_DAYS', 7))  # days of readings per sensor_data partition
+
+# Node details configuration
+NODE_PAGE_SIZE = 100  # readings per page of /api/nodes/<node_id>
+NODE_PAGE_MAX = 1000
+NODE_PAGE_FIELDS = ('tds', 'ph', 'humidity', 'temp', 'status')
+
+# Export configuration
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 10000))  # rows per fetchmany
+EXPORT_FIELDS = ('node_id', 'timestamp', 'tds', 'ph', 'humidity', 'temp', 'status')
+
+# Map viewport configuration
+NODE_CLUSTER_MAX_ZOOM = 15  # from this zoom level up /api/nodes returns single nodes
+NODE_CLUSTER_CELL_PX = 80  # cluster grid cell size in screen pixels
+
+# Webhook ingest configuration
+WEBHOOK_MAX_BODY = int(os.environ.get('WEBHOOK_MAX_BODY', 512 * 1024 * 1024))  # bytes
+WEBHOOK_CHUNK_ROWS = int(os.environ.get('WEBHOOK_CHUNK_ROWS', 5000))  # measurements per commit or write buffer entry
+WEBHOOK_READ_SIZE = 64 * 1024  # bytes read from the request body at a time
+WEBHOOK_MAX_VALUE = 1024 * 1024  # bytes in one measurement or node field
+
+# Write-behind buffer configuration
+WRITE_BUFFER_SIZE = int(os.environ.get('WRITE_BUFFER_SIZE', 100000))  # readings held in memory, 0 commits every write directly
+WRITE_BUFFER_FLUSH_ROWS = int(os.environ.get('WRITE_BUFFER_FLUSH_ROWS', 5000))  # pending writes that start a flush
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.environ.get('WRITE_BUFFER_FLUSH_INTERVAL', 1.0))  # seconds a write may wait for its flush
+WRITE_BUFFER_MAX_BATCH = 50000  # readings per group commit
+WRITE_BUFFER_SUBMIT_TIMEOUT = 30  # seconds a writer waits for room in a full buffer
+WRITE_BUFFER_RETRY_MAX = 5.0  # seconds, cap on the backoff after a failed flush
+WRITE_JOURNAL = os.environ.get('WRITE_JOURNAL', 'off')  # off | write (survives a crash) | fsync (survives power loss)
+WRITE_JOURNAL_MAX_BYTES = 64 * 1024 * 1024  # rewritten with only unflushed entries past this size
+
+# Instrumentation configuration
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))  # 0 disables the slow query log
+SLOW_QUERY_LOG_SIZE = 200
+PROFILER_INTERVAL = 0.005  # seconds between stack samples
+PROFILER_MAX_STACKS = 5000  # distinct stacks kept per profiling session
+
+# Serving configuration
+LEADER_RETRY_INTERVAL = 5.0  # seconds between attempts to take over background jobs
+
+# Instrumentation: latency histograms for routes, SQL statements, external
+# calls and background loops, rendered in the Prometheus text format on
+# /metrics. Each observation is one bisect and a few list updates
+class Metrics:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.histograms = {}  # name -> {labels: [count per bucket..., +Inf count, sum]}
+        self.descriptions = {}
+
+    def describe(self, name, text):
+        self.descriptions[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            values[index] += 1
+            values[-1] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        with self.lock:
+            snapshot = {name: {key: list(values) for key, values in series.items()}
+                        for name, series in self.histograms.items()}
+        lines = []
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        for name, series in sorted(snapshot.items()):
+            lines.append(f"# HELP {name} {self.descriptions.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(bounds, values):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{metric_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{metric_labels(key)} {values[-1]:.6f}")
+                lines.append(f"{name}_count{metric_labels(key)} {cumulative}")
+        return lines
+
+def metric_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+METRICS = Metrics(METRICS_BUCKETS)
+METRICS.describe('iot_http_request_duration_seconds', 'Time to build a response, by route (streams: to first byte)')
+METRICS.describe('iot_sql_query_duration_seconds', 'SQLite execute/executemany time by normalized statement')
+METRICS.describe('iot_external_call_duration_seconds', 'Latency of calls to external services')
+METRICS.describe('iot_predictor_batch_duration_seconds', 'Time to classify one prediction batch, cache included')
+METRICS.describe('iot_write_buffer_flush_duration_seconds', 'Time to write one group commit from the write buffer')
+METRICS.describe('iot_background_loop_duration_seconds', 'Duration of one pass of a background loop')
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    # One label per statement shape: collapse whitespace, IN (?, ?, ...)
+    # lists and partition names, so each new week adds no label series
+    sql = ' '.join(sql.split())
+    sql = re.sub(r'\?(\s*,\s*\?)+', '?, ...', sql)
+    sql = re.sub(r'sensor_data_p\d{8}', 'sensor_data_p*', sql)
+    return sql if len(sql) <= 200 else sql[:197] + '...'
+
+SLOW_QUERIES = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+def record_query(sql, seconds):
+    statement = normalize_sql(sql)
+    METRICS.observe('iot_sql_query_duration_seconds', seconds, statement=statement)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.append({
+            "statement": statement,
+            "duration_ms": round(seconds * 1000, 3),
+            "thread": threading.current_thread().name,
+            "at": datetime.now().isoformat(timespec='seconds')
+        })
+        print(f"Slow query ({seconds * 1000:.1f} ms): {statement}")
+
+# Opt-in wall-clock sampling profiler: samples every other thread's stack
+# at a fixed interval and counts collapsed stacks, in the folded format
+# flamegraph.pl and speedscope read. Off unless started through the API
+class SamplingProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.interval = PROFILER_INTERVAL
+        self.started = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=None, duration=None):
+        with self.lock:
+            if self.running():
+                return False
+            self.stacks = {}
+            self.samples = 0
+            self.dropped = 0
+            self.interval = interval or PROFILER_INTERVAL
+            self.started = time.time()
+            self.stop_event = threading.Event()
+            self.thread = threading.Thread(target=self.run, args=(self.stop_event, duration),
+                                           name="sampling_profiler", daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self, stop_event, duration):
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration if duration else None
+        while not stop_event.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack = ';'.join(reversed(names))
+                with self.lock:
+                    self.samples += 1
+                    if stack in self.stacks:
+                        self.stacks[stack] += 1
+                    elif len(self.stacks) < PROFILER_MAX_STACKS:
+                        self.stacks[stack] = 1
+                    else:
+                        self.dropped += 1
+
+    def folded(self, limit=None):
+        with self.lock:
+            stacks = sorted(self.stacks.items(), key=lambda item: item[1], reverse=True)
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks[:limit])
+
+    def stats(self):
+        with self.lock:
+            return {
+                "running": self.running(),
+                "interval_seconds": self.interval,
+                "started": self.started,
+                "samples": self.samples,
+                "distinct_stacks": len(self.stacks),
+                "dropped_samples": self.dropped
+            }
+
+PROFILER = SamplingProfiler()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        METRICS.observe(
+            'iot_http_request_duration_seconds',
+            time.perf_counter() - started,
+            method=request.method,
+            route=request.url_rule.rule if request.url_rule else 'unmatched',
+            status=response.status_code
         )
-        return prediction
-    except Exception as e:
-        print(f"Error predicting water quality: {e}")
+    return response
+
+@lru_cache(maxsize=None)
+def optional_module(name):
+    # Imports an optional dependency on first use; None when it is missing
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+# Gradio client, created lazily: the first prediction starts a background
+# connection and waits up to GRADIO_CONNECT_WAIT for it, falling back to
+# the threshold rules meanwhile. A circuit breaker stops calling the remote
+# model after GRADIO_FAILURE_THRESHOLD consecutive failures and lets one
+# probe through every GRADIO_RETRY_INTERVAL seconds until it recovers
+class FallbackStatus(str):
+    # A threshold answer given in place of the remote model. It compares
+    # and stores like the plain status, but is never cached
+    pass
+
+class RemotePredictor:
+    def __init__(self, url, failure_threshold=3, retry_interval=60.0, connect_wait=10.0):
+        self.url = url
+        self.failure_threshold = failure_threshold
+        self.retry_interval = retry_interval
+        self.connect_wait = connect_wait
+        self.lock = threading.Lock()
+        self.client = None
+        self.connecting = None  # Event set when the current attempt ends
+        self.failures = 0
+        self.opened_at = None  # circuit open since (monotonic)
+        self.probing = False
+        self.last_error = None
+        self.counters = {
+            "calls": 0,
+            "fallbacks": 0,
+            "failures": 0,
+            "connects": 0,
+            "circuit_opens": 0,
+            "probes": 0
+        }
+
+    def connect(self, done):
+        try:
+            gradio_client = importlib.import_module('gradio_client')
+            client = gradio_client.Client(self.url)
+        except Exception as e:
+            print(f"Warning: Could not initialize Gradio client: {e}")
+            self.record_failure(e)
+        else:
+            with self.lock:
+                self.client = client
+                self.counters["connects"] += 1
+        finally:
+            with self.lock:
+                self.connecting = None
+            done.set()
+
+    def acquire(self):
+        # Returns (client, probe) or (None, False) when the remote path is
+        # skipped. Starts a connection if there is no client yet
+        with self.lock:
+            if self.opened_at is not None:
+                if self.probing or time.monotonic() - self.opened_at < self.retry_interval:
+                    return None, False
+                self.probing = True
+                self.counters["probes"] += 1
+            probe = self.probing
+            if self.client is not None:
+                return self.client, probe
+            done = self.connecting
+            if done is None:
+                done = self.connecting = threading.Event()
+                threading.Thread(target=self.connect, args=(done,), name="gradio_connect", daemon=True).start()
+        done.wait(self.connect_wait)
+        with self.lock:
+            if self.client is None and probe:
+                self.probing = False
+            return self.client, probe
+
+    def record_failure(self, error):
+        with self.lock:
+            self.failures += 1
+            self.counters["failures"] += 1
+            self.last_error = str(error)
+            if self.probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.counters["circuit_opens"] += 1
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def predict(self, tds, ph, humidity, temperature):
+        client, probe = self.acquire()
+        with self.lock:
+            self.counters["calls"] += 1
+        if client is not None:
+            try:
+                with METRICS.timer('iot_external_call_duration_seconds', service='gradio'):
+                    prediction = client.predict(
+                        tds,
+                        ph,
+                        humidity,
+                        temperature,
+                        api_name="/predict"
+                    )
+                self.record_success()
+                return prediction
+            except Exception as e:
+                print(f"Error predicting water quality: {e}")
+                self.record_failure(e)
         # Fallback to basic logic
-        if tds > 1000 or ph < 6.5 or ph > 8.5:
-            return 'BAD'
-        elif tds > 500 or ph < 7.0 or ph > 8.0:
-            return 'WARNING'
+        with self.lock:
+            self.counters["fallbacks"] += 1
+        return FallbackStatus(threshold_status(tds, ph))
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["connected"] = self.client is not None
+            stats["circuit"] = "closed" if self.opened_at is None else ("half-open" if self.probing else "open")
+            stats["consecutive_failures"] = self.failures
+            stats["last_error"] = self.last_error
+        return stats
+
+REMOTE_PREDICTOR = RemotePredictor(
+    GRADIO_URL,
+    failure_threshold=GRADIO_FAILURE_THRESHOLD,
+    retry_interval=GRADIO_RETRY_INTERVAL,
+    connect_wait=GRADIO_CONNECT_WAIT
+)
+
+def predict_water_quality(tds, ph, humidity, temperature):
+    return REMOTE_PREDICTOR.predict(tds, ph, humidity, temperature)
+
+def threshold_status(tds, ph):
+    if tds > 1000 or ph < 6.5 or ph > 8.5:
+        return 'BAD'
+    elif tds > 500 or ph < 7.0 or ph > 8.0:
+        return 'WARNING'
+    else:
+        return 'GOOD'
+
+# Predictor backends: each takes a list of (tds, ph, humidity, temperature)
+# rows and returns one status per row
+def gradio_predictor(rows):
+    return [predict_water_quality(tds, ph, humidity, temperature) for tds, ph, humidity, temperature in rows]
+
+def stub_predictor(rows):
+    # Local stand-in for the Gradio endpoint, with configurable latency
+    time.sleep(STUB_PREDICT_LATENCY)
+    return [threshold_status(tds, ph) for tds, ph, humidity, temperature in rows]
+
+def local_predictor(rows):
+    # Vectorized threshold classifier: evaluates the whole batch in NumPy
+    if not rows:
+        return []
+    import numpy as np
+    data = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+    tds, ph = data[:, 0], data[:, 1]
+    bad = (tds > 1000) | (ph < 6.5) | (ph > 8.5)
+    warning = (tds > 500) | (ph < 7.0) | (ph > 8.0)
+    return np.asarray(STATUS_LABELS)[np.where(bad, 2, np.where(warning, 1, 0))].tolist()
+
+PREDICTORS = {
+    'gradio': gradio_predictor,
+    'local': local_predictor,
+    'stub': stub_predictor
+}
+
+# LRU/TTL cache of predictions keyed on quantized sensor tuples, so steady
+# nodes reporting near-identical readings are classified once
+class PredictionCache:
+    def __init__(self, max_size=10000, ttl=300, quantum=(5.0, 0.05, 1.0, 0.5)):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.quantum = quantum
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.rows_saved = 0
+
+    def key(self, row):
+        return tuple(int(round(value / step)) for value, step in zip(row, self.quantum))
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.entries[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, status):
+        with self.lock:
+            self.entries[key] = (status, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "rows_saved": self.rows_saved,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None
+            }
+
+def cached_predictor(predictor, cache):
+    def predict(rows):
+        keys = [cache.key(row) for row in rows]
+        
+        # Look up each distinct key once and send only the misses to the backend
+        results = OrderedDict()
+        misses = OrderedDict()
+        for row, key in zip(rows, keys):
+            if key not in results:
+                results[key] = cache.get(key)
+                if results[key] is None:
+                    misses[key] = row
+        if misses:
+            for key, status in zip(misses, predictor(list(misses.values()))):
+                if not isinstance(status, FallbackStatus):
+                    cache.put(key, status)
+                results[key] = status
+        with cache.lock:
+            cache.rows_saved += len(rows) - len(misses)
+        return [results[key] for key in keys]
+    return predict
+
+PREDICTION_CACHE = PredictionCache(
+    max_size=PREDICTION_CACHE_SIZE,
+    ttl=PREDICTION_CACHE_TTL,
+    quantum=PREDICTION_CACHE_QUANTUM
+)
+
+def build_predictor():
+    # Only the remote model's answers are worth caching: the local
+    # classifiers, and the threshold fallback the remote predictor returns
+    # while Gradio is unreachable, cost microseconds, and a quantum bin
+    # can straddle one of their thresholds
+    predictor = PREDICTORS.get(PREDICTOR, gradio_predictor)
+    if PREDICTION_CACHE_SIZE > 0 and predictor is gradio_predictor:
+        predictor = cached_predictor(predictor, PREDICTION_CACHE)
+    return predictor
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+# Background prediction pipeline: the webhook stores readings as PENDING and
+# queues them here; workers classify them in batches and write statuses back
+class PredictionPipeline:
+    def __init__(self, predictor, workers=4, concurrency=2, batch_size=50, max_queue=10000):
+        self.predictor = predictor
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=1000)
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.deferred = 0
+        self.failed = 0
+        self.needs_sweep = True
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self.run_worker, name=f"prediction_worker_{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        t = threading.Thread(target=self.run_sweeper, name="prediction_sweeper", daemon=True)
+        t.start()
+        self.threads.append(t)
+
+    def submit(self, rows):
+        # Never block the caller: rows that do not fit stay PENDING in the
+        # database and are picked up by the sweeper once the queue drains
+        accepted = 0
+        for row in rows:
+            try:
+                self.queue.put_nowait(row)
+                accepted += 1
+            except queue.Full:
+                with self.lock:
+                    self.deferred += len(rows) - accepted
+                    self.needs_sweep = True
+                break
+        with self.lock:
+            self.submitted += accepted
+        return accepted
+
+    def next_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run_worker(self):
+        while True:
+            batch = self.next_batch()
+            with self.lock:
+                self.in_flight += len(batch)
+            try:
+                with self.semaphore:
+                    started = time.perf_counter()
+                    statuses = self.predictor([tuple(value or 0 for value in row[2:6]) for row in batch])
+                    elapsed = time.perf_counter() - started
+                    self.latencies.append(elapsed)
+                    METRICS.observe('iot_predictor_batch_duration_seconds', elapsed, predictor=PREDICTOR)
+                self.store(batch, statuses)
+                with self.lock:
+                    self.completed += len(batch)
+            except Exception as e:
+                print(f"Error in prediction worker: {e}")
+                with self.lock:
+                    self.failed += len(batch)
+                    self.needs_sweep = True
+            finally:
+                with self.lock:
+                    self.in_flight -= len(batch)
+
+    def store(self, batch, statuses):
+        # Rows carry the partition they were stored in as their last field;
+        # the write buffer commits the statuses with its next flush
+        store_statuses([(row[6], row[0], row[1], status, PENDING_STATUS) for row, status in zip(batch, statuses)])
+        
+        if SETTINGS.get('email_enabled'):
+            for node_id in dict.fromkeys(row[1] for row, status in zip(batch, statuses) if status == 'BAD'):
+                send_email_notification(node_id, 'BAD')
+
+    def run_sweeper(self):
+        # Re-queue PENDING rows left behind by a restart, a full queue or a
+        # failed batch; only runs while the pipeline is idle to avoid duplicates
+        while True:
+            time.sleep(PREDICTION_SWEEP_INTERVAL)
+            with self.lock:
+                idle = self.needs_sweep and self.in_flight == 0 and self.queue.empty()
+                if idle:
+                    self.needs_sweep = False
+            if not idle:
+                continue
+            started = time.perf_counter()
+            try:
+                conn = db_connect()
+                rows = []
+                for name in PARTITIONS.route(conn):
+                    rows.extend(conn.execute(f'''
+                    SELECT id, node_id, tds, ph, humidity, temp, ? FROM {name}
+                    WHERE status = ?
+                    ORDER BY id
+                    LIMIT ?
+                    ''', (name, PENDING_STATUS, self.queue.maxsize - len(rows))).fetchall())
+                    if len(rows) == self.queue.maxsize:
+                        break
+                conn.close()
+                self.submit(rows)
+                if len(rows) == self.queue.maxsize:
+                    with self.lock:
+                        self.needs_sweep = True
+            except Exception as e:
+                print(f"Error sweeping pending predictions: {e}")
+                with self.lock:
+                    self.needs_sweep = True
+            METRICS.observe('iot_background_loop_duration_seconds', time.perf_counter() - started, loop='prediction_sweep')
+
+    def stats(self):
+        latencies = list(self.latencies)
+        with self.lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "deferred": self.deferred,
+                "failed": self.failed,
+                "predict_latency_p50_ms": None if not latencies else round(percentile(latencies, 50) * 1000, 3),
+                "predict_latency_p99_ms": None if not latencies else round(percentile(latencies, 99) * 1000, 3)
+            }
+
+PREDICTION_PIPELINE = PredictionPipeline(
+    build_predictor(),
+    workers=PREDICTION_WORKERS,
+    concurrency=PREDICTION_CONCURRENCY,
+    batch_size=PREDICTION_BATCH_SIZE,
+    max_queue=PREDICTION_QUEUE_SIZE
+)
+
+# Database access layer: pooled connections with tuned pragmas. Pooled
+# connections go back to the pool on close(), so callers keep the usual
+# connect / commit / close pattern
+DB_STATS = {
+    "connections_opened": 0,
+    "pool_wait_seconds": 0.0,
+    "write_transactions": 0,
+    "lock_wait_seconds": 0.0,
+    "lock_wait_max_seconds": 0.0,
+    "busy_retries": 0,
+    "busy_errors": 0
+}
+DB_STATS_LOCK = threading.Lock()
+
+def record_db_stat(name, value=1):
+    with DB_STATS_LOCK:
+        DB_STATS[name] += value
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times execute/executemany per statement; fetching is not included
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    checked_out = False
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute bypasses cursor(), so route the shortcuts through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
         else:
-            return 'GOOD'
+            super().close()
+
+    def dispose(self):
+        super().close()
+
+class ConnectionPool:
+    def __init__(self, database, size):
+        self.database = database
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=DB_BUSY_TIMEOUT / 1000.0,
+            factory=PooledConnection,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE
+        )
+        conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = {DB_CACHE_SIZE}')
+        conn.pool = self
+        record_db_stat('connections_opened')
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        
+        if conn is None:
+            with self.lock:
+                create = self.opened < self.size
+                if create:
+                    self.opened += 1
+            if create:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self.lock:
+                        self.opened -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self.idle.get(timeout=DB_POOL_TIMEOUT)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("Connection pool exhausted")
+                finally:
+                    record_db_stat('pool_wait_seconds', time.perf_counter() - started)
+        
+        conn.checked_out = True
+        # Connections a request forgets to close are returned on teardown
+        if has_app_context():
+            g.setdefault('db_connections', []).append(conn)
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        # Closed by its request: teardown must not release it again once
+        # another thread has checked it out
+        if has_app_context() and conn in g.get('db_connections', ()):
+            g.db_connections.remove(conn)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error:
+            conn.dispose()
+            with self.lock:
+                self.opened -= 1
+            return
+        self.idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                self.idle.get_nowait().dispose()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {"size": self.size, "open": self.opened, "idle": self.idle.qsize()}
+
+DB_POOL = None
+DB_POOL_LOCK = threading.Lock()
+
+def get_pool():
+    global DB_POOL
+    with DB_POOL_LOCK:
+        if DB_POOL is None or DB_POOL.database != DATABASE:
+            if DB_POOL is not None:
+                DB_POOL.close_all()
+            DB_POOL = ConnectionPool(DATABASE, DB_POOL_SIZE)
+        return DB_POOL
+
+def db_connect():
+    return get_pool().acquire()
+
+def begin_write(conn):
+    # Take the write lock up front so lock waits and SQLITE_BUSY retries
+    # are measured instead of surfacing halfway through a transaction
+    for attempt in range(DB_BUSY_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            if attempt == DB_BUSY_RETRIES:
+                record_db_stat('busy_errors')
+                raise
+            record_db_stat('busy_retries')
+            time.sleep(0.05 * (2 ** attempt))
+        finally:
+            waited = time.perf_counter() - started
+            with DB_STATS_LOCK:
+                DB_STATS['lock_wait_seconds'] += waited
+                DB_STATS['lock_wait_max_seconds'] = max(DB_STATS['lock_wait_max_seconds'], waited)
+                if conn.in_transaction:
+                    DB_STATS['write_transactions'] += 1
+
+@app.teardown_appcontext
+def release_db_connections(exception):
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+# Shared settings: toggles live in the settings table so they survive
+# restarts and apply to every worker process. Each process caches the
+# values and re-reads them at most every SETTINGS_REFRESH_INTERVAL
+class Settings:
+    def __init__(self, defaults):
+        self.defaults = dict(defaults)
+        self.values = dict(defaults)
+        self.lock = threading.Lock()
+        self.loaded = 0.0
+
+    def refresh(self):
+        conn = db_connect()
+        try:
+            rows = conn.execute('SELECT name, value FROM settings').fetchall()
+        except sqlite3.OperationalError:
+            rows = []  # table not created yet
+        finally:
+            conn.close()
+        values = dict(self.defaults)
+        values.update((name, json.loads(value)) for name, value in rows)
+        self.values = values
+        self.loaded = time.monotonic()
+
+    def get(self, name):
+        if time.monotonic() - self.loaded > SETTINGS_REFRESH_INTERVAL:
+            with self.lock:
+                if time.monotonic() - self.loaded > SETTINGS_REFRESH_INTERVAL:
+                    self.refresh()
+        return self.values[name]
+
+    def set(self, name, value):
+        conn = db_connect()
+        try:
+            begin_write(conn)
+            conn.execute('''
+            INSERT INTO settings (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+            ''', (name, json.dumps(value)))
+            conn.commit()
+        finally:
+            conn.close()
+        with self.lock:
+            self.values = dict(self.values, **{name: value})
+
+    def snapshot(self):
+        self.get(next(iter(self.defaults)))
+        return dict(self.values)
+
+SETTINGS = Settings(SETTINGS_DEFAULTS)
+
+# Partitioned sensor storage: readings live in one table per
+# PARTITION_DAYS span (sensor_data_pYYYYMMDD, named after its first day),
+# each with its own (node_id, ts) index and node_latest triggers. ts is an
+# integer epoch of the naive local timestamp read as UTC, the scale rollup
+# buckets use, and ids come from sensor_sequence so they stay unique
+# across partitions. sensor_partitions maps each table to its [start, end)
+# range; the router reads it to touch only partitions overlapping a query,
+# and retention drops whole partitions instead of deleting rows. Partition
+# names are generated here, never taken from requests, so they are safe to
+# format into SQL
+NAIVE_EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+PARTITION_ORIGIN = 4 * 86400  # 1970-01-05, a Monday
+READING_TIME_RANGE = (datetime(1900, 1, 1), datetime(9000, 1, 1))  # partition start days must stay valid dates
+READING_FIELDS = ('tds', 'ph', 'humidity', 'temperature')  # webhook names, in sensor_data column order
+READING_COLUMNS = "id, node_id, tds, ph, humidity, temp, status, datetime(ts, 'unixepoch') AS timestamp"
+
+def reading_ts(timestamp):
+    return (timestamp - NAIVE_EPOCH) // ONE_SECOND
+
+class SensorPartitions:
+    def __init__(self, days):
+        self.span = days * 86400
+        self.lock = threading.Lock()
+        self.version = None  # schema_version the cached list was read at
+        self.partitions = []  # (start_ts, end_ts, name), oldest first
+        self.routed = 0
+        self.scanned = 0
+        self.pruned = 0
+        self.created = 0
+        self.dropped = 0
+
+    def list(self, conn):
+        # Any CREATE or DROP bumps the schema version, so the cache is
+        # checked against it instead of being invalidated explicitly. Only
+        # call this outside transactions that create or drop partitions,
+        # or their uncommitted tables would be cached
+        version = conn.execute('PRAGMA schema_version').fetchone()[0]
+        with self.lock:
+            if version != self.version:
+                self.partitions = conn.execute(
+                    'SELECT start_ts, end_ts, name FROM sensor_partitions ORDER BY start_ts'
+                ).fetchall()
+                self.version = version
+            return self.partitions
+
+    def route(self, conn, start=None, end=None):
+        # Names of the partitions overlapping [start, end), oldest first
+        partitions = self.list(conn)
+        names = [name for first, last, name in partitions
+                 if (start is None or last > start) and (end is None or first < end)]
+        with self.lock:
+            self.routed += 1
+            self.scanned += len(names)
+            self.pruned += len(partitions) - len(names)
+        return names
+
+    def assign(self, conn, ts_values):
+        # Partition name for each ts, creating missing partitions inside
+        # the caller's write transaction. The cached list is used only
+        # while it matches the schema; otherwise lookups go to the registry
+        # through conn and nothing is cached
+        version = conn.execute('PRAGMA schema_version').fetchone()[0]
+        with self.lock:
+            cached = self.partitions if version == self.version else []
+        names = []
+        current = (0, 0, None)
+        for ts in ts_values:
+            if not current[0] <= ts < current[1]:
+                current = next((p for p in cached if p[0] <= ts < p[1]), None) or self.locate(conn, ts)
+            names.append(current[2])
+        return names
+
+    def locate(self, conn, ts):
+        row = conn.execute('''
+        SELECT start_ts, end_ts, name FROM sensor_partitions WHERE start_ts <= ? AND end_ts > ?
+        ''', (ts, ts)).fetchone()
+        if row:
+            return row
+
+        # New partitions are aligned to the span, counted from a Monday so
+        # weekly partitions are calendar weeks, but never overlap ones
+        # created under an earlier PARTITION_DAYS
+        start = (ts - PARTITION_ORIGIN) // self.span * self.span + PARTITION_ORIGIN
+        end = start + self.span
+        before = conn.execute('SELECT MAX(end_ts) FROM sensor_partitions WHERE end_ts <= ?', (ts,)).fetchone()[0]
+        after = conn.execute('SELECT MIN(start_ts) FROM sensor_partitions WHERE start_ts > ?', (ts,)).fetchone()[0]
+        start = max(start, before) if before is not None else start
+        end = min(end, after) if after is not None else end
+        name = f"sensor_data_p{(NAIVE_EPOCH + timedelta(seconds=start)):%Y%m%d}"
+        self.create(conn, name)
+        conn.execute('INSERT INTO sensor_partitions (name, start_ts, end_ts) VALUES (?, ?, ?)', (name, start, end))
+        with self.lock:
+            self.created += 1
+        return (start, end, name)
+
+    def create(self, conn, name):
+        conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            node_id TEXT,
+            tds REAL,
+            ph REAL,
+            humidity REAL,
+            temp REAL,
+            status TEXT,
+            ts INTEGER NOT NULL
+        )
+        ''')
+
+        # Index used by per-node history and latest-reading lookups
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_node_ts ON {name} (node_id, ts)')
+
+        # Partial index over rows still waiting for the status checker
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name}_unclassified ON {name} (id) WHERE status IS NULL')
+
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_latest_insert
+        AFTER INSERT ON {name}
+        WHEN NEW.node_id IS NOT NULL
+        BEGIN
+            INSERT INTO node_latest (node_id, sensor_id, tds, ph, humidity, temp, status, timestamp, version)
+            VALUES (NEW.node_id, NEW.id, NEW.tds, NEW.ph, NEW.humidity, NEW.temp, NEW.status,
+                    datetime(NEW.ts, 'unixepoch'), NEW.id)
+            ON CONFLICT (node_id) DO UPDATE SET
+                sensor_id = excluded.sensor_id,
+                tds = excluded.tds,
+                ph = excluded.ph,
+                humidity = excluded.humidity,
+                temp = excluded.temp,
+                status = excluded.status,
+                timestamp = excluded.timestamp,
+                version = excluded.version
+            WHERE node_latest.timestamp IS NULL
+               OR excluded.timestamp > node_latest.timestamp
+               OR (excluded.timestamp = node_latest.timestamp AND excluded.sensor_id > node_latest.sensor_id);
+        END
+        ''')
+
+        conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_latest_status
+        AFTER UPDATE OF status ON {name}
+        BEGIN
+            UPDATE node_latest
+            SET status = NEW.status,
+                version = (SELECT last_id FROM sensor_sequence WHERE name = 'sensor_data')
+            WHERE node_id = NEW.node_id AND sensor_id = NEW.id;
+        END
+        ''')
+
+    def drop_before(self, conn, cutoff, folded_id):
+        # Drops partitions ending at or before cutoff whose rows are all
+        # folded into the rollups, one short transaction each. Returns
+        # (partitions, rows) dropped
+        partitions = rows = 0
+        for start, end, name in list(self.list(conn)):
+            if end > cutoff:
+                break
+            begin_write(conn)
+            count, last_id = conn.execute(f'SELECT COUNT(*), MAX(id) FROM {name}').fetchone()
+            if last_id is not None and last_id > folded_id:
+                conn.rollback()
+                break
+            conn.execute(f'DROP TABLE {name}')
+            conn.execute('DELETE FROM sensor_partitions WHERE name = ?', (name,))
+            conn.commit()
+            partitions += 1
+            rows += count
+            time.sleep(RETENTION_CHUNK_PAUSE)
+        with self.lock:
+            self.dropped += partitions
+        return partitions, rows
+
+    def stats(self, conn):
+        partitions = self.list(conn)
+        with self.lock:
+            return {
+                "partition_days": self.span // 86400,
+                "partitions": [
+                    {"name": name, "start": (NAIVE_EPOCH + timedelta(seconds=start)).isoformat(),
+                     "end": (NAIVE_EPOCH + timedelta(seconds=end)).isoformat()}
+                    for start, end, name in partitions
+                ],
+                "queries_routed": self.routed,
+                "partitions_scanned": self.scanned,
+                "partitions_pruned": self.pruned,
+                "created": self.created,
+                "dropped": self.dropped
+            }
+
+PARTITIONS = SensorPartitions(PARTITION_DAYS)
+
+def allocate_ids(conn, count):
+    # First of count consecutive reading ids; call inside a write transaction
+    last_id = conn.execute("SELECT last_id FROM sensor_sequence WHERE name = 'sensor_data'").fetchone()[0]
+    conn.execute("UPDATE sensor_sequence SET last_id = ? WHERE name = 'sensor_data'", (last_id + count,))
+    return last_id + 1
+
+def migrate_legacy_readings(conn):
+    # Moves rows of the single sensor_data table used before partitioning
+    # into partitions, keeping their ids, then drops it. Chunks commit one
+    # at a time and are re-copied with OR IGNORE if the migration restarts;
+    # readings without a timestamp are not carried over
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensor_data'").fetchone():
+        return
+    print("Migrating sensor_data into partitions...")
+    last_id = 0
+    migrated = 0
+    while True:
+        rows = conn.execute('''
+        SELECT id, node_id, tds, ph, humidity, temp, status, CAST(strftime('%s', timestamp) AS INTEGER)
+        FROM sensor_data WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, ROLLUP_CHUNK_SIZE)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        rows = [row for row in rows if row[7] is not None]
+        begin_write(conn)
+        groups = {}
+        for row, name in zip(rows, PARTITIONS.assign(conn, [row[7] for row in rows])):
+            groups.setdefault(name, []).append(row)
+        for name, group in groups.items():
+            conn.executemany(f'INSERT OR IGNORE INTO {name} VALUES (?, ?, ?, ?, ?, ?, ?, ?)', group)
+        conn.commit()
+        migrated += len(rows)
+
+    begin_write(conn)
+    conn.execute('''
+    UPDATE sensor_sequence SET last_id = MAX(last_id,
+        COALESCE((SELECT MAX(id) FROM sensor_data), 0),
+        COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'sensor_data'), 0))
+    WHERE name = 'sensor_data'
+    ''')
+    conn.execute('DROP TABLE sensor_data')
+    conn.commit()
+    print(f"Migrated {migrated} readings")
 
 # Database initialization
 def init_db():
-    conn = sqlite3.connect(DATABASE)
+    conn = db_connect()
     c = conn.cursor()
     
+    # Incremental auto-vacuum lets retention hand free pages back to the
+    # filesystem; it only takes effect on a new database (or after VACUUM)
+    c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
+    # WAL lets readers run alongside the single writer; the mode is persistent
+    c.execute('PRAGMA journal_mode = WAL')
+    
     # Create nodes table
     c.execute('''
     CREATE TABLE IF NOT EXISTS nodes (
@@ -75,30 +1282,141 @@ def init_db():
     )
     ''')
     
-    # Create sensor_data table
+    # Create email_recipients table
     c.execute('''
-    CREATE TABLE IF NOT EXISTS sensor_data (
+    CREATE TABLE IF NOT EXISTS email_recipients (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        node_id TEXT,
+        email TEXT UNIQUE,
+        last_notified TIMESTAMP
+    )
+    ''')
+    
+    # Toggles shared by all worker processes (JSON values)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    
+    # Registry of sensor_data partitions and the id sequence they share
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS sensor_partitions (
+        name TEXT PRIMARY KEY,
+        start_ts INTEGER NOT NULL,
+        end_ts INTEGER NOT NULL
+    )
+    ''')
+    
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS sensor_sequence (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER
+    )
+    ''')
+    c.execute("INSERT OR IGNORE INTO sensor_sequence (name, last_id) VALUES ('sensor_data', 0)")
+    
+    # Create node_latest table: the most recent reading per node, kept
+    # current by triggers so dashboard queries never scan the readings.
+    # version is the reading id for a new reading, or the last id handed
+    # out when only the status changed, so it never goes down from one
+    # commit to the next and the stream relay can read just what moved
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS node_latest (
+        node_id TEXT PRIMARY KEY,
+        sensor_id INTEGER,
         tds REAL,
         ph REAL,
         humidity REAL,
         temp REAL,
         status TEXT,
         timestamp TIMESTAMP,
-        FOREIGN KEY (node_id) REFERENCES nodes (node_id)
+        version INTEGER
     )
     ''')
     
-    # Create email_recipients table
+    # Databases created before version existed get the column, and their
+    # partitions get triggers that maintain it
+    if 'version' not in [row[1] for row in c.execute('PRAGMA table_info(node_latest)')]:
+        c.execute('ALTER TABLE node_latest ADD COLUMN version INTEGER')
+        for (name,) in c.execute('SELECT name FROM sensor_partitions').fetchall():
+            c.execute(f'DROP TRIGGER IF EXISTS {name}_latest_insert')
+            c.execute(f'DROP TRIGGER IF EXISTS {name}_latest_status')
+            PARTITIONS.create(conn, name)
+    c.execute('CREATE INDEX IF NOT EXISTS node_latest_version ON node_latest (version)')
+    
+    # Spatial index over node coordinates for viewport queries. Entries are
+    # keyed on nodes.rowid and kept in step with nodes by triggers; nodes
+    # without coordinates are left out
     c.execute('''
-    CREATE TABLE IF NOT EXISTS email_recipients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE,
-        last_notified TIMESTAMP
+    CREATE VIRTUAL TABLE IF NOT EXISTS nodes_rtree USING rtree (
+        id, min_lat, max_lat, min_lon, max_lon
+    )
+    ''')
+    
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS nodes_rtree_insert
+    AFTER INSERT ON nodes
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO nodes_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        VALUES (NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END
+    ''')
+    
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS nodes_rtree_update
+    AFTER UPDATE OF latitude, longitude ON nodes
+    BEGIN
+        DELETE FROM nodes_rtree WHERE id = OLD.rowid;
+        INSERT INTO nodes_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+        WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    END
+    ''')
+    
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS nodes_rtree_delete
+    AFTER DELETE ON nodes
+    BEGIN
+        DELETE FROM nodes_rtree WHERE id = OLD.rowid;
+    END
+    ''')
+    
+    # Backfill the index for databases created before it existed
+    c.execute('SELECT 1 FROM nodes_rtree LIMIT 1')
+    if not c.fetchone():
+        c.execute('''
+        INSERT INTO nodes_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT rowid, latitude, latitude, longitude, longitude FROM nodes
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+    
+    # Create rollup tables: one row per (resolution, node, bucket start)
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS sensor_rollup (
+        resolution INTEGER,
+        node_id TEXT,
+        bucket INTEGER,
+        count INTEGER,
+        tds_min REAL, tds_max REAL, tds_sum REAL,
+        ph_min REAL, ph_max REAL, ph_sum REAL,
+        humidity_min REAL, humidity_max REAL, humidity_sum REAL,
+        temp_min REAL, temp_max REAL, temp_sum REAL,
+        PRIMARY KEY (resolution, node_id, bucket)
+    ) WITHOUT ROWID
+    ''')
+    
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER
     )
     ''')
     
+    conn.commit()
+    migrate_legacy_readings(conn)
+    
     for i in range(1, 21):
         node_id = f"node_{i}"
         c.execute("INSERT OR IGNORE INTO nodes (node_id, latitude, longitude, last_updated) VALUES (?, ?, ?, ?)",
@@ -108,31 +1426,7 @@ def init_db():
     conn.close()
     print(f"Database initialized at {DATABASE}")
 
-# Function to send email notification
-def send_email_notification(node_id, status):
-    if not MAILGUN_API_KEY or not MAILGUN_DOMAIN:
-        print("Mailgun configuration is incomplete. Skipping email notification.")
-        return
-    
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Get recipients that haven't been notified in the last EMAIL_RATE_LIMIT seconds
-    current_time = datetime.now()
-    rate_limit_time = current_time.timestamp() - EMAIL_RATE_LIMIT
-    
-    c.execute('''
-    SELECT email, last_notified FROM email_recipients
-    WHERE last_notified IS NULL OR last_notified < ?
-    ''', (rate_limit_time,))
-    
-    recipients = c.fetchall()
-    
-    if not recipients:
-        conn.close()
-        return
-    
+def render_alert_email(node_id, status, current_time):
     # Prepare email content
     subject = f"🔥 URGENT: Node {node_id} Status = {status} – Investigate Now"
     text = f"""
@@ -182,153 +1476,1690 @@ def send_email_notification(node_id, status):
         </body>
         </html>
         """
-    # Send email to each recipient
-    for recipient in recipients:
+    return subject, text
+
+# Alert dispatcher: callers only enqueue. Alerts for the same node and
+# status are de-duplicated over ALERT_DEDUP_WINDOW, and a small worker pool
+# delivers them through one pooled HTTP session, sending each alert to up
+# to MAILGUN_BATCH_SIZE recipients per Mailgun call with retries and backoff
+class AlertDispatcher:
+    def __init__(self, workers=2, max_queue=1000, dedup_window=60):
+        self.workers = workers
+        self.dedup_window = dedup_window
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.recent = {}  # (node_id, status) -> last enqueue time
+        self.session = None
+        self.threads = []
+        self.latencies = deque(maxlen=1000)
+        self.counters = {
+            "queued": 0,
+            "deduplicated": 0,
+            "dropped": 0,
+            "api_calls": 0,
+            "recipients_notified": 0,
+            "retries": 0,
+            "failures": 0
+        }
+        self.last_error = None
+
+    def start(self):
+        if self.threads:
+            return
+        import requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        for i in range(self.workers):
+            t = threading.Thread(target=self.run_worker, name=f"alert_worker_{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def enqueue(self, node_id, status):
+        now = time.monotonic()
+        key = (node_id, status)
+        with self.lock:
+            if now - self.recent.get(key, -self.dedup_window) < self.dedup_window:
+                self.counters["deduplicated"] += 1
+                return False
+            self.recent[key] = now
+            if len(self.recent) > 10000:
+                self.recent = {k: t for k, t in self.recent.items() if now - t < self.dedup_window}
         try:
-            response = requests.post(
-                f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
-                auth=("api", MAILGUN_API_KEY),
-                data={
-                    "from": MAILGUN_SENDER,
-                    "to": recipient['email'],
-                    "subject": subject,
-                    "html": text
-                }
-            )
+            self.queue.put_nowait((node_id, status, datetime.now()))
+        except queue.Full:
+            self.count("dropped")
+            return False
+        self.count("queued")
+        return True
+
+    def run_worker(self):
+        while True:
+            node_id, status, current_time = self.queue.get()
+            try:
+                self.deliver(node_id, status, current_time)
+            except Exception as e:
+                print(f"Error dispatching alert for node {node_id}: {e}")
+                self.count("failures")
+
+    def deliver(self, node_id, status, current_time):
+        # Get recipients that haven't been notified in the last EMAIL_RATE_LIMIT seconds
+        conn = db_connect()
+        c = conn.cursor()
+        c.execute('''
+        SELECT email FROM email_recipients
+        WHERE last_notified IS NULL OR last_notified < ?
+        ''', (current_time.timestamp() - EMAIL_RATE_LIMIT,))
+        recipients = [row[0] for row in c.fetchall()]
+        conn.close()
+        
+        if not recipients:
+            return
+        
+        subject, text = render_alert_email(node_id, status, current_time)
+        for offset in range(0, len(recipients), MAILGUN_BATCH_SIZE):
+            batch = recipients[offset:offset + MAILGUN_BATCH_SIZE]
+            if not self.post(batch, subject, text):
+                continue
             
             # Update last notified timestamp
-            if response.status_code == 200:
-                c.execute('''
+            conn = db_connect()
+            try:
+                begin_write(conn)
+                conn.executemany('''
                 UPDATE email_recipients
                 SET last_notified = ?
                 WHERE email = ?
-                ''', (current_time.timestamp(), recipient['email']))
+                ''', [(current_time.timestamp(), email) for email in batch])
+                conn.commit()
+            finally:
+                conn.close()
+            self.count("recipients_notified", len(batch))
+            print(f"Email sent to {len(batch)} recipient(s) for node {node_id}")
+
+    def post(self, recipients, subject, text):
+        import requests
+        data = {
+            "from": MAILGUN_SENDER,
+            "to": recipients,
+            "subject": subject,
+            "html": text,
+            # Batch sending: each recipient only sees their own address
+            "recipient-variables": json.dumps({email: {} for email in recipients})
+        }
+        for attempt in range(ALERT_MAX_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                with METRICS.timer('iot_external_call_duration_seconds', service='mailgun'):
+                    response = self.session.post(
+                        f"{MAILGUN_API_URL}/{MAILGUN_DOMAIN}/messages",
+                        auth=("api", MAILGUN_API_KEY),
+                        data=data,
+                        timeout=ALERT_TIMEOUT
+                    )
+                self.count("api_calls")
+                if response.status_code == 200:
+                    self.latencies.append(time.perf_counter() - started)
+                    return True
+                retryable = response.status_code == 429 or response.status_code >= 500
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+            except requests.RequestException as e:
+                retryable = True
+                error = str(e)
+            
+            with self.lock:
+                self.last_error = error
+            if not retryable or attempt == ALERT_MAX_RETRIES:
+                print(f"Failed to send email to {len(recipients)} recipient(s): {error}")
+                self.count("failures")
+                return False
+            self.count("retries")
+            time.sleep(ALERT_BACKOFF * (2 ** attempt) * (0.5 + random.random()))
+
+    def stats(self):
+        latencies = list(self.latencies)
+        with self.lock:
+            stats = dict(self.counters)
+            stats["queue_depth"] = self.queue.qsize()
+            stats["last_error"] = self.last_error
+        stats["send_latency_p50_ms"] = None if not latencies else round(percentile(latencies, 50) * 1000, 3)
+        stats["send_latency_p99_ms"] = None if not latencies else round(percentile(latencies, 99) * 1000, 3)
+        return stats
+
+ALERT_DISPATCHER = AlertDispatcher(
+    workers=ALERT_WORKERS,
+    max_queue=ALERT_QUEUE_SIZE,
+    dedup_window=ALERT_DEDUP_WINDOW
+)
+
+# Function to send email notification: queues the alert and returns
+def send_email_notification(node_id, status):
+    if not MAILGUN_API_KEY or not MAILGUN_DOMAIN:
+        print("Mailgun configuration is incomplete. Skipping email notification.")
+        return
+    
+    ALERT_DISPATCHER.enqueue(node_id, status)
+
+# Streaming anomaly detection: every ingested reading is scored against
+# its node's recent history in constant time. Per node and field the
+# detector keeps a ring buffer of the last ANOMALY_WINDOW values with
+# running sums (rolling z-score), a slow EWMA mean and variance (long-run
+# baseline) and an EWMA of the absolute rate of change. It flags
+#   spike  - a reading far outside the rolling window
+#   drift  - the window mean moving away from the baseline (reported once
+#            on entry; cleared when it falls back under half the threshold)
+#   rate   - a change per second far above the node's typical rate
+# State is a few compact arrays per node (~1.5 KB) and the least recently
+# seen nodes are dropped past ANOMALY_MAX_NODES. Each worker process scores
+# the readings it ingests
+ANOMALY_FIELDS = ('tds', 'ph', 'humidity', 'temp')
+# NodeBaseline.stats holds 8 slots per field: running sum and sum of
+# squares of the window, EWMA mean and variance, last value and time,
+# typical rate of change and readings seen
+class NodeBaseline:
+    __slots__ = ('window', 'stats', 'drifting')
+
+    def __init__(self, size):
+        self.window = array('d', bytes(8 * size * len(ANOMALY_FIELDS)))
+        self.stats = array('d', bytes(8 * 8 * len(ANOMALY_FIELDS)))
+        self.drifting = 0  # bit per field
+
+class AnomalyDetector:
+    def __init__(self, max_nodes=10000, window=32, log_size=1000):
+        self.max_nodes = max_nodes
+        self.window = window
+        self.nodes = OrderedDict()  # node_id -> NodeBaseline, least recently seen first
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=log_size)
+        self.readings = 0
+        self.evictions = 0
+        self.counts = {"spike": 0, "drift": 0, "rate": 0}
+
+    @property
+    def enabled(self):
+        return self.max_nodes > 0
+
+    def observe(self, node_id, readings):
+        # readings: (ts, tds, ph, humidity, temp) in arrival order, ts in
+        # seconds; values that are not numbers (None included) are skipped.
+        # Returns (index, field, kind, value, score) tuples. Caller holds
+        # self.lock
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = self.nodes[node_id] = NodeBaseline(self.window)
+            if len(self.nodes) > self.max_nodes:
+                self.nodes.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.nodes.move_to_end(node_id)
+        
+        size = self.window
+        window, stats = node.window, node.stats
+        z_limit, drift_limit, rate_limit = ANOMALY_Z_THRESHOLD, ANOMALY_DRIFT_THRESHOLD, ANOMALY_RATE_THRESHOLD
+        sqrt = math.sqrt
+        state = stats.tolist()
+        found = []
+        # One field at a time, so its state stays in locals for the whole run
+        for i, field in enumerate(ANOMALY_FIELDS):
+            base = i * 8
+            total, squares, ewma, ewvar, last, last_ts, rate, seen = state[base:base + 8]
+            seen = int(seen)
+            resolution = ANOMALY_RESOLUTION[i]
+            floor = resolution * resolution
+            bit = 1 << i
+            for index, reading in enumerate(readings):
+                x = reading[i + 1]
+                if x.__class__ is not float and x.__class__ is not int:
+                    continue
+                ts = reading[0]
+                dt = ts - last_ts
+                step = x - last
                 
-                print(f"Email sent to {recipient['email']} for node {node_id}")
-            else:
-                print(f"Failed to send email to {recipient['email']}: {response.text}")
+                if seen >= ANOMALY_MIN_SAMPLES:
+                    n = seen if seen < size else size
+                    mean = total / n
+                    var = squares / n - mean * mean
+                    z = (x - mean) / (sqrt(var) if var > floor else resolution)
+                    if z > z_limit or z < -z_limit:
+                        found.append((index, field, 'spike', x, z))
+                    
+                    drift = (mean - ewma) / (sqrt(ewvar) if ewvar > floor else resolution)
+                    if node.drifting & bit:
+                        if -drift_limit / 2 < drift < drift_limit / 2:
+                            node.drifting &= ~bit
+                    elif drift > drift_limit or drift < -drift_limit:
+                        node.drifting |= bit
+                        found.append((index, field, 'drift', mean, drift))
+                    
+                    if dt > 0 and abs(step) >= z_limit * resolution:
+                        ratio = abs(step) / dt / (rate if rate > 1e-9 else 1e-9)
+                        if ratio > rate_limit:
+                            found.append((index, field, 'rate', x, math.copysign(ratio, step)))
                 
-        except Exception as e:
-            print(f"Error sending email to {recipient['email']}: {str(e)}")
+                # Rolling window: replace the oldest value once full
+                slot = seen % size * 4 + i
+                if seen >= size:
+                    old = window[slot]
+                    total -= old
+                    squares -= old * old
+                window[slot] = x
+                total += x
+                squares += x * x
+                
+                # EWMA baseline; a plain running mean/variance until 1/n < alpha
+                if seen:
+                    alpha = 1.0 / (seen + 1)
+                    if alpha < ANOMALY_EWMA_ALPHA:
+                        alpha = ANOMALY_EWMA_ALPHA
+                    diff = x - ewma
+                    ewma += alpha * diff
+                    ewvar = (1 - alpha) * (ewvar + alpha * diff * diff)
+                    if dt > 0:
+                        alpha = 1.0 / seen
+                        if alpha < ANOMALY_RATE_ALPHA:
+                            alpha = ANOMALY_RATE_ALPHA
+                        rate += alpha * (abs(step) / dt - rate)
+                else:
+                    ewma = x
+                last, last_ts = x, ts
+                seen += 1
+            state[base:base + 8] = total, squares, ewma, ewvar, last, last_ts, rate, seen
+        node.stats = array('d', state)
+        found.sort(key=lambda anomaly: anomaly[0])
+        return found
+
+    def observe_rows(self, rows):
+        # rows: (node_id, tds, ph, humidity, temp, timestamp) as stored;
+        # returns the anomalies found in order per node
+        by_node = {}
+        for row in rows:
+            # Local wall-clock seconds: only differences matter here, and
+            # this is much cheaper than datetime.timestamp()
+            timestamp = row[5]
+            ts = (timestamp - NAIVE_EPOCH).total_seconds() if isinstance(timestamp, datetime) else timestamp
+            by_node.setdefault(row[0], []).append((ts,) + row[1:5] + (timestamp,))
+        
+        anomalies = []
+        with self.lock:
+            for node_id, readings in by_node.items():
+                for index, field, kind, value, score in self.observe(node_id, readings):
+                    timestamp = readings[index][5]
+                    anomaly = {
+                        "node_id": node_id,
+                        "field": field,
+                        "kind": kind,
+                        "value": value,
+                        "score": round(score, 3),
+                        "timestamp": timestamp.timestamp() if isinstance(timestamp, datetime) else timestamp
+                    }
+                    anomalies.append(anomaly)
+                    self.recent.append(anomaly)
+                    self.counts[kind] += 1
+            self.readings += len(rows)
+        return anomalies
+
+    def recent_anomalies(self, node_id=None, limit=100):
+        with self.lock:
+            recent = list(self.recent)
+        if node_id is not None:
+            recent = [a for a in recent if a["node_id"] == node_id]
+        return recent[::-1][:limit]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "nodes_tracked": len(self.nodes),
+                "max_nodes": self.max_nodes,
+                "evictions": self.evictions,
+                "readings": self.readings,
+                "anomalies": dict(self.counts)
+            }
+
+ANOMALY_DETECTOR = AnomalyDetector(
+    max_nodes=ANOMALY_MAX_NODES,
+    window=ANOMALY_WINDOW,
+    log_size=ANOMALY_LOG_SIZE
+)
+
+def detect_anomalies(rows):
+    # Score freshly stored readings and alert once per anomalous node;
+    # the dispatcher de-duplicates repeats within ALERT_DEDUP_WINDOW
+    if not ANOMALY_DETECTOR.enabled:
+        return []
+    anomalies = ANOMALY_DETECTOR.observe_rows(rows)
+    if anomalies and SETTINGS.get('email_enabled'):
+        for node_id in dict.fromkeys(a["node_id"] for a in anomalies):
+            send_email_notification(node_id, 'ANOMALY')
+    return anomalies
+
+# Synthetic load generator behind the dummy data toggle. A scheduler emits
+# batches of random readings at a target rate (optionally in bursts) and a
+# pool of workers writes them either straight to the database through the
+# bulk ingest path or to a running /api/webhook/data endpoint
+class LoadGenerator:
+    PATTERNS = ('steady', 'burst', 'wave')
+    TARGETS = ('db', 'webhook')
+
+    def __init__(self, nodes=None, rate=None, batch_size=None, workers=1, target='db', url=None,
+                 pattern='steady', burst_factor=5.0, burst_period=60.0, burst_duration=5.0, duration=None):
+        if target not in self.TARGETS:
+            raise ValueError(f"target must be one of {', '.join(self.TARGETS)}")
+        if pattern not in self.PATTERNS:
+            raise ValueError(f"pattern must be one of {', '.join(self.PATTERNS)}")
+        
+        if nodes is None:
+            # Default: one reading per existing node per second, as before
+            self.node_ids = NODE_REGISTRY.ids()
+        else:
+            self.node_ids = [f"node_{i + 1}" for i in range(int(nodes))]
+        if not self.node_ids:
+            raise ValueError("No nodes to generate data for")
+        
+        self.rate = float(rate) if rate is not None else float(len(self.node_ids))
+        self.batch_size = int(batch_size) if batch_size is not None else len(self.node_ids)
+        self.workers = int(workers)
+        self.target = target
+        self.url = url or f"http://127.0.0.1:{os.environ.get('PORT', 5000)}/api/webhook/data"
+        self.pattern = pattern
+        self.burst_factor = float(burst_factor)
+        self.burst_period = float(burst_period)
+        self.burst_duration = float(burst_duration)
+        self.duration = float(duration) if duration is not None else None
+        if self.rate <= 0 or self.batch_size <= 0 or self.workers <= 0:
+            raise ValueError("rate, batch_size and workers must be positive")
+        
+        self.queue = queue.Queue(maxsize=self.workers * 4)
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=10000)
+        self.started = None
+        self.finished = None
+        self.rows_sent = 0
+        self.batches_sent = 0
+        self.errors = 0
+        self.last_error = None
+        self.next_node = 0
+
+    def config(self):
+        return {
+            "nodes": len(self.node_ids),
+            "rate": self.rate,
+            "batch_size": self.batch_size,
+            "workers": self.workers,
+            "target": self.target,
+            "url": self.url if self.target == 'webhook' else None,
+            "pattern": self.pattern,
+            "duration": self.duration
+        }
+
+    def rate_multiplier(self, elapsed):
+        if self.pattern == 'burst':
+            return self.burst_factor if elapsed % self.burst_period < self.burst_duration else 1.0
+        if self.pattern == 'wave':
+            return 1.0 + 0.5 * math.sin(2 * math.pi * elapsed / self.burst_period)
+        return 1.0
+
+    def make_batch(self):
+        now = time.time()
+        rows = []
+        for _ in range(self.batch_size):
+            node_id = self.node_ids[self.next_node]
+            self.next_node = (self.next_node + 1) % len(self.node_ids)
+            rows.append((
+                node_id,
+                random.uniform(100, 500),
+                random.uniform(6.0, 8.5),
+                random.uniform(30, 90),
+                random.uniform(20, 35),
+                now
+            ))
+        return rows
+
+    def run(self, keep_running):
+        self.started = time.perf_counter()
+        threads = [threading.Thread(target=self.run_worker, daemon=True) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        
+        # Accumulate the rows owed at the current rate and emit whole batches
+        owed = 0.0
+        last = self.started
+        while keep_running():
+            now = time.perf_counter()
+            elapsed = now - self.started
+            if self.duration is not None and elapsed >= self.duration:
+                break
+            owed += (now - last) * self.rate * self.rate_multiplier(elapsed)
+            last = now
+            while owed >= self.batch_size:
+                self.queue.put(self.make_batch())
+                owed -= self.batch_size
+            time.sleep(min(0.05, self.batch_size / self.rate / 4))
+        
+        for _ in threads:
+            self.queue.put(None)
+        for t in threads:
+            t.join()
+        self.finished = time.perf_counter()
+
+    def run_worker(self):
+        session = None
+        if self.target == 'webhook':
+            import requests
+            session = requests.Session()
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                return
+            started = time.perf_counter()
+            try:
+                if session is not None:
+                    self.send_webhook(session, rows)
+                else:
+                    self.send_db(rows)
+                with self.lock:
+                    self.latencies.append(time.perf_counter() - started)
+                    self.rows_sent += len(rows)
+                    self.batches_sent += 1
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+
+    def send_db(self, rows):
+        statuses = random.choices(['GOOD', 'WARNING', 'BAD'], [0.7, 0.2, 0.1], k=len(rows))
+        rows = [row[:5] + (datetime.fromtimestamp(row[5]),) for row in rows]
+        commit_rows(rows, statuses)
+
+    def send_webhook(self, session, rows):
+        payload = OrderedDict()
+        for node_id, tds, ph, humidity, temperature, timestamp in rows:
+            payload.setdefault(node_id, []).append({
+                "timestamp": timestamp,
+                "tds": tds,
+                "ph": ph,
+                "humidity": humidity,
+                "temperature": temperature
+            })
+        response = session.post(self.url, json=[{"nodeId": node_id, "data": data} for node_id, data in payload.items()],
+                                timeout=30)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+    def stats(self):
+        latencies = list(self.latencies)
+        with self.lock:
+            end = self.finished or time.perf_counter()
+            elapsed = end - self.started if self.started else 0
+            attempts = self.batches_sent + self.errors
+            return {
+                "config": self.config(),
+                "running": self.started is not None and self.finished is None,
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_sent": self.rows_sent,
+                "batches_sent": self.batches_sent,
+                "errors": self.errors,
+                "error_rate": round(self.errors / attempts, 4) if attempts else None,
+                "last_error": self.last_error,
+                "achieved_rows_per_second": round(self.rows_sent / elapsed, 1) if elapsed else None,
+                "latency_p50_ms": None if not latencies else round(percentile(latencies, 50) * 1000, 3),
+                "latency_p95_ms": None if not latencies else round(percentile(latencies, 95) * 1000, 3),
+                "latency_p99_ms": None if not latencies else round(percentile(latencies, 99) * 1000, 3)
+            }
+
+LOAD_GENERATOR = None
+
+def generate_dummy_data(config=None):
+    global LOAD_GENERATOR
+    try:
+        LOAD_GENERATOR = LoadGenerator(**(config or {}))
+    except (TypeError, ValueError) as e:
+        print(f"Error starting dummy data generation: {e}")
+        SETTINGS.set('dummy_data_enabled', False)
+        return
+    LOAD_GENERATOR.run(lambda: SETTINGS.get('dummy_data_enabled'))
+    print("Dummy data generation stopped")
+
+# Status checker: rows stored without a status are tracked by a partial
+# index, so each cycle reads a bounded batch past an id cursor instead of
+# scanning the whole history
+STATUS_CHECK_STATS = {
+    "cycles": 0,
+    "rows_processed_total": 0,
+    "interval_seconds": None,
+    "history": deque(maxlen=20)
+}
+
+def run_status_check(after_id):
+    started = time.perf_counter()
+    conn = db_connect()
+    c = conn.cursor()
     
-    conn.commit()
+    # Oldest unclassified ids across partitions; each partition is read
+    # through its partial index
+    names = PARTITIONS.route(conn)
+    rows = []
+    for name in names:
+        c.execute(f'''
+        SELECT id, node_id, ts, ? FROM {name}
+        WHERE status IS NULL AND id > ?
+        ORDER BY id
+        LIMIT ?
+        ''', (name, after_id, STATUS_CHECK_BATCH_SIZE))
+        rows.extend(c.fetchall())
+    rows = sorted(rows)[:STATUS_CHECK_BATCH_SIZE]
+    
+    # One status per node per batch, as the mock API returns per node
+    statuses = {}
+    for row in rows:
+        if row[1] not in statuses:
+            statuses[row[1]] = random.choices(['GOOD', 'WARNING', 'BAD'], [0.7, 0.2, 0.1])[0]
+    
+    backlog = sum(c.execute(f'SELECT COUNT(*) FROM {name} WHERE status IS NULL').fetchone()[0] for name in names) - len(rows)
     conn.close()
+    
+    if rows:
+        store_statuses([(row[3], row[0], row[1], statuses[row[1]], None) for row in rows])
+    
+    # Alerts do not wait for the statuses to be written
+    for node_id, status in statuses.items():
+        if status == 'BAD':
+            send_email_notification(node_id, status)
+    
+    # Lag: age of the oldest reading this cycle picked up. Rows come in
+    # id order, and a late or backfilled reading can have any timestamp
+    lag = reading_ts(datetime.now()) - min(row[2] for row in rows) if rows else 0
+    cycle = {
+        "rows_processed": len(rows),
+        "nodes": len(statuses),
+        "backlog": backlog,
+        "lag_seconds": lag,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+    return (rows[-1][0] if rows else after_id), cycle
+
+def check_node_status():
+    cursor = 0
+    interval = STATUS_CHECK_MIN_INTERVAL
+    while True:
+        try:
+            with METRICS.timer('iot_background_loop_duration_seconds', loop='status_check'):
+                cursor, cycle = run_status_check(cursor)
+            
+            # Run again right away while there is a backlog, back off when idle
+            if cycle["rows_processed"] == STATUS_CHECK_BATCH_SIZE:
+                interval = STATUS_CHECK_MIN_INTERVAL
+            elif cycle["rows_processed"]:
+                interval = STATUS_CHECK_MIN_INTERVAL * 5
+            else:
+                interval = min(interval * 2, STATUS_CHECK_MAX_INTERVAL)
+            
+            STATUS_CHECK_STATS["cycles"] += 1
+            STATUS_CHECK_STATS["rows_processed_total"] += cycle["rows_processed"]
+            STATUS_CHECK_STATS["interval_seconds"] = interval
+            STATUS_CHECK_STATS["history"].append(cycle)
+        except Exception as e:
+            print(f"Error checking node status: {e}")
+            interval = STATUS_CHECK_MAX_INTERVAL
+        time.sleep(interval)
+
+# Rollups: per-node min/max/sum/count of every sensor field in 1-minute,
+# 1-hour and 1-day buckets, refreshed incrementally from a high-water mark
+# on the reading id so each run only reads rows added since the last one.
+# The upsert is formatted with each partition that holds newer ids
+def rollup_upsert_sql():
+    aggregates = ', '.join(f'MIN(s.{f}), MAX(s.{f}), TOTAL(s.{f})' for f in ROLLUP_FIELDS)
+    columns = ', '.join(f'{f}_min, {f}_max, {f}_sum' for f in ROLLUP_FIELDS)
+    updates = ',\n        '.join(
+        f'{f}_min = MIN(COALESCE({f}_min, excluded.{f}_min), COALESCE(excluded.{f}_min, {f}_min)),\n        '
+        f'{f}_max = MAX(COALESCE({f}_max, excluded.{f}_max), COALESCE(excluded.{f}_max, {f}_max)),\n        '
+        f'{f}_sum = {f}_sum + excluded.{f}_sum'
+        for f in ROLLUP_FIELDS
+    )
+    return f'''
+    INSERT INTO sensor_rollup (resolution, node_id, bucket, count, {columns})
+    SELECT ?, s.node_id, s.ts / ? * ?, COUNT(*), {aggregates}
+    FROM {{partition}} s
+    WHERE s.id > ? AND s.id <= ? AND s.node_id IS NOT NULL
+    GROUP BY s.node_id, 3
+    ON CONFLICT (resolution, node_id, bucket) DO UPDATE SET
+        count = count + excluded.count,
+        {updates}
+    '''
+
+def refresh_rollups():
+    conn = db_connect()
+    c = conn.cursor()
+    processed = 0
+    
+    try:
+        c.execute("SELECT last_id FROM rollup_state WHERE name = 'sensor_rollup'")
+        row = c.fetchone()
+        last_id = row[0] if row else 0
+        c.execute("SELECT last_id FROM sensor_sequence WHERE name = 'sensor_data'")
+        max_id = c.fetchone()[0] or 0
+        
+        # Partitions whose newest id is past the high-water mark; usually
+        # just the current one
+        names = [name for name in PARTITIONS.route(conn)
+                 if (c.execute(f'SELECT MAX(id) FROM {name}').fetchone()[0] or 0) > last_id]
+        
+        # Fold new rows in bounded chunks, one short transaction each
+        while last_id < max_id:
+            upper = min(last_id + ROLLUP_CHUNK_SIZE, max_id)
+            begin_write(conn)
+            for name in names:
+                for resolution in ROLLUP_RESOLUTIONS:
+                    c.execute(ROLLUP_UPSERT_SQL.format(partition=name),
+                              (resolution, resolution, resolution, last_id, upper))
+            c.execute('''
+            INSERT INTO rollup_state (name, last_id) VALUES ('sensor_rollup', ?)
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+            ''', (upper,))
+            conn.commit()
+            processed += upper - last_id
+            last_id = upper
+    finally:
+        conn.close()
+    
+    return processed
+
+ROLLUP_UPSERT_SQL = rollup_upsert_sql()
+
+def rollup_worker():
+    while True:
+        try:
+            with METRICS.timer('iot_background_loop_duration_seconds', loop='rollup'):
+                refresh_rollups()
+        except Exception as e:
+            print(f"Error refreshing rollups: {e}")
+        time.sleep(ROLLUP_INTERVAL)
+
+def pick_resolution(start, end, points):
+    # Finest rollup whose bucket count over the range fits the point budget
+    for resolution in ROLLUP_RESOLUTIONS:
+        if (end - start) / resolution <= points:
+            return resolution
+    return ROLLUP_RESOLUTIONS[-1]
+
+def rollup_epoch(ts):
+    # Readings store naive local datetimes, which strftime('%s') reads as UTC
+    return calendar.timegm(datetime.fromtimestamp(ts).timetuple())
+
+# Retention: raw readings are dropped a whole partition at a time once the
+# partition ends more than RETENTION_RAW_DAYS ago and has been folded into
+# sensor_rollup, and finer rollup tiers expire after their own windows.
+# Rollup deletes run in bounded chunks so the write lock is released
+# between them, then free pages are reclaimed incrementally
+RETENTION_STATUS = {
+    "runs": 0,
+    "last_run": None,
+    "rows_pruned_total": 0,
+    "bytes_reclaimed_total": 0,
+    "history": deque(maxlen=20)
+}
+RETENTION_LOCK = threading.Lock()
+
+def delete_in_chunks(conn, sql, params):
+    deleted = 0
+    while True:
+        begin_write(conn)
+        conn.execute(sql, params + (RETENTION_CHUNK_SIZE,))
+        changes = conn.execute('SELECT changes()').fetchone()[0]
+        conn.commit()
+        deleted += changes
+        if changes < RETENTION_CHUNK_SIZE:
+            return deleted
+        time.sleep(RETENTION_CHUNK_PAUSE)
+
+def reclaim_free_pages(conn):
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    pages_before = conn.execute('PRAGMA page_count').fetchone()[0]
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        for _ in range(RETENTION_VACUUM_STEPS):
+            if not conn.execute('PRAGMA freelist_count').fetchone()[0]:
+                break
+            conn.execute(f'PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})').fetchall()
+    pages_after = conn.execute('PRAGMA page_count').fetchone()[0]
+    return (pages_before - pages_after) * page_size
+
+def run_retention():
+    with RETENTION_LOCK:
+        started = time.perf_counter()
+        
+        # Make sure everything about to be pruned is already in the rollups
+        refresh_rollups()
+        
+        conn = db_connect()
+        try:
+            run = {"started": datetime.now().isoformat(), "rows_pruned": 0, "partitions_dropped": 0,
+                   "rollup_rows_pruned": 0}
+            
+            if RETENTION_RAW_DAYS > 0:
+                cutoff = rollup_epoch(time.time() - RETENTION_RAW_DAYS * 86400)
+                row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sensor_rollup'").fetchone()
+                folded_id = row[0] if row else 0
+                run["partitions_dropped"], run["rows_pruned"] = PARTITIONS.drop_before(conn, cutoff, folded_id)
+            
+            for resolution, days in ROLLUP_RETENTION_DAYS.items():
+                if days > 0:
+                    cutoff = rollup_epoch(time.time() - days * 86400)
+                    run["rollup_rows_pruned"] += delete_in_chunks(conn, '''
+                    DELETE FROM sensor_rollup WHERE (resolution, node_id, bucket) IN (
+                        SELECT resolution, node_id, bucket FROM sensor_rollup
+                        WHERE resolution = ? AND bucket < ?
+                        LIMIT ?
+                    )
+                    ''', (resolution, cutoff))
+            
+            run["bytes_reclaimed"] = reclaim_free_pages(conn)
+        finally:
+            conn.close()
+        if run["rows_pruned"]:
+            bump_data_version()
+        
+        run["duration_seconds"] = round(time.perf_counter() - started, 3)
+        RETENTION_STATUS["runs"] += 1
+        RETENTION_STATUS["last_run"] = run["started"]
+        RETENTION_STATUS["rows_pruned_total"] += run["rows_pruned"]
+        RETENTION_STATUS["bytes_reclaimed_total"] += run["bytes_reclaimed"]
+        RETENTION_STATUS["history"].append(run)
+        return run
+
+def retention_worker():
+    while True:
+        time.sleep(RETENTION_INTERVAL)
+        try:
+            with METRICS.timer('iot_background_loop_duration_seconds', loop='retention'):
+                run_retention()
+        except Exception as e:
+            print(f"Error running retention: {e}")
+
+# Publish/subscribe hub for the dashboard stream. Publishers record the
+# latest row per node under a global version number; subscribers keep the
+# last version they sent and wake on a shared condition, so an idle stream
+# costs no CPU and a burst of updates to one node collapses into one delta.
+# Subscribers woken together share the list of changes; a subscriber that
+# watches a viewport filters it and encodes only what it keeps
+class EventHub:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.latest = OrderedDict()  # node_id -> (version, update), oldest first
+        self.subscribers = 0
+        self.refused = 0
+        self.published = 0
+        self.changes = (None, None)
+        self.encoded = (None, None)
+
+    def subscribe(self, limit):
+        # Takes a subscriber slot; False when all `limit` are in use
+        with self.condition:
+            if self.subscribers >= limit:
+                self.refused += 1
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def publish(self, updates):
+        if not updates:
+            return
+        with self.condition:
+            for update in updates:
+                self.version += 1
+                self.latest[update['node_id']] = (self.version, update)
+                self.latest.move_to_end(update['node_id'])
+            self.published += len(updates)
+            self.condition.notify_all()
+
+    def publish_changed(self, updates):
+        # Publish only the updates subscribers have not been sent yet
+        with self.condition:
+            changed = [update for update in updates
+                       if self.latest.get(update['node_id'], (0, None))[1] != update]
+        self.publish(changed)
+
+    def changes_since(self, version, timeout, keep=None):
+        # Returns the new version and the JSON-encoded deltas (or None).
+        # keep, if given, filters the list of updates
+        with self.condition:
+            if self.version <= version:
+                self.condition.wait(timeout)
+            if version > self.version:
+                version = 0  # client saw a previous process; resend everything
+            if version == self.version:
+                return version, None
+            
+            key = (version, self.version)
+            if self.changes[0] != key:
+                changes = []
+                for node_version, update in reversed(self.latest.values()):
+                    if node_version <= version:
+                        break
+                    changes.append(update)
+                self.changes = (key, changes)
+            changes = self.changes[1]
+            if keep is None and self.encoded[0] != key:
+                self.encoded = (key, json.dumps(changes))
+            current = self.version
+            encoded = self.encoded[1] if keep is None else None
+        
+        if keep is not None:
+            changes = keep(changes)
+            encoded = json.dumps(changes) if changes else None
+        return current, encoded
+
+    def stats(self):
+        with self.condition:
+            return {
+                "subscribers": self.subscribers,
+                "max_subscribers": STREAM_MAX_SUBSCRIBERS,
+                "refused": self.refused,
+                "version": self.version,
+                "nodes_tracked": len(self.latest),
+                "updates_published": self.published
+            }
+
+EVENT_HUB = EventHub()
+
+def publish_latest(node_ids):
+    # Push the current node_latest rows for the given nodes to subscribers
+    node_ids = [node_id for node_id in dict.fromkeys(node_ids) if node_id is not None]
+    if not node_ids:
+        return
+    conn = db_connect()
+    conn.row_factory = sqlite3.Row
+    try:
+        updates = []
+        for offset in range(0, len(node_ids), 500):
+            chunk = node_ids[offset:offset + 500]
+            updates.extend(dict(row) for row in conn.execute(f'''
+            SELECT node_id, tds, ph, humidity, temp, status, timestamp
+            FROM node_latest
+            WHERE node_id IN ({', '.join('?' * len(chunk))})
+            ''', chunk))
+    finally:
+        conn.close()
+    EVENT_HUB.publish(updates)
+
+# Data version: bumped whenever readings or nodes change, so cached read
+# responses are reused until something new arrives. The counter lives in
+# an 8-byte memory-mapped file next to the database, so a write in one
+# worker process invalidates the caches of all of them
+class SharedVersion:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.local = 0
+        self.fd = None
+        self.map = None
+        if fcntl is None:
+            return
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(fd).st_size < 8:
+                os.ftruncate(fd, 8)
+            self.map = mmap.mmap(fd, 8)
+            self.fd = fd
+        except OSError as e:
+            print(f"Warning: shared data version unavailable, caches are per process: {e}")
+
+    def get(self):
+        if self.map is None:
+            return self.local
+        return struct.unpack_from('<Q', self.map)[0]
+
+    def bump(self):
+        # Returns the new value
+        with self.lock:
+            if self.map is None:
+                self.local += 1
+                return self.local
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                value = struct.unpack_from('<Q', self.map)[0] + 1
+                struct.pack_into('<Q', self.map, 0, value)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            return value
+
+SHARED_VERSION = None
+SHARED_VERSION_LOCK = threading.Lock()
+
+def shared_version():
+    global SHARED_VERSION
+    version = SHARED_VERSION
+    if version is None or version.path != DATABASE + '-version':
+        with SHARED_VERSION_LOCK:
+            if SHARED_VERSION is None or SHARED_VERSION.path != DATABASE + '-version':
+                SHARED_VERSION = SharedVersion(DATABASE + '-version')
+            version = SHARED_VERSION
+    return version
+
+def data_version():
+    return shared_version().get()
+
+def bump_data_version():
+    shared_version().bump()
+
+def notify_data_changed(node_ids):
+    bump_data_version()
+    publish_latest(node_ids)
+
+# Node registry: node ids and coordinates held in memory so ingest and the
+# node routes resolve existence without a query. Writers update it after
+# their commit (write-through) and bump a shared node version next to the
+# database; a process that sees a version it did not produce reloads the
+# table, so nodes created or deleted by another worker show up on the
+# next lookup
+class NodeRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shared_version = None
+        self.version = None
+        self.nodes = None  # node_id -> (latitude, longitude)
+        self.lookups = 0
+        self.reloads = 0
+        self.writes = 0
+
+    def shared(self):
+        version = self.shared_version
+        if version is None or version.path != DATABASE + '-nodes-version':
+            version = self.shared_version = SharedVersion(DATABASE + '-nodes-version')
+            self.nodes = None
+        return version
+
+    def sync(self):
+        # Caller holds self.lock. The version is read before the table, so
+        # a write committed during the reload triggers another one
+        version = self.shared().get()
+        if self.nodes is not None and version == self.version:
+            return
+        conn = db_connect()
+        try:
+            rows = conn.execute('SELECT node_id, latitude, longitude FROM nodes').fetchall()
+        finally:
+            conn.close()
+        self.nodes = {node_id: (latitude, longitude) for node_id, latitude, longitude in rows}
+        self.version = version
+        self.reloads += 1
+
+    def get(self, node_id):
+        # (latitude, longitude) of a known node, None otherwise
+        with self.lock:
+            self.sync()
+            self.lookups += 1
+            return self.nodes.get(node_id)
+
+    def missing(self, node_ids):
+        with self.lock:
+            self.sync()
+            self.lookups += len(node_ids)
+            return [node_id for node_id in node_ids if node_id not in self.nodes]
+
+    def ids(self):
+        with self.lock:
+            self.sync()
+            return list(self.nodes)
+
+    def within(self, node_ids, bbox):
+        # The given nodes located inside bbox (west, south, east, north)
+        west, south, east, north = bbox
+        with self.lock:
+            self.sync()
+            self.lookups += len(node_ids)
+            inside = set()
+            for node_id in node_ids:
+                location = self.nodes.get(node_id)
+                if location is not None and south <= location[0] <= north and west <= location[1] <= east:
+                    inside.add(node_id)
+            return inside
+
+    def update(self, added=(), removed=()):
+        # Call after the transaction that changed nodes has committed
+        with self.lock:
+            version = self.shared().bump()
+            if self.nodes is not None and version == self.version + 1:
+                for node_id, latitude, longitude in added:
+                    self.nodes[node_id] = (latitude, longitude)
+                for node_id in removed:
+                    self.nodes.pop(node_id, None)
+                self.version = version
+            self.writes += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.nodes) if self.nodes is not None else 0,
+                "lookups": self.lookups,
+                "queries_avoided": max(self.lookups - self.reloads, 0),
+                "reloads": self.reloads,
+                "writes": self.writes
+            }
+
+NODE_REGISTRY = NodeRegistry()
+
+# Cache of serialized read responses keyed by path and query string. Each
+# entry keeps the plain and gzipped body and is valid for one data version
+class ResponseCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved_gzip = 0
+        self.bytes_saved_not_modified = 0
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["version"] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, version, body, mimetype):
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        entry = {
+            "version": version,
+            "body": body,
+            "mimetype": mimetype,
+            "etag": digest,
+            "gzip_body": gzip.compress(body, compresslevel=GZIP_LEVEL) if len(body) >= GZIP_MIN_SIZE else None,
+            "gzip_etag": digest + '-gz'
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def record(self, not_modified=0, gzip_saved=0):
+        with self.lock:
+            if not_modified:
+                self.not_modified += 1
+                self.bytes_saved_not_modified += not_modified
+            self.bytes_saved_gzip += gzip_saved
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "not_modified": self.not_modified,
+                "bytes_saved_gzip": self.bytes_saved_gzip,
+                "bytes_saved_not_modified": self.bytes_saved_not_modified,
+                "data_version": data_version()
+            }
+
+RESPONSE_CACHE = ResponseCache()
+
+def cached_response(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        version = data_version()
+        entry = RESPONSE_CACHE.get(key, version)
+        if entry is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = RESPONSE_CACHE.put(key, version, response.get_data(), response.mimetype)
+        
+        use_gzip = entry["gzip_body"] is not None and 'gzip' in request.headers.get('Accept-Encoding', '')
+        etag = entry["gzip_etag"] if use_gzip else entry["etag"]
+        body = entry["gzip_body"] if use_gzip else entry["body"]
+        
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            RESPONSE_CACHE.record(not_modified=len(body))
+        else:
+            response = Response(body, mimetype=entry["mimetype"])
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+                RESPONSE_CACHE.record(gzip_saved=len(entry["body"]) - len(body))
+        
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        # Browsers revalidate every poll and get a 304 while nothing changed
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+# Bulk export: rows are read with fetchmany and encoded one chunk at a time,
+# so memory stays flat however large the result is. CSV and NDJSON lines
+# are rendered by SQLite itself, which is several times faster than
+# building them from Python tuples. An export is a list of queries, one per
+# partition overlapping the time range: node-filtered exports run node by
+# node along each partition's (node_id, ts) index, full exports read each
+# partition in insertion order
+def parse_export_time(value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+def export_query(args):
+    fields = args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(EXPORT_FIELDS)
+    unknown = [f for f in fields if f not in EXPORT_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested")
+    
+    nodes = sorted({n.strip() for n in args.get('nodes', '').split(',') if n.strip()})
+    start = parse_export_time(args.get('start'))
+    end = parse_export_time(args.get('end'))
+    clauses = []
+    params = []
+    if start is not None:
+        start = reading_ts(start)
+        clauses.append('ts >= ?')
+        params.append(start)
+    if end is not None:
+        end = reading_ts(end)
+        clauses.append('ts < ?')
+        params.append(end)
+    
+    conn = db_connect()
+    try:
+        names = PARTITIONS.route(conn, start, end)
+    finally:
+        conn.close()
+    if not nodes:
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return fields, [(f"FROM {name} {where}", params) for name in names]
+    where = ' AND '.join(['node_id = ?'] + clauses)
+    return fields, [(f"FROM {name} WHERE {where} ORDER BY ts", [node] + params)
+                    for node in nodes for name in names]
+
+def export_column(field):
+    return "datetime(ts, 'unixepoch')" if field == 'timestamp' else field
+
+def export_chunks(columns, queries):
+    conn = db_connect()
+    try:
+        for query, params in queries:
+            try:
+                c = conn.execute(f"SELECT {columns} {query}", params)
+            except sqlite3.OperationalError as e:
+                # Dropped by retention since the export was routed
+                if 'no such table' in str(e):
+                    continue
+                raise
+            while True:
+                rows = c.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield rows
+    finally:
+        conn.close()
+
+def export_csv(fields, queries):
+    yield ','.join(fields) + '\n'
+    # %w doubles embedded quotes, which is CSV quoting for text columns
+    template = ','.join('"%w"' if f in ('node_id', 'status') else '%s' for f in fields)
+    line = f"printf('{template}', {', '.join(export_column(f) for f in fields)})"
+    for rows in export_chunks(line, queries):
+        yield '\n'.join([row[0] for row in rows]) + '\n'
+
+def export_ndjson(fields, queries):
+    pairs = ', '.join(f"'{f}', {export_column(f)}" for f in fields)
+    line = f"json_object({pairs})"
+    for rows in export_chunks(line, queries):
+        yield '\n'.join([row[0] for row in rows]) + '\n'
+
+ARROW_TYPES = {
+    'node_id': 'string',
+    'timestamp': 'string',
+    'tds': 'float64',
+    'ph': 'float64',
+    'humidity': 'float64',
+    'temp': 'float64',
+    'status': 'string'
+}
+
+class ArrowSink:
+    # Minimal file object the IPC writer flushes into between chunks
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def export_arrow(fields, queries):
+    pa = optional_module('pyarrow')
+    schema = pa.schema([(f, getattr(pa, ARROW_TYPES[f])()) for f in fields])
+    sink = ArrowSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    yield sink.drain()
+    for rows in export_chunks(', '.join(export_column(f) for f in fields), queries):
+        columns = [pa.array(column, type=schema.field(i).type) for i, column in enumerate(zip(*rows))]
+        writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'arrow': (export_arrow, 'application/vnd.apache.arrow.stream')
+}
+
+# Viewport queries for the map: nodes inside a bounding box are found
+# through the nodes_rtree index, and below NODE_CLUSTER_MAX_ZOOM they are
+# grouped on a grid of roughly NODE_CLUSTER_CELL_PX screen pixels, so the
+# response grows with what is on screen rather than with the fleet
+NODE_COLUMNS = '''n.node_id, n.latitude, n.longitude,
+       sd.tds, sd.ph, sd.humidity, sd.temp, sd.status, sd.timestamp'''
+
+CLUSTER_STATUSES = ('GOOD', 'WARNING', 'BAD')
+
+def parse_bbox(value):
+    # Leaflet's toBBoxString() order: west,south,east,north
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        raise ValueError("bbox must be west,south,east,north")
+    west, east = max(west, -180.0), min(east, 180.0)
+    south, north = max(south, -90.0), min(north, 90.0)
+    if west > east or south > north:
+        raise ValueError("bbox must be west,south,east,north")
+    return west, south, east, north
+
+def cluster_cell_size(zoom):
+    # Degrees spanned by NODE_CLUSTER_CELL_PX pixels of 256-pixel web tiles
+    return NODE_CLUSTER_CELL_PX * 360.0 / (256 * 2 ** zoom)
+
+def query_viewport(c, bbox, zoom=None):
+    west, south, east, north = bbox
+    params = dict(west=west, south=south, east=east, north=north)
+    where = '''
+    FROM nodes_rtree r
+    JOIN nodes n ON n.rowid = r.id
+    LEFT JOIN node_latest sd ON n.node_id = sd.node_id
+    WHERE r.max_lat >= :south AND r.min_lat <= :north
+      AND r.max_lon >= :west AND r.min_lon <= :east
+      AND n.latitude BETWEEN :south AND :north
+      AND n.longitude BETWEEN :west AND :east
+    '''
+    
+    if zoom is None or zoom >= NODE_CLUSTER_MAX_ZOOM:
+        c.execute(f'SELECT {NODE_COLUMNS} {where}', params)
+        return [], [dict(row) for row in c.fetchall()]
+    
+    # One row per grid cell; in single-node cells the bare node columns
+    # are that node's values
+    params['cell'] = cluster_cell_size(zoom)
+    counts = ', '.join(f"SUM(sd.status = '{s}') AS status_{s}" for s in CLUSTER_STATUSES)
+    c.execute(f'''
+    SELECT CAST((n.longitude + 180) / :cell AS INTEGER) AS cell_x,
+           CAST((n.latitude + 90) / :cell AS INTEGER) AS cell_y,
+           COUNT(*) AS count,
+           AVG(n.latitude) AS center_lat, AVG(n.longitude) AS center_lon,
+           MIN(n.latitude) AS min_lat, MAX(n.latitude) AS max_lat,
+           MIN(n.longitude) AS min_lon, MAX(n.longitude) AS max_lon,
+           {counts}, {NODE_COLUMNS}
+    {where}
+    GROUP BY cell_x, cell_y
+    ''', params)
+    
+    clusters, nodes = [], []
+    for row in c.fetchall():
+        if row['count'] == 1:
+            nodes.append({key: row[key] for key in (
+                'node_id', 'latitude', 'longitude', 'tds', 'ph',
+                'humidity', 'temp', 'status', 'timestamp')})
+            continue
+        statuses = {s: row[f'status_{s}'] or 0 for s in CLUSTER_STATUSES}
+        statuses['UNKNOWN'] = row['count'] - sum(statuses.values())
+        clusters.append({
+            "latitude": row['center_lat'],
+            "longitude": row['center_lon'],
+            "count": row['count'],
+            "bounds": [row['min_lon'], row['min_lat'], row['max_lon'], row['max_lat']],
+            "statuses": statuses
+        })
+    return clusters, nodes
+
+# Node details: the reading history is paged newest first by (ts, id), the
+# order of each partition's (node_id, ts) index, which holds the rowid id
+# as well. A page starts right after the cursor of the previous one, so
+# every page is one index seek however deep it is, unlike OFFSET. Summary
+# stats over the filtered range are computed in SQL, mostly from the
+# rollups, and sent only with the first page since later pages share them
+@lru_cache(maxsize=None)
+def json_encoder():
+    # orjson when installed, the standard library otherwise
+    orjson = optional_module('orjson')
+    if orjson is not None:
+        return orjson.dumps
+    return lambda value: json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+def json_response(value):
+    return Response(json_encoder()(value), mimetype='application/json')
+
+def parse_reading_page(args):
+    # Returns (start, end, statuses, fields, cursor, limit); raises ValueError
+    fields = args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(NODE_PAGE_FIELDS)
+    unknown = [f for f in fields if f not in NODE_PAGE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    statuses = [s.strip().upper() for s in args.get('status', '').split(',') if s.strip()]
+    start = parse_export_time(args.get('start'))
+    end = parse_export_time(args.get('end'))
+    start = reading_ts(start) if start is not None else None
+    end = reading_ts(end) if end is not None else None
+    cursor = args.get('cursor') or None  # cursor= on its own is the first page
+    if cursor:
+        try:
+            ts, row_id = cursor.split(':')
+            cursor = (int(ts), int(row_id))
+        except ValueError:
+            raise ValueError("cursor must be a next_cursor from a previous page")
+    limit = int(args.get('limit', NODE_PAGE_SIZE))
+    if not 0 < limit <= NODE_PAGE_MAX:
+        raise ValueError(f"limit must be between 1 and {NODE_PAGE_MAX}")
+    return start, end, statuses, fields, cursor, limit
+
+def reading_filters(node_id, start, end, statuses):
+    clauses, params = ['node_id = ?'], [node_id]
+    if start is not None:
+        clauses.append('ts >= ?')
+        params.append(start)
+    if end is not None:
+        clauses.append('ts < ?')
+        params.append(end)
+    if statuses:
+        clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    return clauses, params
+
+def node_reading_page(conn, node_id, start, end, statuses, fields, cursor, limit):
+    # Returns (readings, next cursor or None)
+    clauses, params = reading_filters(node_id, start, end, statuses)
+    if cursor is not None:
+        clauses.append('(ts, id) < (?, ?)')
+        params.extend(cursor)
+        end = cursor[0] + 1 if end is None else min(end, cursor[0] + 1)
+    names = ['id', 'timestamp'] + fields
+    columns = ', '.join(['ts', 'id', "datetime(ts, 'unixepoch')"] + fields)
+    
+    rows = []
+    for name in reversed(PARTITIONS.route(conn, start, end)):
+        rows.extend(conn.execute(f'''
+        SELECT {columns} FROM {name}
+        WHERE {' AND '.join(clauses)}
+        ORDER BY ts DESC, id DESC
+        LIMIT ?
+        ''', params + [limit + 1 - len(rows)]).fetchall())
+        if len(rows) > limit:
+            break
+    
+    # One row past the page tells whether there is a next one
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = f"{rows[-1][0]}:{rows[-1][1]}" if more else None
+    return [dict(zip(names, row[1:])) for row in rows], next_cursor
 
-def generate_dummy_data():
-    while DUMMY_DATA_ENABLED:
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        
-        c.execute("SELECT node_id FROM nodes")
-        nodes = c.fetchall()
-        
-        for node in nodes:
-            node_id = node[0]
-            tds = random.uniform(100, 500)
-            ph = random.uniform(6.0, 8.5)
-            humidity = random.uniform(30, 90)
-            temp = random.uniform(20, 35)            
-            status = random.choices(['GOOD', 'WARNING', 'BAD'], [0.7, 0.2, 0.1])[0]
-            
-            c.execute('''
-            INSERT INTO sensor_data (node_id, tds, ph, humidity, temp, status, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (node_id, tds, ph, humidity, temp, status, datetime.now()))
-        
-        conn.commit()
-        conn.close()
-        time.sleep(1)
-    print("Dummy data generation stopped")
+def rollup_spans(start, end, resolutions):
+    # Splits [start, end) into whole buckets, coarsest first, as
+    # (resolution, start, end); the sub-minute edges are left out
+    if start >= end or not resolutions:
+        return []
+    resolution = resolutions[0]
+    low, high = -(-start // resolution) * resolution, end // resolution * resolution
+    if low >= high:
+        return rollup_spans(start, end, resolutions[1:])
+    return ([(resolution, low, high)] + rollup_spans(start, low, resolutions[1:])
+            + rollup_spans(high, end, resolutions[1:]))
 
-def check_node_status():
-    while True:
-        conn = sqlite3.connect(DATABASE)
-        c = conn.cursor()
-        
-        c.execute('''
-        SELECT DISTINCT s.node_id 
-        FROM sensor_data s 
-        WHERE s.status IS NULL
-        ''')
-        
-        nodes_to_update = c.fetchall()
+def node_reading_summary(conn, node_id, start, end, statuses):
+    # Whole minute, hour and day buckets are read from sensor_rollup, the
+    # rest from the readings: the sub-minute edges of the range and rows
+    # the rollups have not folded yet. A status filter needs the readings
+    # throughout. Averages are sum / count, like the history endpoint's
+    partitions = PARTITIONS.list(conn)
+    summary = {"count": 0}
+    if not partitions:
+        return dict(summary, **{f: {"min": None, "max": None, "avg": None} for f in ROLLUP_FIELDS})
+    start = partitions[0][0] if start is None else max(start, partitions[0][0])
+    end = partitions[-1][1] if end is None else min(end, partitions[-1][1])
+    
+    raw_aggregates = ', '.join(f'MIN({f}), MAX({f}), TOTAL({f})' for f in ROLLUP_FIELDS)
+    rollup_aggregates = ', '.join(f'MIN({f}_min), MAX({f}_max), TOTAL({f}_sum)' for f in ROLLUP_FIELDS)
+    parts = []
+    conn.execute('BEGIN')  # one snapshot of the rollups and how far they got
+    try:
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'sensor_rollup'").fetchone()
+        folded = row[0] if row else 0
+        spans = rollup_spans(start, end, ROLLUP_RESOLUTIONS[::-1]) if folded and not statuses else []
+        for resolution, low, high in spans:
+            parts.append(conn.execute(f'''
+            SELECT TOTAL(count), {rollup_aggregates} FROM sensor_rollup
+            WHERE resolution = ? AND node_id = ? AND bucket >= ? AND bucket < ?
+            ''', (resolution, node_id, low, high)).fetchone())
         
-        for node in nodes_to_update:
-            node_id = node[0]
-            
-            status = random.choices(['GOOD', 'WARNING', 'BAD'], [0.7, 0.2, 0.1])[0]
-            
-            c.execute('''
-            UPDATE sensor_data
-            SET status = ?
-            WHERE node_id = ? AND status IS NULL
-            ''', (status, node_id))
-            
-            if status == 'BAD':
-                send_email_notification(node_id, status)
-            
+        edges = [(start, end)]
+        if spans:
+            covered = (min(span[1] for span in spans), max(span[2] for span in spans))
+            edges = [(start, covered[0]), (covered[1], end)]
+        for name in PARTITIONS.route(conn, start, end):
+            for low, high in edges:
+                if low < high:
+                    clauses, params = reading_filters(node_id, low, high, statuses)
+                    parts.append(conn.execute(f'''
+                    SELECT COUNT(*), {raw_aggregates} FROM {name}
+                    WHERE {' AND '.join(clauses)}
+                    ''', params).fetchone())
+            if spans:
+                # New ids are a short rowid range; +node_id keeps the
+                # planner off the (node_id, ts) index
+                parts.append(conn.execute(f'''
+                SELECT COUNT(*), {raw_aggregates} FROM {name}
+                WHERE id > ? AND +node_id = ? AND ts >= ? AND ts < ?
+                ''', (folded, node_id) + covered).fetchone())
+    finally:
         conn.commit()
-        conn.close()
-        time.sleep(30)
+    
+    summary["count"] = count = int(sum(part[0] for part in parts))
+    for i, f in enumerate(ROLLUP_FIELDS):
+        lows = [part[1 + i * 3] for part in parts if part[1 + i * 3] is not None]
+        highs = [part[2 + i * 3] for part in parts if part[2 + i * 3] is not None]
+        summary[f] = {
+            "min": min(lows, default=None),
+            "max": max(highs, default=None),
+            "avg": sum(part[3 + i * 3] for part in parts) / count if count else None
+        }
+    return summary
 
 # API Routes
 @app.route('/api/nodes', methods=['GET'])
+@cached_response
 def get_nodes():
-    conn = sqlite3.connect(DATABASE)
+    bbox = request.args.get('bbox')
+    zoom = request.args.get('zoom')
+    try:
+        bbox = parse_bbox(bbox) if bbox else None
+        zoom = int(zoom) if zoom is not None else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    conn = db_connect()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
-    # Get all nodes with their most recent sensor data
-    c.execute('''
-    SELECT n.node_id, n.latitude, n.longitude, 
-           sd.tds, sd.ph, sd.humidity, sd.temp, sd.status, sd.timestamp
-    FROM nodes n
-    LEFT JOIN (
-        SELECT s.node_id, s.tds, s.ph, s.humidity, s.temp, s.status, s.timestamp,
-               MAX(s.timestamp) as latest_time
-        FROM sensor_data s
-        GROUP BY s.node_id
-    ) as sd ON n.node_id = sd.node_id
-    ''')
+    if bbox is None and zoom is None:
+        # Get all nodes with their most recent sensor data
+        c.execute(f'''
+        SELECT {NODE_COLUMNS}
+        FROM nodes n
+        LEFT JOIN node_latest sd ON n.node_id = sd.node_id
+        ''')
+        nodes = WRITE_BUFFER.overlay([dict(row) for row in c.fetchall()])
+        conn.close()
+        return jsonify(nodes)
     
-    nodes = [dict(row) for row in c.fetchall()]
+    clusters, nodes = query_viewport(c, bbox or (-180.0, -90.0, 180.0, 90.0), zoom)
     conn.close()
+    WRITE_BUFFER.overlay(nodes)
     
-    return jsonify(nodes)
+    if zoom is None:
+        return jsonify(nodes)
+    return jsonify({"zoom": zoom, "clusters": clusters, "nodes": nodes})
 
 @app.route('/api/nodes/<node_id>', methods=['GET'])
+@cached_response
 def get_node_details(node_id):
-    conn = sqlite3.connect(DATABASE)
+    try:
+        start, end, statuses, fields, cursor, limit = parse_reading_page(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    conn = db_connect()
     conn.row_factory = sqlite3.Row
-    c = conn.cursor()
     
     # Get node info
-    c.execute('SELECT * FROM nodes WHERE node_id = ?', (node_id,))
-    node = c.fetchone()
-    
+    node = conn.execute('SELECT * FROM nodes WHERE node_id = ?', (node_id,)).fetchone()
     if not node:
         conn.close()
         return jsonify({"error": "Node not found"}), 404
+    result = dict(node)
     
-    # Get recent sensor data
-    c.execute('''
-    SELECT * FROM sensor_data 
-    WHERE node_id = ? 
-    ORDER BY timestamp DESC 
-    LIMIT 100
-    ''', (node_id,))
+    conn.row_factory = None
+    try:
+        if cursor is None:
+            last_id = conn.execute("SELECT last_id FROM sensor_sequence WHERE name = 'sensor_data'").fetchone()[0]
+        sensor_data, next_cursor = node_reading_page(conn, node_id, start, end, statuses, fields, cursor, limit)
+        if cursor is None:
+            result['summary'] = node_reading_summary(conn, node_id, start, end, statuses)
+    finally:
+        conn.close()
     
-    sensor_data = [dict(row) for row in c.fetchall()]
+    # Readings still in the write buffer join the first page only, in
+    # (ts, id) order. They have no id yet, so they sort after the stored
+    # readings of the same second; a cursor ending on one carries the last
+    # id handed out before this page, and the ids they get when flushed
+    # are above it, so they are not paged again
+    if cursor is None:
+        low = (NAIVE_EPOCH + timedelta(seconds=start)).strftime('%Y-%m-%d %H:%M:%S') if start is not None else None
+        high = (NAIVE_EPOCH + timedelta(seconds=end)).strftime('%Y-%m-%d %H:%M:%S') if end is not None else None
+        pending = [
+            {key: reading[key] for key in ['id', 'timestamp'] + fields}
+            for reading in WRITE_BUFFER.pending_readings(node_id, None)
+            if (not statuses or reading['status'] in statuses)
+            and (low is None or reading['timestamp'] >= low)
+            and (high is None or reading['timestamp'] < high)
+        ]
+        if pending:
+            merged = sorted(pending + sensor_data, reverse=True,
+                            key=lambda reading: (reading['timestamp'], math.inf if reading['id'] is None else reading['id']))
+            sensor_data = merged[:limit]
+            if next_cursor is not None or len(merged) > limit:
+                last = sensor_data[-1]
+                ts = reading_ts(datetime.strptime(last['timestamp'], '%Y-%m-%d %H:%M:%S'))
+                next_cursor = f"{ts}:{last_id + 1 if last['id'] is None else last['id']}"
     
-    result = dict(node)
     result['sensor_data'] = sensor_data
+    result['next_cursor'] = next_cursor
+    return json_response(result)
+
+@app.route('/api/nodes/<node_id>/history', methods=['GET'])
+def get_node_history(node_id):
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 86400))
+        points = int(request.args.get('points', HISTORY_DEFAULT_POINTS))
+    except ValueError:
+        return jsonify({"error": "start, end and points must be numbers"}), 400
+    if end <= start or points <= 0:
+        return jsonify({"error": "Invalid time range or point budget"}), 400
+    
+    resolution = pick_resolution(start, end, points)
+    columns = ', '.join(
+        f'{f}_min, {f}_max, {f}_sum / count AS {f}_avg' for f in ROLLUP_FIELDS
+    )
+    
+    if NODE_REGISTRY.get(node_id) is None:
+        return jsonify({"error": "Node not found"}), 404
+    
+    conn = db_connect()
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
     
+    c.execute(f'''
+    SELECT datetime(bucket, 'unixepoch') AS timestamp, count, {columns}
+    FROM sensor_rollup
+    WHERE resolution = ? AND node_id = ? AND bucket >= ? AND bucket < ?
+    ORDER BY bucket
+    ''', (resolution, node_id,
+          rollup_epoch(start) // resolution * resolution, rollup_epoch(end)))
+    
+    history = [dict(row) for row in c.fetchall()]
     conn.close()
-    return jsonify(result)
+    
+    return jsonify({
+        "node_id": node_id,
+        "resolution": resolution,
+        "start": start,
+        "end": end,
+        "points": history
+    })
+
+@app.route('/api/export', methods=['GET'])
+def export_sensor_data():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if fmt == 'arrow' and optional_module('pyarrow') is None:
+        return jsonify({"error": "Arrow export needs pyarrow installed"}), 400
+    try:
+        fields, queries = export_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    encoder, mimetype = EXPORT_FORMATS[fmt]
+    return Response(encoder(fields, queries), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=sensor_data.{fmt}',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/api/dashboard', methods=['GET'])
+@cached_response
 def get_dashboard():
-    conn = sqlite3.connect(DATABASE)
+    conn = db_connect()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -337,23 +3168,68 @@ def get_dashboard():
     SELECT n.node_id, n.latitude, n.longitude, 
            sd.tds, sd.ph, sd.humidity, sd.temp, sd.status, sd.timestamp
     FROM nodes n
-    LEFT JOIN (
-        SELECT s.node_id, s.tds, s.ph, s.humidity, s.temp, s.status, s.timestamp,
-               MAX(s.timestamp) as latest_time
-        FROM sensor_data s
-        GROUP BY s.node_id
-    ) as sd ON n.node_id = sd.node_id
+    LEFT JOIN node_latest sd ON n.node_id = sd.node_id
     LIMIT 20
     ''')
     
-    dashboard_data = [dict(row) for row in c.fetchall()]
+    dashboard_data = WRITE_BUFFER.overlay([dict(row) for row in c.fetchall()])
     conn.close()
     
     return jsonify(dashboard_data)
 
+@app.route('/api/stream', methods=['GET'])
+def stream_updates():
+    # Optional scope: bbox (west,south,east,north) limits the deltas to
+    # nodes inside the map's viewport, plus any node listed in nodes (the
+    # dashboard cards). The dashboard reconnects with since= when the map
+    # moves, so payloads follow the viewport rather than the fleet
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    watched = set(n for n in request.args.get('nodes', '').split(',') if n)
+    
+    # Resume from the last delivered version after a reconnect
+    try:
+        version = int(request.headers.get('Last-Event-ID', request.args.get('since', EVENT_HUB.version)))
+    except ValueError:
+        version = EVENT_HUB.version
+    
+    def in_scope(updates):
+        inside = NODE_REGISTRY.within([u['node_id'] for u in updates if u['node_id'] not in watched], bbox)
+        return [u for u in updates if u['node_id'] in watched or u['node_id'] in inside]
+    keep = in_scope if bbox is not None else None
+    
+    if not EVENT_HUB.subscribe(STREAM_MAX_SUBSCRIBERS):
+        return jsonify({"error": "Too many stream subscribers"}), 503
+    
+    def events(version):
+        yield 'retry: 5000\n\n'
+        while True:
+            version, changes = EVENT_HUB.changes_since(version, STREAM_HEARTBEAT_INTERVAL, keep)
+            if changes:
+                yield f"id: {version}\nevent: nodes\ndata: {changes}\n\n"
+            else:
+                yield ': keepalive\n\n'
+            # Let bursts accumulate so each node is sent once per interval
+            time.sleep(STREAM_COALESCE_INTERVAL)
+    
+    # The slot is released when the server closes the response, whether or
+    # not the stream was ever iterated
+    response = Response(events(version), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(EVENT_HUB.unsubscribe)
+    return response
+
+@app.route('/api/stream/stats', methods=['GET'])
+def get_stream_stats():
+    return jsonify(EVENT_HUB.stats())
+
 @app.route('/api/email-recipients', methods=['GET'])
 def get_email_recipients():
-    conn = sqlite3.connect(DATABASE)
+    conn = db_connect()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -371,10 +3247,11 @@ def add_email_recipient():
     if not email:
         return jsonify({"error": "Email is required"}), 400
     
-    conn = sqlite3.connect(DATABASE)
+    conn = db_connect()
     c = conn.cursor()
     
     try:
+        begin_write(conn)
         c.execute('INSERT INTO email_recipients (email) VALUES (?)', (email,))
         conn.commit()
         new_id = c.lastrowid
@@ -390,8 +3267,9 @@ def add_email_recipient():
 
 @app.route('/api/email-recipients/<int:recipient_id>', methods=['DELETE'])
 def delete_email_recipient(recipient_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = db_connect()
     c = conn.cursor()
+    begin_write(conn)
     
     c.execute('SELECT id FROM email_recipients WHERE id = ?', (recipient_id,))
     if not c.fetchone():
@@ -406,20 +3284,34 @@ def delete_email_recipient(recipient_id):
 
 @app.route('/api/dummy-data/enable', methods=['POST'])
 def enable_dummy_data():
-    global DUMMY_DATA_ENABLED
-    DUMMY_DATA_ENABLED = True
+    # Optional load profile, e.g. {"nodes": 5000, "rate": 2000, "batch_size": 200,
+    # "workers": 4, "target": "webhook", "pattern": "burst"}
+    config = request.get_json(silent=True) or {}
+    if not isinstance(config, dict):
+        return jsonify({"error": "Load profile must be a JSON object"}), 400
+    if SETTINGS.get('dummy_data_enabled'):
+        return jsonify({"status": "Dummy data generation already running"})
     
-    # Start the dummy data thread if it's not already running
-    if not any(t.name == "dummy_data_thread" for t in threading.enumerate()):
-        t = threading.Thread(target=generate_dummy_data, name="dummy_data_thread", daemon=True)
-        t.start()
+    try:
+        LoadGenerator(**config)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     
+    # The leader process starts the generator when it sees the toggle
+    SETTINGS.set('dummy_data_config', config)
+    SETTINGS.set('dummy_data_enabled', True)
     return jsonify({"status": "Dummy data generation enabled"})
 
+@app.route('/api/dummy-data/stats', methods=['GET'])
+def get_dummy_data_stats():
+    stats = SETTINGS.get('dummy_data_stats')
+    if stats is None:
+        return jsonify({"running": False})
+    return jsonify(stats)
+
 @app.route('/api/dummy-data/disable', methods=['POST'])
 def disable_dummy_data():
-    global DUMMY_DATA_ENABLED
-    DUMMY_DATA_ENABLED = False
+    SETTINGS.set('dummy_data_enabled', False)
     return jsonify({"status": "Dummy data generation disabled"})
 
 @app.route('/')
@@ -434,95 +3326,1154 @@ def node_details():
 def email_settings():
     return render_template('email-settings.html')
 
-@app.route('/api/webhook/data', methods=['POST'])
-def webhook_data():
-    if not WEBHOOK_ENABLED:
-        return jsonify({"error": "Webhook is disabled"}), 403
-        
-    data = request.json
-    if not data:
-        return jsonify({"error": "No data provided"}), 400
-        
-    conn = sqlite3.connect(DATABASE)
+# Bulk ingest. Webhook bodies are parsed incrementally from the request
+# stream and committed every WEBHOOK_CHUNK_ROWS measurements, so a gateway
+# posting a large backlog never has the whole payload in memory
+class PayloadTooLarge(ValueError):
+    pass
+
+class JSONStreamReader:
+    # Decodes one JSON value at a time from a byte stream, keeping only the
+    # unread tail of the last chunk in memory. A value longer than
+    # max_value is refused rather than re-decoded after every chunk
+    def __init__(self, stream, max_bytes=None, read_size=None, max_value=None):
+        self.stream = stream
+        self.max_bytes = max_bytes or WEBHOOK_MAX_BODY
+        self.read_size = read_size or WEBHOOK_READ_SIZE
+        self.max_value = max_value or WEBHOOK_MAX_VALUE
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.bytes_read = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        data = self.stream.read(self.read_size)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise PayloadTooLarge(f"Payload exceeds {self.max_bytes} bytes")
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non-whitespace character, or '' at the end of the body
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at byte {self.bytes_read}, got {char or 'end of body'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buf, self.pos)
+                # A number cut off by the end of the buffer ("12" of "12.5")
+                # may continue in the next chunk
+                number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self.eof or (end < len(self.buf) and (not number or self.buf[end] not in '.eE0123456789')):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"Invalid JSON near byte {self.bytes_read - len(self.buf) + e.pos}: {e.msg}")
+            if len(self.buf) - self.pos > self.max_value:
+                raise PayloadTooLarge(f"JSON value at byte {self.bytes_read - len(self.buf) + self.pos} "
+                                      f"exceeds {self.max_value} bytes")
+            self.fill()
+
+def iter_node_measurements(reader):
+    # Reads one {"nodeId": ..., "data": [...]} object, streaming the data
+    # array so a node's backlog never sits in memory at once. An object
+    # without "data" is a single measurement
+    fields = {}
+    pending = []
+    has_data = False
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'data':
+            has_data = True
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    measurement = reader.value()
+                    # Measurements sent before the nodeId have to wait for it
+                    if 'nodeId' in fields:
+                        yield fields['nodeId'], measurement
+                    else:
+                        pending.append(measurement)
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            fields[key] = reader.value()
+        if reader.expect(',}') == '}':
+            break
+    
+    for measurement in pending:
+        yield fields.get('nodeId'), measurement
+    if not has_data:
+        yield fields.get('nodeId'), fields
+
+def iter_webhook_measurements(reader, ndjson=False):
+    # Yields (node_id, measurement) from a JSON array of node objects, or
+    # from NDJSON with one node object or measurement per line. Both are
+    # read one measurement at a time, however long a node's data array is
+    if ndjson:
+        while reader.peek():
+            if reader.peek() != '{':
+                raise ValueError(f"Expected a JSON object per line at byte {reader.bytes_read}")
+            yield from iter_node_measurements(reader)
+        return
+    
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.expect(']')
+    else:
+        while True:
+            yield from iter_node_measurements(reader)
+            if reader.expect(',]') == ']':
+                break
+    if reader.peek():
+        raise ValueError("Unexpected data after the payload")
+
+def reading_number(node_id, field, value):
+    # JSON numbers and numeric strings are stored as floats; anything else
+    # rejects the reading
+    number = None
+    kind = value.__class__
+    if kind is float or kind is int or (isinstance(value, (int, float, str)) and not isinstance(value, bool)):
+        try:
+            number = float(value)
+        except (ValueError, OverflowError):
+            pass
+    if number is not None and -math.inf < number < math.inf:
+        return number
+    raise ValueError(f"Invalid {field} {json.dumps(value)} in a reading for {node_id}")
+
+def measurement_row(node_id, measurement):
+    # Readings are checked and coerced while the body is parsed, so a bad
+    # one stops the payload before its chunk is handed to commit_rows.
+    # Finite floats, nulls and numeric timestamps, the usual case, skip
+    # the call
+    if node_id.__class__ is not str:
+        if isinstance(node_id, int) and not isinstance(node_id, bool):
+            node_id = str(node_id)
+        elif not isinstance(node_id, str):
+            raise ValueError(f"Invalid nodeId {json.dumps(node_id)}")
+    if not node_id:
+        raise ValueError(f"Invalid nodeId {json.dumps(node_id)}")
+    if not isinstance(measurement, dict):
+        raise ValueError(f"Expected a reading object for {node_id}")
+    row = [node_id]
+    for field in READING_FIELDS:
+        value = measurement.get(field)
+        if value is not None and (value.__class__ is not float or not -math.inf < value < math.inf):
+            value = reading_number(node_id, field, value)
+        row.append(value)
+    timestamp = measurement.get('timestamp')
+    if timestamp.__class__ is not int and timestamp.__class__ is not float:
+        if timestamp is None:
+            raise ValueError(f"Missing timestamp in a reading for {node_id}")
+        timestamp = reading_number(node_id, 'timestamp', timestamp)
+    taken_at = datetime.fromtimestamp(timestamp)
+    if not READING_TIME_RANGE[0] <= taken_at < READING_TIME_RANGE[1]:
+        raise ValueError(f"Timestamp {timestamp} out of range in a reading for {node_id}")
+    row.append(taken_at)
+    return tuple(row)
+
+def ingest_rows(conn, rows, status=PENDING_STATUS):
+    # status is either one value for every row or a list with one per row
+    statuses = status if isinstance(status, list) else [status] * len(rows)
     c = conn.cursor()
+    now = datetime.now()
+    
+    # Only nodes the registry does not know are inserted; existing nodes
+    # keep their coordinates. The caller hands `created` to
+    # NODE_REGISTRY.update() once the transaction has committed
+    node_ids = list(dict.fromkeys(row[0] for row in rows))
+    created = []
+    for node_id in NODE_REGISTRY.missing(node_ids):
+        latitude, longitude = 10.0 + random.random(), 106.0 + random.random()
+        c.execute('''
+        INSERT OR IGNORE INTO nodes (node_id, latitude, longitude, last_updated)
+        VALUES (?, ?, ?, ?)
+        ''', (node_id, latitude, longitude, now))
+        if c.rowcount:
+            created.append((node_id, latitude, longitude))
+    
+    # Ids are allocated up front and rows go to the partition covering
+    # their timestamp. The stored rows (id, node_id, tds, ph, humidity,
+    # temp, partition) are what the prediction pipeline consumes
+    first_id = allocate_ids(c, len(rows))
+    ts_values = [reading_ts(row[5]) for row in rows]
+    partitions = PARTITIONS.assign(c, ts_values)
+    groups = {}
+    stored = []
+    for i, (row, row_status, ts, name) in enumerate(zip(rows, statuses, ts_values, partitions)):
+        groups.setdefault(name, []).append((first_id + i,) + row[:5] + (row_status, ts))
+        stored.append((first_id + i,) + row[:5] + (name,))
+    for name, group in groups.items():
+        c.executemany(f'''
+        INSERT INTO {name}
+        (id, node_id, tds, ph, humidity, temp, status, ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', group)
     
+    stats = {"nodes": len(node_ids), "new_nodes": len(created), "measurements": len(rows)}
+    return stats, stored, created
+
+# Compact binary ingest for gateways on metered links. A body is the magic
+# bytes followed by one block per node:
+#   <H node id length> <node id, UTF-8> <I record count>
+#   record count x <i timestamp> <f tds> <f ph> <f humidity> <f temperature>
+# all little-endian, 20 bytes per reading instead of ~110 as JSON
+BINARY_MAGIC = b'WQB1'
+BINARY_NODE_HEADER = struct.Struct('<HI')
+BINARY_RECORD = struct.Struct('<i4f')
+
+class BinaryStreamReader:
+    def __init__(self, stream, max_bytes=None):
+        self.stream = stream
+        self.max_bytes = max_bytes or WEBHOOK_MAX_BODY
+        self.bytes_read = 0
+
+    def read(self, size):
+        # Returns fewer than size bytes only at the end of the body
+        parts = []
+        while size > 0:
+            data = self.stream.read(size)
+            if not data:
+                break
+            self.bytes_read += len(data)
+            if self.bytes_read > self.max_bytes:
+                raise PayloadTooLarge(f"Payload exceeds {self.max_bytes} bytes")
+            parts.append(data)
+            size -= len(data)
+        return b''.join(parts)
+
+def iter_binary_rows(reader):
+    # Records are unpacked straight from the read buffer, WEBHOOK_CHUNK_ROWS
+    # at a time, into sensor_data rows
+    if reader.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Body does not start with the binary ingest header")
+    while True:
+        header = reader.read(BINARY_NODE_HEADER.size)
+        if not header:
+            return
+        if len(header) < BINARY_NODE_HEADER.size:
+            raise ValueError(f"Truncated node header at byte {reader.bytes_read}")
+        name_length, count = BINARY_NODE_HEADER.unpack(header)
+        name = reader.read(name_length)
+        if len(name) < name_length:
+            raise ValueError(f"Truncated node id at byte {reader.bytes_read}")
+        node_id = name.decode('utf-8')
+        
+        while count:
+            wanted = min(count, WEBHOOK_CHUNK_ROWS)
+            data = memoryview(reader.read(wanted * BINARY_RECORD.size))
+            complete = len(data) // BINARY_RECORD.size
+            for timestamp, tds, ph, humidity, temperature in BINARY_RECORD.iter_unpack(data[:complete * BINARY_RECORD.size]):
+                yield (node_id, tds, ph, humidity, temperature, datetime.fromtimestamp(timestamp))
+            if complete < wanted:
+                raise ValueError(f"Truncated records for {node_id} at byte {reader.bytes_read}")
+            count -= wanted
+
+def check_rows(rows, status=PENDING_STATUS):
+    # Raises ValueError unless every row can be stored by ingest_rows:
+    # (node_id, tds, ph, humidity, temp, timestamp) with a non-empty string
+    # node_id, numbers or None for the values and a datetime in
+    # READING_TIME_RANGE, plus a status (or one per row) that is a string
+    # or None
+    statuses = status if isinstance(status, list) else [status]
+    if isinstance(status, list) and len(status) != len(rows):
+        raise ValueError(f"{len(status)} statuses for {len(rows)} readings")
+    for row_status in statuses:
+        if row_status is not None and not isinstance(row_status, str):
+            raise ValueError(f"Invalid status {row_status!r}")
+    low, high = READING_TIME_RANGE
+    plain = {float, int, type(None)}
+    for row in rows:
+        # Exact types first; subclasses and errors take the slower checks
+        if (len(row) == 6 and row[0].__class__ is str and row[0] and row[1].__class__ in plain
+                and row[2].__class__ in plain and row[3].__class__ in plain and row[4].__class__ in plain
+                and row[5].__class__ is datetime and low <= row[5] < high):
+            continue
+        if len(row) != 6:
+            raise ValueError(f"Expected 6 fields in a reading, got {len(row)}")
+        node_id, timestamp = row[0], row[5]
+        if not isinstance(node_id, str) or not node_id:
+            raise ValueError(f"Invalid node id {node_id!r}")
+        for value in row[1:5]:
+            if value is not None and not isinstance(value, (int, float)):
+                raise ValueError(f"Invalid value {value!r} in a reading for {node_id}")
+        if not isinstance(timestamp, datetime) or not low <= timestamp < high:
+            raise ValueError(f"Invalid timestamp {timestamp!r} in a reading for {node_id}")
+
+def write_batch(rows, status=PENDING_STATUS, updates=(), journal=None):
+    # One write transaction: status updates, the readings, and the journal
+    # position they cover as (name, seq). Returns (stats, node ids touched);
+    # the caller notifies readers, since the write buffer may still hold
+    # newer readings for some of those nodes
+    statuses = status if isinstance(status, list) else [status] * len(rows)
+    conn = db_connect()
     try:
-        for node in data:
-            node_id = node.get('nodeId')
-            node_data = node.get('data', [])
+        begin_write(conn)
+        if updates:
+            apply_status_updates(conn, updates)
+        if rows:
+            stats, stored, created = ingest_rows(conn, rows, statuses)
+        else:
+            stats, stored, created = {"nodes": 0, "new_nodes": 0, "measurements": 0}, [], []
+        if journal is not None:
+            conn.execute('''
+            INSERT INTO sensor_sequence (name, last_id) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+            ''', journal)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if created:
+        NODE_REGISTRY.update(added=created)
+    
+    # Hand the readings still waiting for a prediction to the pipeline;
+    # statuses are written back in the background
+    pending = [row for row, row_status in zip(stored, statuses) if row_status == PENDING_STATUS]
+    stats["queued"] = PREDICTION_PIPELINE.submit(pending) if pending else 0
+    return stats, dict.fromkeys([row[0] for row in rows] + [update[2] for update in updates])
+
+def apply_status_updates(conn, updates):
+    # updates are (partition, id, node_id, status, expected current
+    # status); rows in partitions dropped since are skipped
+    existing = {name for _, _, name in PARTITIONS.list(conn)}
+    partitions = {}
+    for name, row_id, _, status, expected in updates:
+        if name in existing:
+            partitions.setdefault(name, []).append((status, row_id, expected))
+    for name, group in partitions.items():
+        conn.executemany(f'''
+        UPDATE {name} SET status = ?
+        WHERE id = ? AND status IS ?
+        ''', group)
+
+# Write-behind buffer: ingest hands each chunk of readings to an in-memory
+# queue and returns. A single writer thread commits everything waiting in
+# one transaction (group commit) once WRITE_BUFFER_FLUSH_ROWS readings are
+# queued or the oldest has waited WRITE_BUFFER_FLUSH_INTERVAL; prediction
+# and status checker results ride along in the same transactions. Reads of
+# the latest values overlay the newest buffered reading per node. With
+# WRITE_JOURNAL on, every chunk is appended to a per-process journal
+# before it is accepted, and the last journal entry written is committed
+# with the readings, so a restart replays exactly what never reached the
+# database
+class WriteBufferFull(Exception):
+    pass
+
+class WriteBuffer:
+    def __init__(self, capacity, flush_rows, flush_interval, max_batch=50000, journal='off'):
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.journal_mode = journal
+        self.cond = threading.Condition()
+        self.start_lock = threading.Lock()
+        self.entries = deque()  # (seq, rows, status, queued_at); left in place until committed
+        self.updates = []  # (partition, id, node_id, status, expected)
+        self.updates_since = None
+        self.latest = {}  # node_id -> (seq, reading) of its newest buffered reading
+        self.depth = 0
+        self.seq = 0
+        self.writing = False
+        self.draining = 0
+        self.thread = None
+        self.journal = None
+        self.journal_path = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.updates_written = 0
+        self.full_waits = 0
+        self.rejected = 0
+        self.failures = 0
+        self.dropped = 0
+        self.recovered = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=1000)  # seconds per group commit
+        self.delays = deque(maxlen=1000)  # seconds from submit to commit, oldest reading of each flush
+        self.batch_rows = deque(maxlen=1000)
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    @property
+    def journal_key(self):
+        return 'journal:' + os.path.basename(self.journal_path)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.start_lock:
+            if self.thread is not None:
+                return
+            if self.journal_mode != 'off':
+                self.recover()
+                self.open_journal()
+            self.thread = threading.Thread(target=self.run, name="write_buffer", daemon=True)
+            self.thread.start()
+
+    def submit(self, rows, status=PENDING_STATUS):
+        # Returns stats shaped like write_batch's. Blocks while the buffer
+        # is full and raises WriteBufferFull after WRITE_BUFFER_SUBMIT_TIMEOUT;
+        # a chunk larger than the whole buffer is taken once it is empty.
+        # The caller has been answered by the time the chunk is committed,
+        # so rows that could not be stored raise ValueError here instead
+        rows = list(rows)  # callers may reuse their list
+        check_rows(rows, status)
+        self.start()
+        node_ids = list(dict.fromkeys(row[0] for row in rows))
+        missing = NODE_REGISTRY.missing(node_ids)
+        deadline = time.monotonic() + WRITE_BUFFER_SUBMIT_TIMEOUT
+        with self.cond:
+            if self.depth and self.depth + len(rows) > self.capacity:
+                self.full_waits += 1
+                while self.depth and self.depth + len(rows) > self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += len(rows)
+                        raise WriteBufferFull(f"Write buffer full ({self.depth} readings waiting to be written)")
+                    self.cond.wait(remaining)
+            self.seq += 1
+            if self.journal is not None:
+                self.append_journal(self.seq, rows, status)
+            new_nodes = sum(1 for node_id in missing if node_id not in self.latest)
+            self.entries.append((self.seq, rows, status, time.monotonic()))
+            self.depth += len(rows)
+            changed = self.track_latest(self.seq, rows, status)
+            self.cond.notify_all()
+        
+        bump_data_version()
+        EVENT_HUB.publish(changed)
+        return {"nodes": len(node_ids), "new_nodes": new_nodes, "measurements": len(rows),
+                "queued": 0, "buffered": len(rows)}
+
+    def submit_statuses(self, updates):
+        # Status updates are small and already bounded by their producers,
+        # so they never wait for room and are not journaled: a lost update
+        # leaves the row for the sweeper or the status checker to redo
+        self.start()
+        with self.cond:
+            if not self.updates:
+                self.updates_since = time.monotonic()
+            self.updates.extend(updates)
+            self.cond.notify_all()
+
+    def track_latest(self, seq, rows, status):
+        statuses = status if isinstance(status, list) else [status] * len(rows)
+        newest = {}
+        for row, row_status in zip(rows, statuses):
+            current = newest.get(row[0])
+            if current is None or row[5] >= current[0][5]:
+                newest[row[0]] = (row, row_status)
+        changed = []
+        for node_id, (row, row_status) in newest.items():
+            timestamp = row[5].strftime('%Y-%m-%d %H:%M:%S')
+            current = self.latest.get(node_id)
+            if current is not None and timestamp < current[1]["timestamp"]:
+                continue
+            reading = {"node_id": node_id, "tds": row[1], "ph": row[2], "humidity": row[3],
+                       "temp": row[4], "status": row_status, "timestamp": timestamp}
+            self.latest[node_id] = (seq, reading)
+            changed.append(reading)
+        return changed
+
+    def overlay(self, rows):
+        # rows are dicts from the nodes / node_latest join; a buffered
+        # reading at least as new as the stored one replaces its values
+        if not self.latest:
+            return rows
+        with self.cond:
+            latest = {row['node_id']: self.latest[row['node_id']][1] for row in rows if row['node_id'] in self.latest}
+        for row in rows:
+            reading = latest.get(row['node_id'])
+            if reading is not None and (row['timestamp'] is None or reading['timestamp'] >= row['timestamp']):
+                row.update(reading)
+        return rows
+
+    def pending_readings(self, node_id, limit):
+        # Newest first, shaped like READING_COLUMNS rows; id is assigned
+        # when the reading is written
+        if node_id not in self.latest:
+            return []
+        with self.cond:
+            entries = list(self.entries)
+        readings = []
+        for _, rows, status, _ in reversed(entries):
+            statuses = status if isinstance(status, list) else [status] * len(rows)
+            for row, row_status in zip(reversed(rows), reversed(statuses)):
+                if row[0] == node_id:
+                    readings.append({"id": None, "node_id": node_id, "tds": row[1], "ph": row[2],
+                                     "humidity": row[3], "temp": row[4], "status": row_status,
+                                     "timestamp": row[5].strftime('%Y-%m-%d %H:%M:%S')})
+        readings.sort(key=lambda reading: reading["timestamp"], reverse=True)
+        return readings[:limit]
+
+    def due(self):
+        if not self.entries and not self.updates:
+            return False
+        if self.draining or self.depth >= self.flush_rows or len(self.updates) >= self.flush_rows:
+            return True
+        return self.wait_time() <= 0
+
+    def wait_time(self):
+        # Seconds until the oldest waiting write is due, None when idle
+        queued = [at for at in (self.entries[0][3] if self.entries else None, self.updates_since) if at is not None]
+        if not queued:
+            return None
+        return min(queued) + self.flush_interval - time.monotonic()
+
+    def run(self):
+        backoff = 0
+        while True:
+            with self.cond:
+                while not self.due():
+                    self.cond.wait(self.wait_time())
+                entries, count = [], 0
+                for entry in self.entries:
+                    if entries and count + len(entry[1]) > self.max_batch:
+                        break
+                    entries.append(entry)
+                    count += len(entry[1])
+                updates, self.updates, self.updates_since = self.updates, [], None
+                self.writing = True
             
-            for measurement in node_data:
-                # Check if node exists
-                c.execute('SELECT node_id FROM nodes WHERE node_id = ?', (node_id,))
-                if not c.fetchone():
-                    # Add new node with random coordinates near Ho Chi Minh City
-                    lat = 10.0 + random.random()
-                    lon = 106.0 + random.random()
-                    c.execute('''
-                    INSERT INTO nodes (node_id, latitude, longitude, last_updated)
-                    VALUES (?, ?, ?, ?)
-                    ''', (node_id, lat, lon, datetime.now()))
-                
-                # Get water quality prediction
-                prediction = predict_water_quality(
-                    measurement.get('tds', 0),
-                    measurement.get('ph', 0),
-                    measurement.get('humidity', 0),
-                    measurement.get('temperature', 0)
-                )
-                
-                # Insert sensor data with prediction as status
-                c.execute('''
-                INSERT INTO sensor_data 
-                (node_id, tds, ph, humidity, temp, status, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    node_id,
-                    measurement.get('tds'),
-                    measurement.get('ph'),
-                    measurement.get('humidity'),
-                    measurement.get('temperature'),
-                    prediction,
-                    datetime.fromtimestamp(measurement.get('timestamp'))
-                ))
-                
-                # Send email notification if status is BAD and email is enabled
-                if prediction == 'BAD' and EMAIL_ENABLED:
-                    send_email_notification(node_id, prediction)
+            started = time.perf_counter()
+            try:
+                nodes = self.write(entries, updates)
+            except sqlite3.OperationalError as e:
+                # Locked, read-only or full database: keep everything and
+                # retry; submitters block once the buffer fills up
+                with self.cond:
+                    self.updates[:0] = updates
+                    self.updates_since = self.updates_since or time.monotonic()
+                    self.failures += 1
+                    self.last_error = str(e)
+                    self.writing = False
+                    self.cond.notify_all()
+                backoff = min(max(backoff * 2, 0.1), WRITE_BUFFER_RETRY_MAX)
+                print(f"Error flushing write buffer, retrying in {backoff:.1f}s: {e}")
+                time.sleep(backoff)
+                continue
+            except Exception as e:
+                print(f"Error flushing write buffer, writing entries one at a time: {e}")
+                with self.cond:
+                    self.failures += 1
+                    self.last_error = str(e)
+                nodes = self.isolate(entries, updates)
+            backoff = 0
+            elapsed = time.perf_counter() - started
+            METRICS.observe('iot_write_buffer_flush_duration_seconds', elapsed)
+            self.finish(entries, updates, nodes, elapsed)
+
+    def write(self, entries, updates):
+        rows, statuses = [], []
+        for _, entry_rows, status, _ in entries:
+            rows.extend(entry_rows)
+            statuses.extend(status if isinstance(status, list) else [status] * len(entry_rows))
+        journal = (self.journal_key, entries[-1][0]) if self.journal is not None and entries else None
+        return write_batch(rows, statuses, updates, journal)[1]
+
+    def isolate(self, entries, updates):
+        # Retries each entry in its own transaction so one bad chunk does
+        # not hold back the rest. submit() has checked every row, so an
+        # entry that still fails is dropped as a last resort
+        nodes = {}
+        for batch in [([], updates)] + [([entry], []) for entry in entries]:
+            if not batch[0] and not batch[1]:
+                continue
+            while True:
+                try:
+                    nodes.update(self.write(*batch))
+                except sqlite3.OperationalError as e:
+                    print(f"Error flushing write buffer, retrying: {e}")
+                    time.sleep(WRITE_BUFFER_RETRY_MAX)
+                    continue
+                except Exception as e:
+                    size = len(batch[0][0][1]) if batch[0] else len(batch[1])
+                    print(f"Dropping {size} buffered writes that cannot be stored: {e}")
+                    with self.cond:
+                        self.dropped += size
+                break
+        return nodes
+
+    def finish(self, entries, updates, nodes, elapsed):
+        count = sum(len(entry[1]) for entry in entries)
+        flushed = entries[-1][0] if entries else 0
+        with self.cond:
+            for _ in entries:
+                self.entries.popleft()
+            self.depth -= count
+            for node_id in [node_id for node_id, (seq, _) in self.latest.items() if seq <= flushed]:
+                del self.latest[node_id]
+            self.flushes += 1
+            self.rows_written += count
+            self.updates_written += len(updates)
+            self.latencies.append(elapsed)
+            self.batch_rows.append(count)
+            if entries:
+                self.delays.append(time.monotonic() - entries[0][3])
+            if self.journal is not None:
+                self.compact_journal()
+            self.cond.notify_all()
+            # Nodes with newer readings still buffered keep showing those
+            published = [node_id for node_id in nodes if node_id not in self.latest]
+        try:
+            bump_data_version()
+            publish_latest(published)
+        except Exception as e:
+            print(f"Error publishing flushed readings: {e}")
+        with self.cond:
+            self.writing = False
+            self.cond.notify_all()
+
+    def drain(self, timeout=None):
+        # Flushes everything buffered now; True once the buffer is empty
+        with self.cond:
+            if self.thread is None:
+                return not self.entries and not self.updates
+            self.draining += 1
+            self.cond.notify_all()
+            try:
+                return self.cond.wait_for(lambda: not self.entries and not self.updates and not self.writing, timeout)
+            finally:
+                self.draining -= 1
+
+    def close(self):
+        # atexit: a clean shutdown leaves nothing to replay
+        if self.thread is None or not self.drain(WRITE_BUFFER_SUBMIT_TIMEOUT):
+            return
+        if self.journal is not None:
+            with self.cond:
+                self.journal.close()
+                self.journal = None
+            os.unlink(self.journal_path)
+            self.forget_journal(self.journal_key)
+
+    def open_journal(self):
+        if fcntl is None:
+            print("Warning: the write journal needs flock, running without it")
+            return
+        path = f"{os.path.abspath(DATABASE)}-ingest-{os.getpid()}.log"
+        journal = open(path, 'ab')
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        journal.truncate(0)
+        self.journal, self.journal_path = journal, path
+        # A position left by an earlier process with the same pid would
+        # make recovery skip our first entries
+        self.forget_journal(self.journal_key)
+
+    def forget_journal(self, key):
+        conn = db_connect()
+        try:
+            begin_write(conn)
+            conn.execute('DELETE FROM sensor_sequence WHERE name = ?', (key,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def append_journal(self, seq, rows, status):
+        # One JSON line per chunk; timestamps as seconds since NAIVE_EPOCH
+        line = json.dumps({
+            "seq": seq,
+            "status": status,
+            "rows": [row[:5] + ((row[5] - NAIVE_EPOCH) / ONE_SECOND,) for row in rows]
+        }, separators=(',', ':'))
+        self.journal.write(line.encode('utf-8') + b'\n')
+        self.journal.flush()
+        if self.journal_mode == 'fsync':
+            os.fsync(self.journal.fileno())
+
+    def compact_journal(self):
+        # Called with the lock held after a flush
+        if not self.entries:
+            self.journal.seek(0)
+            self.journal.truncate()
+            return
+        if self.journal.tell() < WRITE_JOURNAL_MAX_BYTES:
+            return
+        # Rewrite the unflushed entries to a new file, locked before it
+        # replaces the old one so recovery never sees it unowned
+        journal = open(self.journal_path + '.tmp', 'wb')
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+        old, self.journal = self.journal, journal
+        for seq, rows, status, _ in self.entries:
+            self.append_journal(seq, rows, status)
+        os.fsync(journal.fileno())
+        os.replace(self.journal_path + '.tmp', self.journal_path)
+        old.close()
+
+    def recover(self):
+        # Replays journals left by processes that exited with readings
+        # still buffered; a journal whose lock can be taken has no owner.
+        # Entries at or below the position committed for it are already
+        # stored
+        if fcntl is None:
+            return
+        directory, prefix = os.path.split(f"{os.path.abspath(DATABASE)}-ingest-")
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith(prefix) or not name.endswith('.log'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                journal = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with journal:
+                try:
+                    fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if os.fstat(journal.fileno()).st_ino != os.stat(path).st_ino:
+                        continue  # replaced by its owner while we opened it
+                except (BlockingIOError, FileNotFoundError):
+                    continue
+                key = 'journal:' + name
+                rows = self.replay(journal, key)
+                os.unlink(path)
+            self.forget_journal(key)
+            if rows:
+                print(f"Recovered {rows} buffered readings from {name}")
+
+    def replay(self, journal, key):
+        conn = db_connect()
+        try:
+            row = conn.execute('SELECT last_id FROM sensor_sequence WHERE name = ?', (key,)).fetchone()
+        finally:
+            conn.close()
+        position = row[0] if row else 0
+        rows, statuses, seq, total = [], [], position, 0
         
-        conn.commit()
-        return jsonify({"message": "Data updated"})
+        def flush():
+            nonlocal total
+            nodes = write_batch(rows, statuses, (), (key, seq))[1]
+            notify_data_changed(nodes)
+            total += len(rows)
+            rows.clear()
+            statuses.clear()
         
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # torn write at the moment the process died
+            if entry["seq"] <= position:
+                continue
+            status = entry["status"]
+            chunk = [tuple(values[:5]) + (NAIVE_EPOCH + timedelta(seconds=values[5]),) for values in entry["rows"]]
+            rows.extend(chunk)
+            statuses.extend(status if isinstance(status, list) else [status] * len(chunk))
+            seq = entry["seq"]
+            if len(rows) >= self.max_batch:
+                flush()
+        if rows:
+            flush()
+        with self.cond:
+            self.recovered += total
+        return total
+
+    def stats(self):
+        latencies = list(self.latencies)
+        delays = list(self.delays)
+        batch_rows = list(self.batch_rows)
+        with self.cond:
+            oldest = self.entries[0][3] if self.entries else None
+            journal = None
+            if self.journal is not None:
+                journal = {"path": self.journal_path, "bytes": self.journal.tell()}
+            return {
+                "enabled": self.enabled,
+                "depth": self.depth,
+                "capacity": self.capacity,
+                "pending_status_updates": len(self.updates),
+                "oldest_pending_ms": None if oldest is None else round((time.monotonic() - oldest) * 1000, 3),
+                "flush_rows": self.flush_rows,
+                "flush_interval_seconds": self.flush_interval,
+                "flushes": self.flushes,
+                "rows_written": self.rows_written,
+                "status_updates_written": self.updates_written,
+                "rows_per_commit_avg": round(sum(batch_rows) / len(batch_rows), 1) if batch_rows else None,
+                "rows_per_commit_max": max(batch_rows, default=None),
+                "flush_latency_p50_ms": None if not latencies else round(percentile(latencies, 50) * 1000, 3),
+                "flush_latency_p99_ms": None if not latencies else round(percentile(latencies, 99) * 1000, 3),
+                "write_delay_p99_ms": None if not delays else round(percentile(delays, 99) * 1000, 3),
+                "full_waits": self.full_waits,
+                "rejected": self.rejected,
+                "failures": self.failures,
+                "dropped": self.dropped,
+                "last_error": self.last_error,
+                "journal_mode": self.journal_mode,
+                "journal": journal,
+                "recovered": self.recovered
+            }
+
+WRITE_BUFFER = WriteBuffer(
+    WRITE_BUFFER_SIZE,
+    WRITE_BUFFER_FLUSH_ROWS,
+    WRITE_BUFFER_FLUSH_INTERVAL,
+    max_batch=WRITE_BUFFER_MAX_BATCH,
+    journal=WRITE_JOURNAL
+)
+atexit.register(WRITE_BUFFER.close)
+
+def commit_rows(rows, status=PENDING_STATUS):
+    # Hands a chunk of readings to the write buffer, or commits it right
+    # away when the buffer is disabled
+    if WRITE_BUFFER.enabled:
+        stats = WRITE_BUFFER.submit(rows, status)
+    else:
+        stats, nodes = write_batch(rows, status)
+        stats["buffered"] = 0
+        notify_data_changed(nodes)
+    stats["anomalies"] = len(detect_anomalies(rows))
+    return stats
+
+def store_statuses(updates):
+    # updates are (partition, id, node_id, status, expected current status)
+    if WRITE_BUFFER.enabled:
+        WRITE_BUFFER.submit_statuses(updates)
+    else:
+        notify_data_changed(write_batch([], updates=updates)[1])
+
+def ingest_stream(source, chunk_size=None):
+    # Stores an iterable of sensor_data rows. Returns (stats, error). A malformed or oversized body stops the
+    # stream; everything parsed before that point is still stored (or
+    # buffered) and reported per node, so the sender can resume after
+    # last_timestamp. Storage errors are raised
+    chunk_size = chunk_size or WEBHOOK_CHUNK_ROWS
+    started = time.perf_counter()
+    write_seconds = 0.0
+    stats = {"nodes": 0, "new_nodes": 0, "measurements": 0, "queued": 0, "buffered": 0, "anomalies": 0, "chunks": 0}
+    progress = {}
+    error = None
+    rows = []
+    
+    def flush():
+        # The chunk leaves `rows` before it is stored, so a failed commit
+        # can never be handed over a second time
+        nonlocal rows, write_seconds
+        chunk_rows, rows = rows, []
+        chunk_started = time.perf_counter()
+        chunk = commit_rows(chunk_rows)
+        write_seconds += time.perf_counter() - chunk_started
+        for key in ("new_nodes", "measurements", "queued", "buffered", "anomalies"):
+            stats[key] += chunk[key]
+        stats["chunks"] += 1
+        for row in chunk_rows:
+            node = progress.setdefault(row[0], {"measurements": 0, "last_timestamp": None})
+            node["measurements"] += 1
+            node["last_timestamp"] = row[5].timestamp()
+    
+    # Only parsing errors end the stream with an error; anything raised
+    # while storing reaches the caller unchanged
+    source = iter(source)
+    while True:
+        try:
+            row = next(source)
+        except StopIteration:
+            break
+        except (ValueError, TypeError, AttributeError, OverflowError, OSError) as e:
+            error = e
+            break
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            flush()
+    if rows:
+        flush()
+    
+    stats["nodes"] = len(progress)
+    stats["progress"] = progress
+    total = time.perf_counter() - started
+    stats["timings"] = {
+        "parse_ms": round((total - write_seconds) * 1000, 3),
+        "write_ms": round(write_seconds * 1000, 3),
+        "total_ms": round(total * 1000, 3)
+    }
+    return stats, error
+
+def ingest_payload(data):
+    stats, error = ingest_stream(
+        measurement_row(node.get('nodeId'), measurement) for node in data for measurement in node.get('data', [])
+    )
+    if error is not None:
+        raise error
+    return stats
+
+@app.route('/api/webhook/data', methods=['POST'])
+def webhook_data():
+    if not SETTINGS.get('webhook_enabled'):
+        return jsonify({"error": "Webhook is disabled"}), 403
+    if request.content_length is not None and request.content_length > WEBHOOK_MAX_BODY:
+        return jsonify({"error": f"Payload exceeds {WEBHOOK_MAX_BODY} bytes"}), 413
+    
+    # JSON arrays and NDJSON (one node object or measurement per line)
+    # are both parsed straight from the request stream
+    reader = JSONStreamReader(request.stream)
+    ndjson = request.mimetype in ('application/x-ndjson', 'application/jsonl')
+    try:
+        stats, error = ingest_stream(
+            measurement_row(node_id, measurement) for node_id, measurement in iter_webhook_measurements(reader, ndjson)
+        )
+    except WriteBufferFull as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(int(WRITE_BUFFER.flush_interval) + 1)}
     except Exception as e:
-        conn.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        conn.close()
+    
+    if not stats["measurements"] and (error is None or not reader.bytes_read):
+        return jsonify({"error": "No data provided"}), 400
+    if error is not None:
+        code = 413 if isinstance(error, PayloadTooLarge) else 400
+        return jsonify(dict(error=str(error), **stats)), code
+    return jsonify(dict(message="Data updated", **stats))
+
+@app.route('/api/webhook/binary', methods=['POST'])
+def webhook_binary():
+    if not SETTINGS.get('webhook_enabled'):
+        return jsonify({"error": "Webhook is disabled"}), 403
+    if request.content_length is not None and request.content_length > WEBHOOK_MAX_BODY:
+        return jsonify({"error": f"Payload exceeds {WEBHOOK_MAX_BODY} bytes"}), 413
+    
+    reader = BinaryStreamReader(request.stream)
+    try:
+        stats, error = ingest_stream(iter_binary_rows(reader))
+    except WriteBufferFull as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(int(WRITE_BUFFER.flush_interval) + 1)}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    if not stats["measurements"] and (error is None or not reader.bytes_read):
+        return jsonify({"error": "No data provided"}), 400
+    if error is not None:
+        code = 413 if isinstance(error, PayloadTooLarge) else 400
+        return jsonify(dict(error=str(error), **stats)), code
+    return jsonify(dict(message="Data updated", **stats))
 
 @app.route('/api/webhook/toggle', methods=['POST'])
 def toggle_webhook():
-    global WEBHOOK_ENABLED
     data = request.json
     if 'enabled' in data:
-        WEBHOOK_ENABLED = data['enabled']
-        return jsonify({"webhook_enabled": WEBHOOK_ENABLED})
+        SETTINGS.set('webhook_enabled', data['enabled'])
+        return jsonify({"webhook_enabled": SETTINGS.get('webhook_enabled')})
     return jsonify({"error": "Missing enabled parameter"}), 400
 
 @app.route('/api/email/toggle', methods=['POST'])
 def toggle_email():
-    global EMAIL_ENABLED
     data = request.json
     if 'enabled' in data:
-        EMAIL_ENABLED = data['enabled']
-        return jsonify({"email_enabled": EMAIL_ENABLED})
+        SETTINGS.set('email_enabled', data['enabled'])
+        return jsonify({"email_enabled": SETTINGS.get('email_enabled')})
     return jsonify({"error": "Missing enabled parameter"}), 400
 
+@app.route('/api/predictions/stats', methods=['GET'])
+def get_prediction_stats():
+    stats = PREDICTION_PIPELINE.stats()
+    stats["predictor"] = PREDICTOR
+    stats["cache"] = PREDICTION_CACHE.stats()
+    stats["remote"] = REMOTE_PREDICTOR.stats()
+    return jsonify(stats)
+
+@app.route('/api/anomalies', methods=['GET'])
+def get_anomalies():
+    try:
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(ANOMALY_DETECTOR.recent_anomalies(request.args.get('node'), limit))
+
+@app.route('/api/anomalies/stats', methods=['GET'])
+def get_anomaly_stats():
+    return jsonify(ANOMALY_DETECTOR.stats())
+
+@app.route('/api/db/stats', methods=['GET'])
+def get_db_stats():
+    with DB_STATS_LOCK:
+        stats = dict(DB_STATS)
+    stats["pool"] = get_pool().stats()
+    stats["node_registry"] = NODE_REGISTRY.stats()
+    stats["write_buffer"] = WRITE_BUFFER.stats()
+    conn = db_connect()
+    try:
+        stats["partitions"] = PARTITIONS.stats(conn)
+    finally:
+        conn.close()
+    return jsonify(stats)
+
+def stats_metrics():
+    # Counters and gauges already tracked by the stats endpoints
+    with DB_STATS_LOCK:
+        db = dict(DB_STATS)
+    pool = get_pool().stats()
+    predictions = PREDICTION_PIPELINE.stats()
+    cache = PREDICTION_CACHE.stats()
+    alerts = ALERT_DISPATCHER.stats()
+    stream = EVENT_HUB.stats()
+    registry = NODE_REGISTRY.stats()
+    anomalies = ANOMALY_DETECTOR.stats()
+    remote = REMOTE_PREDICTOR.stats()
+    buffer = WRITE_BUFFER.stats()
+    conn = db_connect()
+    try:
+        partitions = PARTITIONS.stats(conn)
+    finally:
+        conn.close()
+    return [
+        ('iot_db_write_transactions_total', 'counter', 'Write transactions started', db['write_transactions']),
+        ('iot_db_lock_wait_seconds_total', 'counter', 'Time spent waiting for the write lock', db['lock_wait_seconds']),
+        ('iot_db_busy_retries_total', 'counter', 'BEGIN IMMEDIATE retries after SQLITE_BUSY', db['busy_retries']),
+        ('iot_db_busy_errors_total', 'counter', 'Write transactions that gave up on SQLITE_BUSY', db['busy_errors']),
+        ('iot_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection', db['pool_wait_seconds']),
+        ('iot_db_pool_open_connections', 'gauge', 'Open pooled connections', pool['open']),
+        ('iot_db_pool_idle_connections', 'gauge', 'Idle pooled connections', pool['idle']),
+        ('iot_prediction_queue_depth', 'gauge', 'Readings waiting for a prediction', predictions['queue_depth']),
+        ('iot_prediction_in_flight', 'gauge', 'Readings being classified', predictions['in_flight']),
+        ('iot_prediction_completed_total', 'counter', 'Readings classified', predictions['completed']),
+        ('iot_prediction_failed_total', 'counter', 'Readings whose prediction failed', predictions['failed']),
+        ('iot_prediction_cache_hits_total', 'counter', 'Prediction cache hits', cache['hits']),
+        ('iot_prediction_cache_misses_total', 'counter', 'Prediction cache misses', cache['misses']),
+        ('iot_remote_predictor_fallbacks_total', 'counter', 'Predictions served by the threshold fallback', remote['fallbacks']),
+        ('iot_remote_predictor_circuit_open', 'gauge', 'Whether calls to the remote model are suspended', int(remote['circuit'] != 'closed')),
+        ('iot_alert_queue_depth', 'gauge', 'Alerts waiting to be sent', alerts['queue_depth']),
+        ('iot_alert_api_calls_total', 'counter', 'Mailgun API calls', alerts['api_calls']),
+        ('iot_alert_failures_total', 'counter', 'Alerts that could not be sent', alerts['failures']),
+        ('iot_stream_subscribers', 'gauge', 'Open dashboard streams', stream['subscribers']),
+        ('iot_stream_refused_total', 'counter', 'Streams refused because every slot was in use', stream['refused']),
+        ('iot_node_registry_size', 'gauge', 'Nodes held in the in-process registry', registry['size']),
+        ('iot_node_registry_lookups_total', 'counter', 'Node lookups answered by the registry', registry['lookups']),
+        ('iot_node_registry_reloads_total', 'counter', 'Registry reloads from the nodes table', registry['reloads']),
+        ('iot_write_buffer_depth', 'gauge', 'Readings waiting in the write buffer', buffer['depth']),
+        ('iot_write_buffer_flushes_total', 'counter', 'Group commits by the write buffer', buffer['flushes']),
+        ('iot_write_buffer_rows_written_total', 'counter', 'Readings written by the write buffer', buffer['rows_written']),
+        ('iot_write_buffer_rejected_total', 'counter', 'Readings refused because the write buffer stayed full', buffer['rejected']),
+        ('iot_write_buffer_dropped_total', 'counter', 'Buffered writes dropped because they could not be stored', buffer['dropped']),
+        ('iot_sensor_partitions', 'gauge', 'sensor_data partitions on disk', len(partitions['partitions'])),
+        ('iot_partitions_scanned_total', 'counter', 'Partitions read by routed queries', partitions['partitions_scanned']),
+        ('iot_partitions_pruned_total', 'counter', 'Partitions skipped by routed queries', partitions['partitions_pruned']),
+        ('iot_anomaly_readings_total', 'counter', 'Readings scored by the anomaly detector', anomalies['readings']),
+        ('iot_anomaly_nodes_tracked', 'gauge', 'Nodes with anomaly detector state', anomalies['nodes_tracked']),
+        ('iot_anomalies_total', 'counter', 'Anomalies flagged', sum(anomalies['anomalies'].values())),
+        ('iot_data_version', 'gauge', 'Data version used by the response cache', data_version())
+    ]
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    lines = []
+    for name, kind, description, value in stats_metrics():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    lines.extend(METRICS.render())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/write-buffer/stats', methods=['GET'])
+def get_write_buffer_stats():
+    return jsonify(WRITE_BUFFER.stats())
+
+@app.route('/api/db/slow-queries', methods=['GET'])
+def get_slow_queries():
+    return jsonify({"threshold_ms": SLOW_QUERY_MS or None, "queries": list(SLOW_QUERIES)})
+
+@app.route('/api/profiler/toggle', methods=['POST'])
+def toggle_profiler():
+    data = request.get_json(silent=True) or {}
+    if 'enabled' not in data:
+        return jsonify({"error": "Missing enabled parameter"}), 400
+    if data['enabled']:
+        try:
+            interval = float(data['interval']) if 'interval' in data else None
+            duration = float(data['duration']) if 'duration' in data else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "interval and duration must be numbers"}), 400
+        PROFILER.start(interval, duration)
+    else:
+        PROFILER.stop()
+    return jsonify(PROFILER.stats())
+
+@app.route('/api/profiler', methods=['GET'])
+def get_profile():
+    # Folded stacks, most sampled first: "frame;frame;frame count"
+    limit = request.args.get('limit', type=int)
+    return Response(PROFILER.folded(limit), mimetype='text/plain')
+
+@app.route('/api/profiler/stats', methods=['GET'])
+def get_profiler_stats():
+    return jsonify(PROFILER.stats())
+
+@app.route('/api/status-check/stats', methods=['GET'])
+def get_status_check_stats():
+    stats = dict(STATUS_CHECK_STATS)
+    stats["history"] = list(STATUS_CHECK_STATS["history"])
+    return jsonify(stats)
+
+@app.route('/api/alerts/stats', methods=['GET'])
+def get_alert_stats():
+    return jsonify(ALERT_DISPATCHER.stats())
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(RESPONSE_CACHE.stats())
+
+@app.route('/api/retention/status', methods=['GET'])
+def get_retention_status():
+    conn = db_connect()
+    auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    conn.close()
+    
+    status = dict(RETENTION_STATUS)
+    status["history"] = list(RETENTION_STATUS["history"])
+    status["config"] = {
+        "raw_days": RETENTION_RAW_DAYS,
+        "rollup_days": {str(resolution): days for resolution, days in ROLLUP_RETENTION_DAYS.items()},
+        "interval_seconds": RETENTION_INTERVAL,
+        "incremental_vacuum": auto_vacuum == 2
+    }
+    return jsonify(status)
+
+@app.route('/api/retention/run', methods=['POST'])
+def trigger_retention():
+    try:
+        return jsonify(run_retention())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/settings/status', methods=['GET'])
 def get_settings_status():
     return jsonify({
-        "webhook_enabled": WEBHOOK_ENABLED,
-        "email_enabled": EMAIL_ENABLED,
-        "dummy_data_enabled": DUMMY_DATA_ENABLED
+        "webhook_enabled": SETTINGS.get('webhook_enabled'),
+        "email_enabled": SETTINGS.get('email_enabled'),
+        "dummy_data_enabled": SETTINGS.get('dummy_data_enabled'),
+        "pid": os.getpid(),
+        "leader": LEADER["is_leader"],
+        "leader_since": LEADER["since"]
     })
 
 @app.route('/api/nodes/<node_id>', methods=['PUT'])
@@ -530,24 +4481,30 @@ def update_node(node_id):
     data = request.json
     if not data:
         return jsonify({"error": "No data provided"}), 400
+    
+    # Check if node exists
+    if NODE_REGISTRY.get(node_id) is None:
+        return jsonify({"error": "Node not found"}), 404
         
-    conn = sqlite3.connect(DATABASE)
+    conn = db_connect()
     c = conn.cursor()
     
     try:
-        # Check if node exists
-        c.execute('SELECT node_id FROM nodes WHERE node_id = ?', (node_id,))
-        if not c.fetchone():
-            return jsonify({"error": "Node not found"}), 404
+        begin_write(conn)
             
-        # Update node information
+        # Update node information; no row means another worker deleted it
         c.execute('''
         UPDATE nodes 
         SET latitude = ?, longitude = ?, last_updated = ?
         WHERE node_id = ?
         ''', (data.get('latitude'), data.get('longitude'), datetime.now(), node_id))
+        if not c.rowcount:
+            conn.rollback()
+            return jsonify({"error": "Node not found"}), 404
         
         conn.commit()
+        NODE_REGISTRY.update(added=[(node_id, data.get('latitude'), data.get('longitude'))])
+        bump_data_version()
         return jsonify({"message": "Node updated successfully"})
         
     except Exception as e:
@@ -561,30 +4518,37 @@ def create_node():
     data = request.json
     if not data or 'node_id' not in data:
         return jsonify({"error": "Node ID is required"}), 400
+    
+    # Check if node already exists
+    if NODE_REGISTRY.get(data['node_id']) is not None:
+        return jsonify({"error": "Node ID already exists"}), 409
         
-    conn = sqlite3.connect(DATABASE)
+    conn = db_connect()
     c = conn.cursor()
     
     try:
-        # Check if node already exists
-        c.execute('SELECT node_id FROM nodes WHERE node_id = ?', (data['node_id'],))
-        if c.fetchone():
-            return jsonify({"error": "Node ID already exists"}), 409
+        begin_write(conn)
             
         # Create new node
+        node = (
+            data['node_id'],
+            data.get('latitude', 10.0 + random.random()),  # Default to random location near HCMC
+            data.get('longitude', 106.0 + random.random())
+        )
         c.execute('''
         INSERT INTO nodes (node_id, latitude, longitude, last_updated)
         VALUES (?, ?, ?, ?)
-        ''', (
-            data['node_id'],
-            data.get('latitude', 10.0 + random.random()),  # Default to random location near HCMC
-            data.get('longitude', 106.0 + random.random()),
-            datetime.now()
-        ))
+        ''', node + (datetime.now(),))
         
         conn.commit()
+        NODE_REGISTRY.update(added=[node])
+        bump_data_version()
         return jsonify({"message": "Node created successfully"}), 201
         
+    except sqlite3.IntegrityError:
+        # Created by another worker since the registry last synced
+        conn.rollback()
+        return jsonify({"error": "Node ID already exists"}), 409
     except Exception as e:
         conn.rollback()
         return jsonify({"error": str(e)}), 500
@@ -593,20 +4557,32 @@ def create_node():
 
 @app.route('/api/nodes/<node_id>', methods=['DELETE'])
 def delete_node(node_id):
-    conn = sqlite3.connect(DATABASE)
+    # Check if node exists
+    if NODE_REGISTRY.get(node_id) is None:
+        return jsonify({"error": "Node not found"}), 404
+    
+    # Buffered readings for the node would otherwise be written after the
+    # delete and bring it back
+    WRITE_BUFFER.drain(WRITE_BUFFER_SUBMIT_TIMEOUT)
+    conn = db_connect()
     c = conn.cursor()
     
     try:
-        # Check if node exists
-        c.execute('SELECT node_id FROM nodes WHERE node_id = ?', (node_id,))
-        if not c.fetchone():
-            return jsonify({"error": "Node not found"}), 404
+        begin_write(conn)
             
         # Delete node and its sensor data
-        c.execute('DELETE FROM sensor_data WHERE node_id = ?', (node_id,))
         c.execute('DELETE FROM nodes WHERE node_id = ?', (node_id,))
+        if not c.rowcount:
+            conn.rollback()
+            return jsonify({"error": "Node not found"}), 404
+        for name in PARTITIONS.route(conn):
+            c.execute(f'DELETE FROM {name} WHERE node_id = ?', (node_id,))
+        c.execute('DELETE FROM node_latest WHERE node_id = ?', (node_id,))
+        c.execute('DELETE FROM sensor_rollup WHERE node_id = ?', (node_id,))
         
         conn.commit()
+        NODE_REGISTRY.update(removed=[node_id])
+        bump_data_version()
         return jsonify({"message": "Node deleted successfully"})
         
     except Exception as e:
@@ -619,8 +4595,148 @@ def delete_node(node_id):
 def node_management():
     return render_template('node-management.html')
 
+# Serving. Every worker process runs the request-side services (prediction
+# workers, alert dispatcher, stream relay); jobs that scan or rewrite the
+# shared database run only in the process holding the leader lock, an
+# flock on a file next to the database. The kernel drops the lock when
+# its holder exits, and a standby worker takes over within
+# LEADER_RETRY_INTERVAL
+@contextmanager
+def process_lock(path, blocking=True):
+    if fcntl is None:
+        yield True  # no flock on this platform: assume a single process
+        return
+    with open(path, 'a+') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+LEADER = {"is_leader": False, "since": None}
+SERVICES_STARTED = False
+SERVICES_LOCK = threading.Lock()
+
+def node_latest_since(watermark):
+    # node_latest rows whose version is at least watermark, read through
+    # the version index, and the highest version among them. A status-only
+    # commit can reuse the last version, so rows at the watermark are read
+    # again; publish_changed drops the ones already sent. With no
+    # watermark, only the current highest version is returned
+    conn = db_connect()
+    try:
+        if watermark is None:
+            return [], conn.execute('SELECT COALESCE(MAX(version), 0) FROM node_latest').fetchone()[0]
+        rows = conn.execute('''
+        SELECT node_id, tds, ph, humidity, temp, status, timestamp, version FROM node_latest
+        WHERE version >= ?
+        ''', (watermark,)).fetchall()
+    finally:
+        conn.close()
+    columns = ('node_id', 'tds', 'ph', 'humidity', 'temp', 'status', 'timestamp')
+    return [dict(zip(columns, row[:7])) for row in rows], max((row[7] for row in rows), default=watermark)
+
+def stream_relay():
+    # A worker's stream only sees its own publishes; when the shared data
+    # version moves, push the node_latest rows that changed elsewhere since
+    # the last look, instead of the whole table
+    seen = data_version()
+    watermark = None
+    while True:
+        try:
+            if watermark is None:
+                watermark = node_latest_since(None)[1]
+        except Exception as e:
+            print(f"Error relaying stream updates: {e}")
+        time.sleep(STREAM_RELAY_INTERVAL)
+        version = data_version()
+        if version == seen or watermark is None:
+            continue
+        seen = version
+        if not EVENT_HUB.stats()["subscribers"]:
+            continue
+        try:
+            rows, watermark = node_latest_since(watermark)
+            EVENT_HUB.publish_changed(rows)
+        except Exception as e:
+            print(f"Error relaying stream updates: {e}")
+
+def dummy_data_watcher():
+    # Leader only: follows the shared dummy data toggle and publishes the
+    # generator's stats so any worker can serve /api/dummy-data/stats
+    while True:
+        try:
+            running = any(t.name == "dummy_data_thread" for t in threading.enumerate())
+            if SETTINGS.get('dummy_data_enabled') and not running:
+                t = threading.Thread(target=generate_dummy_data, args=(SETTINGS.get('dummy_data_config'),),
+                                     name="dummy_data_thread", daemon=True)
+                t.start()
+                running = True
+            if LOAD_GENERATOR is not None and (running or LOAD_GENERATOR.finished):
+                stats = LOAD_GENERATOR.stats()
+                if stats != SETTINGS.get('dummy_data_stats'):
+                    SETTINGS.set('dummy_data_stats', stats)
+        except Exception as e:
+            print(f"Error watching dummy data toggle: {e}")
+        time.sleep(SETTINGS_REFRESH_INTERVAL)
+
+def run_leader_jobs():
+    with process_lock(DATABASE + '-leader', blocking=False) as acquired:
+        if not acquired:
+            return False
+        LEADER["is_leader"] = True
+        LEADER["since"] = datetime.now().isoformat(timespec='seconds')
+        print(f"Process {os.getpid()} is running the background jobs")
+        
+        # Leftover PENDING rows are swept by the leader only, so N workers
+        # do not all classify the same backlog on startup
+        with PREDICTION_PIPELINE.lock:
+            PREDICTION_PIPELINE.needs_sweep = True
+        jobs = [
+            threading.Thread(target=check_node_status, name="status_check", daemon=True),
+            threading.Thread(target=rollup_worker, name="rollup_worker", daemon=True),
+            threading.Thread(target=retention_worker, name="retention_worker", daemon=True),
+            threading.Thread(target=dummy_data_watcher, name="dummy_data_watcher", daemon=True)
+        ]
+        for t in jobs:
+            t.start()
+        # The jobs never return; holding the lock here keeps leadership
+        # for the life of the process
+        for t in jobs:
+            t.join()
+    return True
+
+def leader_election():
+    while not run_leader_jobs():
+        time.sleep(LEADER_RETRY_INTERVAL)
+
+def start_services():
+    global SERVICES_STARTED
+    with SERVICES_LOCK:
+        if SERVICES_STARTED:
+            return
+        SERVICES_STARTED = True
+    
+    with process_lock(DATABASE + '-init'):
+        init_db()
+    if WRITE_BUFFER.enabled:
+        WRITE_BUFFER.start()
+    PREDICTION_PIPELINE.needs_sweep = False
+    PREDICTION_PIPELINE.start()
+    ALERT_DISPATCHER.start()
+    threading.Thread(target=stream_relay, name="stream_relay", daemon=True).start()
+    threading.Thread(target=leader_election, name="leader_election", daemon=True).start()
+
+def create_app():
+    # WSGI entry point for multi-worker servers, e.g.
+    #   gunicorn --workers 4 --worker-class gthread --threads 8 'app:create_app()'
+    start_services()
+    return app
+
 if __name__ == '__main__':
-    init_db()    
-    status_thread = threading.Thread(target=check_node_status, daemon=True)
-    status_thread.start() 
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True) 
\ No newline at end of file
+    start_services()
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=True) 
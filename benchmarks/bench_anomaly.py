@@ -0,0 +1,126 @@
+# Benchmark: streaming anomaly detector throughput, memory and detection
+#
+# Usage: python benchmarks/bench_anomaly.py [--nodes 5000] [--readings 200]
+#        [--db path/to/iot_data.db] [--limit 1000000]
+#
+# Synthetic mode replays --readings noisy readings per node, interleaved
+# across nodes as a gateway fleet would send them, with spikes, level
+# drifts and sudden steps injected at known points. It reports readings per
+# second, detector memory per node, the share of injected events caught
+# and false positives per 10k clean readings. With --db it replays the
+# readings of an existing database in id order instead.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+# Mean and noise per field: tds, ph, humidity, temp
+PROFILE = ((300.0, 15.0), (7.2, 0.08), (60.0, 2.0), (27.0, 0.4))
+
+def make_stream(nodes, readings, seed=1):
+    # Returns (rows, events); events maps (node, field index) to the kind
+    # injected and the reading index it starts at
+    rng = random.Random(seed)
+    start = time.time() - readings * 60
+    events = {}
+    plans = []
+    for n in range(nodes):
+        field = rng.randrange(4)
+        kind = rng.choice(['spike', 'drift', 'step', None, None])
+        at = rng.randrange(readings // 2, readings - 20)
+        if kind:
+            events[(f"node_{n}", field)] = (kind, at)
+        plans.append((field, kind, at))
+
+    rows = []
+    for r in range(readings):
+        ts = start + r * 60
+        for n, (field, kind, at) in enumerate(plans):
+            values = [rng.gauss(mean, sigma) for mean, sigma in PROFILE]
+            sigma = PROFILE[field][1]
+            if kind == 'spike' and r == at:
+                values[field] += 10 * sigma
+            elif kind == 'drift' and r >= at:
+                values[field] += min(r - at, 20) / 20 * 3 * sigma  # 3 sigma over 20 readings
+            elif kind == 'step' and r >= at:
+                values[field] += 8 * sigma
+            rows.append((f"node_{n}", *values, ts + rng.random()))
+    return rows, events
+
+def load_rows(path, limit):
+    conn = sqlite3.connect(path)
+    names = [row[0] for row in conn.execute('SELECT name FROM sensor_partitions ORDER BY start_ts')]
+    readings = ' UNION ALL '.join(f'SELECT id, node_id, tds, ph, humidity, temp, ts FROM {name}' for name in names)
+    rows = conn.execute(f'''
+    SELECT node_id, tds, ph, humidity, temp, ts
+    FROM ({readings}) ORDER BY id LIMIT ?
+    ''', (limit,)).fetchall()
+    conn.close()
+    return rows
+
+def replay(rows, max_nodes, batch=5000):
+    detector = app.AnomalyDetector(max_nodes=max_nodes, window=app.ANOMALY_WINDOW)
+    anomalies = []
+    started = time.perf_counter()
+    for offset in range(0, len(rows), batch):
+        anomalies.extend(detector.observe_rows(rows[offset:offset + batch]))
+    elapsed = time.perf_counter() - started
+    # Per-node state plus the index holding it
+    memory = sys.getsizeof(detector.nodes) + sum(
+        sys.getsizeof(node) + sys.getsizeof(node.window) + sys.getsizeof(node.stats)
+        for node in detector.nodes.values())
+    return detector, anomalies, elapsed, memory
+
+def score(anomalies, events, readings, nodes):
+    fields = app.ANOMALY_FIELDS
+    caught = {kind: [0, 0] for kind in ('spike', 'drift', 'step')}
+    for kind, _ in events.values():
+        caught[kind][1] += 1
+    hits = set()
+    false_positives = 0
+    for a in anomalies:
+        key = (a["node_id"], fields.index(a["field"]))
+        event = events.get(key)
+        if event is None:
+            false_positives += 1
+        else:
+            hits.add(key)
+    for key in hits:
+        caught[events[key][0]][0] += 1
+    clean = readings * nodes * 4 - len(events) * readings // 2
+    return caught, false_positives * 10000 / max(clean, 1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=5000)
+    parser.add_argument('--readings', type=int, default=200)
+    parser.add_argument('--max-nodes', type=int, default=app.ANOMALY_MAX_NODES)
+    parser.add_argument('--db', help='replay the readings of this database instead')
+    parser.add_argument('--limit', type=int, default=1000000)
+    args = parser.parse_args()
+
+    if args.db:
+        rows, events = load_rows(args.db, args.limit), None
+    else:
+        rows, events = make_stream(args.nodes, args.readings)
+
+    detector, anomalies, elapsed, memory = replay(rows, args.max_nodes)
+    stats = detector.stats()
+    print(f"readings:        {len(rows):,}")
+    print(f"nodes tracked:   {stats['nodes_tracked']:,} (evicted {stats['evictions']:,})")
+    print(f"throughput:      {len(rows) / elapsed:,.0f} readings/s ({elapsed / len(rows) * 1e6:.2f} us each)")
+    print(f"detector memory: {memory / 1e6:.1f} MB ({memory / max(stats['nodes_tracked'], 1):,.0f} bytes/node)")
+    print(f"anomalies:       {stats['anomalies']}")
+    if events is not None:
+        caught, false_rate = score(anomalies, events, args.readings, args.nodes)
+        for kind, (hit, total) in caught.items():
+            print(f"caught {kind:<6}    {hit}/{total} ({hit / max(total, 1):.1%})")
+        print(f"false positives: {false_rate:.2f} per 10k clean field readings")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Benchmark: binary ingest format vs. JSON, bytes on the wire and decode time
+#
+# Usage: python benchmarks/bench_binary_ingest.py [--sizes 1000,100000,1000000]
+#        [--nodes 20]
+#
+# Encodes the same readings as a JSON webhook body and as a binary body
+# (see BINARY_MAGIC in app.py), then times decoding each into sensor_data
+# rows without touching the database, and posting each end to end through
+# the test client against a temporary database with the stub predictor.
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE'] = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('PREDICTOR', 'stub')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+from bench_webhook_ingest import make_payload  # noqa: E402
+
+def pack_binary(payload):
+    # Reference encoder for gateways: one header and a packed record run per node
+    out = [app.BINARY_MAGIC]
+    for node in payload:
+        name = node["nodeId"].encode('utf-8')
+        out.append(app.BINARY_NODE_HEADER.pack(len(name), len(node["data"])))
+        out.append(name)
+        out.extend(app.BINARY_RECORD.pack(m["timestamp"], m["tds"], m["ph"], m["humidity"], m["temperature"])
+                   for m in node["data"])
+    return b''.join(out)
+
+def decode_json(body):
+    reader = app.JSONStreamReader(io.BytesIO(body), max_bytes=len(body))
+    return sum(1 for node_id, m in app.iter_webhook_measurements(reader) if app.measurement_row(node_id, m))
+
+def decode_binary(body):
+    reader = app.BinaryStreamReader(io.BytesIO(body), max_bytes=len(body))
+    return sum(1 for _ in app.iter_binary_rows(reader))
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+def post(client, url, body, content_type):
+    response = client.post(url, data=body, content_type=content_type)
+    assert response.status_code == 200, response.json
+    app.WRITE_BUFFER.drain()  # until the readings are committed
+    return response.json["measurements"]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='1000,100000,1000000')
+    parser.add_argument('--nodes', type=int, default=20)
+    args = parser.parse_args()
+    
+    app.init_db()
+    client = app.app.test_client()
+    print(f"{'measurements':>12}  {'format':<6}  {'bytes':>12}  {'gzipped':>12}  {'decode ms':>10}  {'ingest ms':>10}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        payload = make_payload(size, args.nodes)
+        bodies = {
+            'json': (json.dumps(payload).encode(), decode_json, '/api/webhook/data', 'application/json'),
+            'binary': (pack_binary(payload), decode_binary, '/api/webhook/binary', 'application/octet-stream')
+        }
+        for name, (body, decode, url, content_type) in bodies.items():
+            decode_seconds, decoded = timed(decode, body)
+            ingest_seconds, stored = timed(post, client, url, body, content_type)
+            assert decoded == stored == size
+            print(f"{size:>12}  {name:<6}  {len(body):>12,}  {len(gzip.compress(body)):>12,}  "
+                  f"{decode_seconds * 1000:>10.1f}  {ingest_seconds * 1000:>10.1f}")
+
+if __name__ == '__main__':
+    main()
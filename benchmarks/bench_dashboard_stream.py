@@ -0,0 +1,163 @@
+# Load test: server CPU and API latency with N open dashboards, polling vs.
+# streaming, under the production worker model
+#
+# Usage: python benchmarks/bench_dashboard_stream.py [--clients 50]
+#        [--duration 60] [--workers 1] [--threads 32]
+#
+# Starts gunicorn on create_app() with gthread workers, the way the Docker
+# image runs it, with dummy data generation on. Then opens --clients
+# simulated dashboards. In polling mode each one fetches /api/dashboard
+# every 5s and /api/nodes every 10s, as index.html did. In streaming mode
+# each one loads both once and then follows /api/stream; a stream refused
+# with 503 falls back to polling, as the dashboard does. Meanwhile a probe
+# alternates /api/dashboard reads and one-reading webhook posts every
+# 0.5s, so threads tied up by streams show up as API latency. Server CPU
+# time is read from /proc, so this needs Linux and gunicorn.
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from app import percentile  # noqa: E402
+
+def cpu_seconds(pid):
+    # The gunicorn master and its workers
+    total = 0.0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(entry) == pid or int(fields[1]) == pid:
+            total += (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return total
+
+def request(port, method, path, body=None, timeout=30):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    conn.request(method, path, body, {'Content-Type': 'application/json'} if body else {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response.status, len(data)
+
+def get(port, path):
+    return request(port, 'GET', path)[1]
+
+def polling_client(port, stop, counters):
+    next_nodes = 0
+    while not stop.is_set():
+        counters['bytes'] += get(port, '/api/dashboard')
+        counters['requests'] += 1
+        if time.time() >= next_nodes:
+            counters['bytes'] += get(port, '/api/nodes')
+            counters['requests'] += 1
+            next_nodes = time.time() + 10
+        stop.wait(5)
+
+def streaming_client(port, stop, counters):
+    counters['bytes'] += get(port, '/api/dashboard') + get(port, '/api/nodes')
+    counters['requests'] += 2
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('GET', '/api/stream')
+    response = conn.getresponse()
+    if response.status != 200:
+        response.read()
+        conn.close()
+        counters['refused'] += 1
+        polling_client(port, stop, counters)
+        return
+    counters['streams'] += 1
+    while not stop.is_set():
+        line = response.fp.readline()
+        if not line:
+            break
+        counters['bytes'] += len(line)
+    conn.close()
+
+def probe(port, stop, latencies, counters):
+    body = json.dumps([{"nodeId": "probe", "data": [
+        {"timestamp": 0, "tds": 300, "ph": 7.2, "humidity": 50, "temperature": 25}]}])
+    i = 0
+    while not stop.wait(0.5):
+        i += 1
+        started = time.perf_counter()
+        try:
+            if i % 2:
+                status, _ = request(port, 'GET', '/api/dashboard', timeout=10)
+            else:
+                status, _ = request(port, 'POST', '/api/webhook/data',
+                                    body.replace('"timestamp": 0', f'"timestamp": {time.time()}'), timeout=10)
+            if status != 200:
+                counters['probe_errors'] += 1
+        except OSError:
+            counters['probe_errors'] += 1
+        latencies.append(time.perf_counter() - started)
+
+def run(mode, args, port):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE=os.path.join(tmp, 'bench.db'), PREDICTOR='stub', WEB_THREADS=str(args.threads))
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--worker-class', 'gthread',
+             '--threads', str(args.threads), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+             'app:create_app()'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(300):
+                try:
+                    get(port, '/api/settings/status')
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            request(port, 'POST', '/api/dummy-data/enable')
+
+            stop = threading.Event()
+            counters = {'requests': 0, 'bytes': 0, 'streams': 0, 'refused': 0, 'probe_errors': 0}
+            latencies = []
+            target = polling_client if mode == 'polling' else streaming_client
+            clients = [threading.Thread(target=target, args=(port, stop, counters), daemon=True)
+                       for _ in range(args.clients)]
+            clients.append(threading.Thread(target=probe, args=(port, stop, latencies, counters), daemon=True))
+
+            cpu_before = cpu_seconds(server.pid)
+            for client in clients:
+                client.start()
+            time.sleep(args.duration)
+            cpu_used = cpu_seconds(server.pid) - cpu_before
+            stop.set()
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{mode:<10} {args.clients} clients  {cpu_used:>7.2f} s CPU  "
+          f"({cpu_used / args.duration * 100:5.1f}% of a core)  "
+          f"{counters['requests']} requests  {counters['bytes'] / 1024:.0f} KiB sent")
+    if mode == 'streaming':
+        print(f"{'':<10} {counters['streams']} streams open, {counters['refused']} refused and polling")
+    print(f"{'':<10} probe p50 {percentile(latencies, 50) * 1000:.1f} ms  p99 {percentile(latencies, 99) * 1000:.1f} ms  "
+          f"max {max(latencies) * 1000:.1f} ms  errors {counters['probe_errors']}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=int, default=60)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    run('polling', args, args.port)
+    run('streaming', args, args.port + 1)
+
+if __name__ == '__main__':
+    main()
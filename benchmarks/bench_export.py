@@ -0,0 +1,78 @@
+# Benchmark: bulk history export, JSON dicts vs. streamed CSV/NDJSON/Arrow
+#
+# Usage: python benchmarks/bench_export.py [--rows 1000000,3000000]
+#        [--nodes 20]
+#
+# Seeds a temporary database per size, then exports every row once as a
+# single JSON document built from dict(row) (how /api/nodes/<node_id>
+# builds its sensor_data list) and once through /api/export in each
+# streaming format. Reports rows/s and the peak Python heap of each run,
+# measured in a second pass with tracemalloc so it does not skew timings.
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+from bench_latest_readings import readings_sql, seed  # noqa: E402
+
+def legacy_json(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    rows = [dict(row) for row in conn.execute(f'SELECT * FROM {readings_sql(conn)} ORDER BY node_id, timestamp').fetchall()]
+    conn.close()
+    with app.app.app_context():
+        return len(app.jsonify(rows).get_data())
+
+def streamed(client, fmt):
+    response = client.get(f'/api/export?format={fmt}')
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size
+
+def measure(fn):
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='1000000,3000000')
+    parser.add_argument('--nodes', type=int, default=20)
+    args = parser.parse_args()
+    
+    pyarrow = app.optional_module('pyarrow')
+    formats = ['csv', 'ndjson'] + (['arrow'] if pyarrow is not None else [])
+    if pyarrow is None:
+        print('pyarrow not installed, skipping arrow')
+    
+    for rows in [int(r) for r in args.rows.split(',')]:
+        path = os.path.join(tempfile.mkdtemp(), 'export.db')
+        seed(path, rows, args.nodes)
+        app.DATABASE = path
+        client = app.app.test_client()
+        
+        print(f'\n{rows} rows')
+        results = {'json (dict rows)': measure(lambda: legacy_json(path))}
+        for fmt in formats:
+            results[f'{fmt} (streamed)'] = measure(lambda: streamed(client, fmt))
+        
+        baseline = results['json (dict rows)'][0]
+        for name, (elapsed, size, peak) in results.items():
+            print(f'  {name:<18} {rows / elapsed:>12,.0f} rows/s  {baseline / elapsed:>5.1f}x  '
+                  f'{size / 1e6:>8.1f} MB  peak heap {peak / 1e6:>8.1f} MB')
+
+if __name__ == '__main__':
+    main()
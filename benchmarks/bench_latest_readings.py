@@ -0,0 +1,114 @@
+# Benchmark: "latest reading per node" query, GROUP BY scan vs. node_latest
+#
+# Usage: python benchmarks/bench_latest_readings.py [--rows 1000000,10000000]
+#        [--nodes 20] [--repeat 5]
+#
+# Seeds a temporary database per size (this takes a while at 10M rows) and
+# times the query /api/nodes used to run against the node_latest join it
+# runs today, plus the /api/nodes and /api/dashboard endpoints themselves.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+# The query /api/nodes ran before node_latest, over every partition
+LEGACY_QUERY = '''
+SELECT n.node_id, n.latitude, n.longitude,
+       sd.tds, sd.ph, sd.humidity, sd.temp, sd.status, sd.timestamp
+FROM nodes n
+LEFT JOIN (
+    SELECT s.node_id, s.tds, s.ph, s.humidity, s.temp, s.status, s.timestamp,
+           MAX(s.timestamp) as latest_time
+    FROM {readings} s
+    GROUP BY s.node_id
+) as sd ON n.node_id = sd.node_id
+'''
+
+LATEST_QUERY = '''
+SELECT n.node_id, n.latitude, n.longitude,
+       sd.tds, sd.ph, sd.humidity, sd.temp, sd.status, sd.timestamp
+FROM nodes n
+LEFT JOIN node_latest sd ON n.node_id = sd.node_id
+'''
+
+def readings_sql(conn):
+    # Every partition as one subquery, with the columns sensor_data had
+    names = [row[0] for row in conn.execute('SELECT name FROM sensor_partitions ORDER BY start_ts')]
+    return '(' + ' UNION ALL '.join(f'SELECT {app.READING_COLUMNS} FROM {name}' for name in names) + ')'
+
+def seed(path, rows, nodes, chunk=50000):
+    # Readings go through app.ingest_rows so they land in partitions the
+    # way the webhook stores them, one per second ending now
+    app.DATABASE = path
+    app.init_db()
+    conn = app.db_connect()
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.executemany('INSERT OR IGNORE INTO nodes (node_id, latitude, longitude, last_updated) VALUES (?, ?, ?, ?)',
+                     [(f"node_{i + 1}", 10.0 + random.random(), 106.0 + random.random(), datetime.now())
+                      for i in range(nodes)])
+    conn.commit()
+    start = datetime.now() - timedelta(seconds=rows)
+    statuses = ['GOOD', 'WARNING', 'BAD']
+    for offset in range(0, rows, chunk):
+        count = min(offset + chunk, rows) - offset
+        app.begin_write(conn)
+        app.ingest_rows(conn, [(f"node_{i % nodes + 1}", random.uniform(100, 500), random.uniform(6.0, 8.5),
+                                random.uniform(30, 90), random.uniform(20, 35), start + timedelta(seconds=i))
+                               for i in range(offset, offset + count)], random.choices(statuses, k=count))
+        conn.commit()
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.close()
+
+def time_query(path, query, repeat):
+    conn = sqlite3.connect(path)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(query).fetchall()
+        timings.append(time.perf_counter() - started)
+    conn.close()
+    return min(timings)
+
+def time_endpoint(client, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        client.get(url)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='1000000,10000000')
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for rows in [int(size) for size in args.rows.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.db')
+            started = time.perf_counter()
+            seed(path, rows, args.nodes)
+            print(f"{rows} rows, {args.nodes} nodes (seeded in {time.perf_counter() - started:.1f} s)")
+
+            conn = sqlite3.connect(path)
+            legacy_query = LEGACY_QUERY.format(readings=readings_sql(conn))
+            conn.close()
+            legacy = time_query(path, legacy_query, args.repeat)
+            latest = time_query(path, LATEST_QUERY, args.repeat)
+            print(f"  GROUP BY scan     {legacy * 1000:>10.2f} ms")
+            print(f"  node_latest join  {latest * 1000:>10.2f} ms  ({legacy / latest:.0f}x)")
+
+            client = app.app.test_client()
+            for url in ['/api/nodes', '/api/dashboard']:
+                print(f"  GET {url:<15} {time_endpoint(client, url, args.repeat) * 1000:>8.2f} ms")
+
+if __name__ == '__main__':
+    main()
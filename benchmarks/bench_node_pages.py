@@ -0,0 +1,115 @@
+# Benchmark: node detail history pages, OFFSET paging vs. keyset cursors
+#
+# Usage: python benchmarks/bench_node_pages.py [--rows 2000000] [--nodes 2]
+#        [--pages 1,10,100,1000,9999] [--limit 100] [--repeat 5]
+#
+# Seeds a temporary database through app.ingest_rows and times fetching
+# page N of one node's history newest first, once with LIMIT/OFFSET over
+# the partitions and once through GET /api/nodes/<node_id> with the cursor
+# that ends page N - 1. Also times the first page's summary (from the
+# rollups, which are refreshed after seeding) and the JSON encoding of a
+# full page with orjson and with the standard library.
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+from bench_latest_readings import seed  # noqa: E402
+
+def readings_sql(conn):
+    names = [row[0] for row in conn.execute('SELECT name FROM sensor_partitions ORDER BY start_ts')]
+    return '(' + ' UNION ALL '.join(f'SELECT id, node_id, tds, ph, humidity, temp, status, ts FROM {name}'
+                                    for name in names) + ')'
+
+def best_of(repeat, fn, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+def offset_page(conn, readings, node, page, limit):
+    return conn.execute(f'''
+    SELECT id, datetime(ts, 'unixepoch') AS timestamp, tds, ph, humidity, temp, status
+    FROM {readings}
+    WHERE node_id = ?
+    ORDER BY ts DESC, id DESC
+    LIMIT ? OFFSET ?
+    ''', (node, limit, (page - 1) * limit)).fetchall()
+
+def cursor_before(conn, readings, node, page, limit):
+    # The next_cursor the previous page would have returned
+    if page == 1:
+        return None
+    ts, row_id = conn.execute(f'''
+    SELECT ts, id FROM {readings} WHERE node_id = ?
+    ORDER BY ts DESC, id DESC LIMIT 1 OFFSET ?
+    ''', (node, (page - 1) * limit - 1)).fetchone()
+    return f"{ts}:{row_id}"
+
+def keyset_page(client, url):
+    app.bump_data_version()  # skip the response cache
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data()
+    return response.get_json()['sensor_data']
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--nodes', type=int, default=2)
+    parser.add_argument('--pages', default='1,10,100,1000,9999')
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        random.seed(1)
+        started = time.perf_counter()
+        seed(path, args.rows, args.nodes)
+        app.refresh_rollups()
+        print(f"{args.rows:,} rows, {args.nodes} nodes (seeded in {time.perf_counter() - started:.1f} s)")
+        
+        conn = sqlite3.connect(path)
+        readings = readings_sql(conn)
+        client = app.app.test_client()
+        node = 'node_1'
+        print(f"{'page':>6} {'offset ms':>10} {'keyset ms':>10} {'speedup':>8}")
+        for page in [int(p) for p in args.pages.split(',')]:
+            offset, expected = best_of(args.repeat, offset_page, conn, readings, node, page, args.limit)
+            cursor = cursor_before(conn, readings, node, page, args.limit)
+            url = f'/api/nodes/{node}?limit={args.limit}' + (f'&cursor={cursor}' if cursor else '')
+            keyset, rows = best_of(args.repeat, keyset_page, client, url)
+            assert [row['id'] for row in rows] == [row[0] for row in expected], page
+            print(f"{page:>6} {offset * 1000:>10.2f} {keyset * 1000:>10.2f} {offset / keyset:>7.1f}x")
+        conn.close()
+        
+        db = app.db_connect()
+        summary, _ = best_of(args.repeat, app.node_reading_summary, db, node, None, None, [])
+        page, _ = best_of(args.repeat, app.node_reading_page, db, node, None, None, [],
+                          list(app.NODE_PAGE_FIELDS), None, app.NODE_PAGE_MAX)
+        db.close()
+        print(f"\nsummary over {args.rows // args.nodes:,} readings  {summary * 1000:.2f} ms")
+        
+        rows = app.node_reading_page(app.db_connect(), node, None, None, [], list(app.NODE_PAGE_FIELDS),
+                                     None, app.NODE_PAGE_MAX)[0]
+        body = {"node_id": node, "sensor_data": rows}
+        stdlib, _ = best_of(args.repeat, lambda: json.dumps(body, separators=(',', ':')).encode('utf-8'))
+        print(f"page of {len(rows)} readings: SQL {page * 1000:.2f} ms, JSON stdlib {stdlib * 1000:.2f} ms", end='')
+        orjson = app.optional_module('orjson')
+        if orjson is not None:
+            fast, _ = best_of(args.repeat, orjson.dumps, body)
+            print(f", orjson {fast * 1000:.2f} ms ({stdlib / fast:.1f}x)")
+        else:
+            print(", orjson not installed")
+
+if __name__ == '__main__':
+    main()
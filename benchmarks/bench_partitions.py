@@ -0,0 +1,181 @@
+# Benchmark: range queries and retention, single sensor_data table vs.
+# time-partitioned storage
+#
+# Usage: python benchmarks/bench_partitions.py [--rows 50000000] [--nodes 1000]
+#        [--days 84] [--repeat 5] [--dir /path/with/space]
+#
+# Seeds two databases with the same readings spread evenly over --days:
+# one with the single sensor_data table (text timestamps, (node_id,
+# timestamp) index) the app used before partitioning, one through
+# app.ingest_rows into weekly partitions. Then times per-node and
+# fleet-wide range queries of an hour, a day and a week ending at the most
+# recent reading, and dropping the oldest readings the way each retention
+# job does. Seeding 50M rows takes a while and needs ~11 GB of disk; --dir
+# keeps the databases somewhere other than the system temp directory.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+from bench_webhook_ingest import LEGACY_TABLE  # noqa: E402
+
+RANGES = (('hour', 3600), ('day', 86400), ('week', 7 * 86400))
+
+def readings(args):
+    # Chunks of (node_id, tds, ph, humidity, temp, timestamp), oldest
+    # first, on whole seconds as gateways send them
+    rows, nodes, chunk = args.rows, args.nodes, args.chunk
+    step = args.days * 86400 / rows
+    start = args.start
+    for offset in range(0, rows, chunk):
+        yield [(f"node_{i % nodes + 1}", random.uniform(100, 500), random.uniform(6.0, 8.5),
+                random.uniform(30, 90), random.uniform(20, 35), start + timedelta(seconds=int(i * step)))
+               for i in range(offset, min(offset + chunk, rows))]
+
+def seed_legacy(path, args):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute(LEGACY_TABLE)
+    conn.execute('CREATE INDEX idx_sensor_data_node_time ON sensor_data (node_id, timestamp)')
+    for chunk in readings(args):
+        conn.executemany('''
+        INSERT INTO sensor_data (node_id, tds, ph, humidity, temp, status, timestamp)
+        VALUES (?, ?, ?, ?, ?, 'GOOD', ?)
+        ''', chunk)
+        conn.commit()
+    conn.close()
+
+def seed_partitioned(path, args):
+    app.DATABASE = path
+    app.init_db()
+    conn = app.db_connect()
+    conn.execute('PRAGMA synchronous = OFF')
+    for chunk in readings(args):
+        app.begin_write(conn)
+        app.ingest_rows(conn, chunk, 'GOOD')
+        conn.commit()
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.close()
+
+def legacy_node(conn, node, start, end):
+    low, high = app.NAIVE_EPOCH + timedelta(seconds=start), app.NAIVE_EPOCH + timedelta(seconds=end)
+    return len(conn.execute('''
+    SELECT id, tds, ph, humidity, temp, timestamp FROM sensor_data
+    WHERE node_id = ? AND timestamp >= ? AND timestamp < ?
+    ORDER BY timestamp
+    ''', (node, low, high)).fetchall())
+
+def legacy_fleet(conn, node, start, end):
+    low, high = app.NAIVE_EPOCH + timedelta(seconds=start), app.NAIVE_EPOCH + timedelta(seconds=end)
+    return conn.execute('''
+    SELECT COUNT(*), AVG(tds) FROM sensor_data WHERE timestamp >= ? AND timestamp < ?
+    ''', (low, high)).fetchone()[0]
+
+def partitioned_node(conn, node, start, end):
+    rows = []
+    for name in app.PARTITIONS.route(conn, start, end):
+        rows.extend(conn.execute(f'''
+        SELECT id, tds, ph, humidity, temp, ts FROM {name}
+        WHERE node_id = ? AND ts >= ? AND ts < ?
+        ORDER BY ts
+        ''', (node, start, end)).fetchall())
+    return len(rows)
+
+def partitioned_fleet(conn, node, start, end):
+    count = 0
+    for name in app.PARTITIONS.route(conn, start, end):
+        count += conn.execute(f'''
+        SELECT COUNT(*), AVG(tds) FROM {name} WHERE ts >= ? AND ts < ?
+        ''', (start, end)).fetchone()[0]
+    return count
+
+QUERIES = {
+    'node': (legacy_node, partitioned_node),
+    'fleet': (legacy_fleet, partitioned_fleet)
+}
+
+def best_of(repeat, fn, *args):
+    # (fastest seconds, result)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+def run(args, tmp):
+    legacy_path = os.path.join(tmp, 'legacy.db')
+    partitioned_path = os.path.join(tmp, 'partitioned.db')
+    for label, seed, path in (('single table', seed_legacy, legacy_path),
+                              ('partitioned', seed_partitioned, partitioned_path)):
+        random.seed(1)
+        started = time.perf_counter()
+        seed(path, args)
+        print(f"seeded {label:<13} {args.rows:,} rows in {time.perf_counter() - started:,.1f} s, "
+              f"{os.path.getsize(path) / 1e9:.2f} GB")
+
+    legacy = sqlite3.connect(legacy_path)
+    partitioned = app.db_connect()
+    latest = max(partitioned.execute(f'SELECT MAX(ts) FROM {name}').fetchone()[0]
+                 for name in app.PARTITIONS.route(partitioned)[-2:])
+    print(f"{len(app.PARTITIONS.route(partitioned))} partitions of {app.PARTITION_DAYS} days\n")
+
+    print(f"{'range':<6} {'query':<6} {'rows':>9} {'single ms':>10} {'partitioned ms':>15} {'speedup':>8}")
+    node = f"node_{random.randrange(args.nodes) + 1}"
+    for label, seconds in RANGES:
+        start, end = latest - seconds, latest + 1
+        for kind, (legacy_fn, partitioned_fn) in QUERIES.items():
+            single, expected = best_of(args.repeat, legacy_fn, legacy, node, start, end)
+            parted, rows = best_of(args.repeat, partitioned_fn, partitioned, node, start, end)
+            assert rows == expected, (label, kind, rows, expected)
+            print(f"{label:<6} {kind:<6} {rows:>9,} {single * 1000:>10.2f} {parted * 1000:>15.2f} "
+                  f"{single / max(parted, 1e-9):>7.1f}x")
+
+    # Retention: the two oldest partitions' worth of readings (the first
+    # one is usually a partial week)
+    cutoff = partitioned.execute('SELECT end_ts FROM sensor_partitions ORDER BY start_ts LIMIT 1 OFFSET 1').fetchone()[0]
+    started = time.perf_counter()
+    deleted = 0
+    while True:
+        legacy.execute('''
+        DELETE FROM sensor_data WHERE id IN (
+            SELECT id FROM sensor_data WHERE timestamp < ? LIMIT ?
+        )
+        ''', (app.NAIVE_EPOCH + timedelta(seconds=cutoff), app.RETENTION_CHUNK_SIZE))
+        changes = legacy.execute('SELECT changes()').fetchone()[0]
+        legacy.commit()
+        deleted += changes
+        if changes < app.RETENTION_CHUNK_SIZE:
+            break
+    single = time.perf_counter() - started
+    started = time.perf_counter()
+    dropped, rows = app.PARTITIONS.drop_before(partitioned, cutoff, float('inf'))
+    parted = time.perf_counter() - started - dropped * app.RETENTION_CHUNK_PAUSE
+    print(f"\nretention, {dropped} oldest partitions: {deleted:,} rows deleted in {single:.2f} s, "
+          f"{rows:,} rows dropped in {parted:.2f} s ({single / max(parted, 1e-9):.0f}x)")
+    legacy.close()
+    partitioned.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000000)
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=84)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--chunk', type=int, default=100000)
+    parser.add_argument('--dir', help='directory for the seeded databases')
+    args = parser.parse_args()
+    args.start = datetime.now().replace(microsecond=0) - timedelta(days=args.days)
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        run(args, tmp)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# Benchmark: webhook latency and prediction drain time with the stub predictor
+#
+# Usage: python benchmarks/bench_prediction_pipeline.py [--measurements 2000]
+#        [--latency 0.05] [--workers 4] [--concurrency 2] [--batch-size 50]
+#
+# The stub predictor replaces the Gradio endpoint with a local sleep of
+# --latency seconds per batch, so the webhook can be exercised offline.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+from bench_webhook_ingest import make_payload  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--measurements', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    app.STUB_PREDICT_LATENCY = args.latency
+    app.PREDICTION_PIPELINE = app.PredictionPipeline(
+        app.stub_predictor,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        max_queue=max(args.measurements, 1)
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DATABASE = os.path.join(tmp, 'bench.db')
+        app.init_db()
+        app.SETTINGS.set('email_enabled', False)
+        app.PREDICTION_PIPELINE.start()
+        client = app.app.test_client()
+
+        payload = make_payload(args.measurements)
+        started = time.perf_counter()
+        response = client.post('/api/webhook/data', json=payload)
+        accepted = time.perf_counter()
+        print(f"webhook  {response.status_code}  {(accepted - started) * 1000:.1f} ms for {args.measurements} measurements")
+
+        while True:
+            stats = app.PREDICTION_PIPELINE.stats()
+            if stats['completed'] + stats['failed'] >= args.measurements:
+                break
+            time.sleep(0.01)
+        drained = time.perf_counter()
+        print(f"drain    {(drained - accepted) * 1000:.1f} ms  "
+              f"({args.measurements / (drained - accepted):.0f} predictions/s)")
+        print(stats)
+
+if __name__ == '__main__':
+    main()
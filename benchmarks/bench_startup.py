@@ -0,0 +1,98 @@
+# Benchmark: time from process start to the first answered request
+#
+# Usage: python benchmarks/bench_startup.py [--compare HEAD~1] [--runs 5]
+#        [--offline]
+#
+# Starts the app in a fresh interpreter on a free port and polls
+# /api/settings/status until it answers, reporting the median over --runs.
+# --compare also measures the app.py of an earlier git revision, checked
+# out into a temporary directory. --offline routes the app's outbound HTTPS
+# through a local proxy that accepts connections and never answers, the
+# way a gateway without a working uplink behaves.
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SERVE = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+import app
+application = app.create_app() if hasattr(app, 'create_app') else app.app
+application.run(host='127.0.0.1', port=int(sys.argv[2]), threaded=True, use_reloader=False)
+'''
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def blackhole():
+    # Accepts connections and never replies
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(64)
+    held = []
+    def accept():
+        while True:
+            held.append(server.accept()[0])
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+def checkout(rev):
+    path = tempfile.mkdtemp()
+    archive = subprocess.run(['git', '-C', ROOT, 'archive', rev, 'app.py', 'templates'],
+                             check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', path], input=archive, check=True)
+    return path
+
+def time_to_first_request(source, env, timeout=120):
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', SERVE, source, str(port)], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/settings/status', timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"{source}: no answer within {timeout}s")
+    finally:
+        proc.kill()
+        proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--compare', help='git revision to measure as the baseline')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--offline', action='store_true')
+    args = parser.parse_args()
+
+    env = dict(os.environ, DATABASE=os.path.join(tempfile.mkdtemp(), 'bench.db'), PYTHONUNBUFFERED='1')
+    env.pop('PREDICTOR', None)  # measure the default remote predictor
+    if args.offline:
+        proxy = f'http://127.0.0.1:{blackhole()}'
+        env.update(HTTPS_PROXY=proxy, HTTP_PROXY=proxy, NO_PROXY='127.0.0.1,localhost')
+
+    sources = [('working tree', ROOT)]
+    if args.compare:
+        sources.insert(0, (args.compare, checkout(args.compare)))
+
+    print(f"{'app.py':<14}  {'median s':>9}  {'min s':>7}  {'max s':>7}")
+    for name, source in sources:
+        times = [time_to_first_request(source, env) for _ in range(args.runs)]
+        print(f"{name:<14}  {statistics.median(times):>9.2f}  {min(times):>7.2f}  {max(times):>7.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+# Benchmark suite: end-to-end ingest and read performance, with a baseline
+# to compare against
+#
+# Usage: python benchmarks/bench_suite.py [--scenarios 10000x20,1000000x1000]
+#        [--requests 200] [--batch 100] [--replay traffic.jsonl]
+#        [--record traffic.jsonl] [--reads 200] [--unclassified 10000]
+#        [--repeat 3] [--output results.json] [--baseline baseline.json]
+#        [--threshold 0.2]
+#
+# Each scenario is ROWSxNODES: a temporary database is seeded with ROWS
+# readings over NODES nodes through app.ingest_rows, then a fresh
+# interpreter (so its peak memory is the scenario's alone) replays webhook
+# traffic through the Flask test client and measures
+#   ingest    rows/s until the write buffer has committed everything, the
+#             same including the prediction pipeline's statuses, and
+#             webhook request latency percentiles
+#   reads     latency percentiles of /api/nodes, /api/dashboard,
+#             /api/nodes/<node_id> and its history, with the response
+#             cache bumped before every request
+#   status    rows/s of the status checker over --unclassified readings
+#   storage   peak RSS and database growth per ingested reading
+# Predictions come from the stub predictor (no Gradio) and alert emails go
+# to the fake Mailgun in fake_mailgun.py, so nothing leaves the machine.
+#
+# Traffic is synthetic (--requests bodies of --batch readings, round-robin
+# over the scenario's nodes) unless --replay names a file of recorded
+# webhook bodies, one JSON array per line; --record saves the synthetic
+# traffic in that format. Results are written as JSON to --output. With
+# --baseline, every metric is compared against an earlier --output and the
+# run exits with status 1 if any got worse by more than --threshold.
+# Each scenario runs --repeat times on a fresh copy of the seeded database
+# and keeps the best value of every metric. Latencies that moved by less
+# than NOISE_MS are never flagged.
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('PREDICTOR', 'stub')
+import app  # noqa: E402
+
+from bench_latest_readings import seed  # noqa: E402
+from fake_mailgun import start_fake_mailgun  # noqa: E402
+
+READ_ENDPOINTS = (
+    ('nodes', '/api/nodes'),
+    ('dashboard', '/api/dashboard'),
+    ('node_details', '/api/nodes/{node}'),
+    ('node_history', '/api/nodes/{node}/history')
+)
+NOISE_MS = 0.5
+
+def parse_scenarios(value):
+    scenarios = []
+    for spec in value.split(','):
+        rows, nodes = spec.lower().split('x')
+        scenarios.append((int(rows), int(nodes)))
+    return scenarios
+
+def write_traffic(path, requests, batch, nodes, rng):
+    # Readings one second apart from now on, continuing where seed() stops
+    start = int(time.time())
+    with open(path, 'w') as f:
+        for r in range(requests):
+            payload = {}
+            for i in range(r * batch, (r + 1) * batch):
+                payload.setdefault(f"node_{i % nodes + 1}", []).append({
+                    "timestamp": start + i,
+                    "tds": rng.uniform(100, 1200),
+                    "ph": rng.uniform(6.0, 9.0),
+                    "humidity": rng.uniform(30, 90),
+                    "temperature": rng.uniform(20, 35)
+                })
+            f.write(json.dumps([{"nodeId": node_id, "data": data} for node_id, data in payload.items()]) + '\n')
+
+def db_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal', '-shm') if os.path.exists(path + suffix))
+
+def checkpoint():
+    conn = app.db_connect()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+
+def latency_metrics(prefix, timings):
+    return {f"{prefix}_p{pct}_ms": round(app.percentile(timings, pct) * 1000, 3) for pct in (50, 95, 99)}
+
+def wait_for_predictions(pipeline):
+    while True:
+        stats = pipeline.stats()
+        if stats['completed'] + stats['failed'] >= stats['submitted'] and not stats['in_flight'] and not stats['queue_depth']:
+            return stats
+        time.sleep(0.01)
+
+def run_scenario(args, db_path, traffic_path, nodes):
+    # Runs in the child interpreter; returns (metrics, info)
+    mailgun = start_fake_mailgun()
+    app.MAILGUN_API_URL = f'http://127.0.0.1:{mailgun.server_port}/v3'
+    app.MAILGUN_API_KEY, app.MAILGUN_DOMAIN, app.MAILGUN_SENDER = 'bench', 'bench.local', 'bench@bench.local'
+    app.STUB_PREDICT_LATENCY = args.predict_latency
+    app.DATABASE = db_path
+    app.init_db()
+    app.SETTINGS.set('webhook_enabled', True)
+    app.SETTINGS.set('email_enabled', True)
+    conn = app.db_connect()
+    conn.execute("INSERT OR IGNORE INTO email_recipients (email) VALUES ('ops@bench.local')")
+    conn.commit()
+    conn.close()
+
+    with open(traffic_path) as f:
+        bodies = f.read().splitlines()
+    app.PREDICTION_PIPELINE = app.PredictionPipeline(
+        app.build_predictor(),
+        workers=app.PREDICTION_WORKERS,
+        concurrency=app.PREDICTION_CONCURRENCY,
+        batch_size=app.PREDICTION_BATCH_SIZE,
+        max_queue=max(sum(body.count('"timestamp"') for body in bodies), 1)
+    )
+    app.PREDICTION_PIPELINE.needs_sweep = False
+    app.PREDICTION_PIPELINE.start()
+    app.ALERT_DISPATCHER.start()
+    client = app.app.test_client()
+    checkpoint()
+    size_before = db_size(db_path)
+
+    # Ingest
+    timings, rows, errors = [], 0, 0
+    started = time.perf_counter()
+    for body in bodies:
+        sent = time.perf_counter()
+        response = client.post('/api/webhook/data', data=body, content_type='application/json')
+        timings.append(time.perf_counter() - sent)
+        if response.status_code == 200:
+            rows += response.get_json()['measurements']
+        else:
+            errors += 1
+    app.WRITE_BUFFER.drain()
+    ingested = time.perf_counter() - started
+    pipeline = wait_for_predictions(app.PREDICTION_PIPELINE)
+    app.WRITE_BUFFER.drain()
+    predicted = time.perf_counter() - started
+    metrics = {
+        "ingest_rows_per_s": round(rows / ingested, 1),
+        "pipeline_rows_per_s": round(rows / predicted, 1)
+    }
+    metrics.update(latency_metrics('webhook', timings))
+
+    # Reads
+    app.refresh_rollups()
+    rng = random.Random(1)
+    for name, path in READ_ENDPOINTS:
+        timings = []
+        for _ in range(args.reads):
+            url = path.format(node=f"node_{rng.randrange(nodes) + 1}")
+            app.bump_data_version()  # skip the response cache
+            sent = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - sent)
+            if response.status_code != 200:
+                errors += 1
+        metrics.update(latency_metrics(name, timings))
+
+    # Status checker over readings stored without a status
+    base = time.time()
+    for offset in range(0, args.unclassified, app.WEBHOOK_CHUNK_ROWS):
+        app.commit_rows([(f"node_{i % nodes + 1}", rng.uniform(100, 500), rng.uniform(6.0, 8.5), rng.uniform(30, 90),
+                          rng.uniform(20, 35), datetime.fromtimestamp(base + i))
+                         for i in range(offset, min(offset + app.WEBHOOK_CHUNK_ROWS, args.unclassified))], None)
+    app.WRITE_BUFFER.drain()
+    classified, cursor = 0, 0
+    started = time.perf_counter()
+    while True:
+        cursor, cycle = app.run_status_check(cursor)
+        if not cycle["rows_processed"]:
+            break
+        classified += cycle["rows_processed"]
+    app.WRITE_BUFFER.drain()
+    if classified:
+        metrics["status_check_rows_per_s"] = round(classified / (time.perf_counter() - started), 1)
+
+    checkpoint()
+    growth = db_size(db_path) - size_before
+    metrics["db_growth_bytes_per_row"] = round(growth / max(rows + classified, 1), 1)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    metrics["peak_rss_mb"] = round(peak / 1e6, 1)
+    info = {
+        "requests": len(bodies),
+        "rows_ingested": rows,
+        "rows_classified": classified,
+        "errors": errors,
+        "db_growth_bytes": growth,
+        "predictions": pipeline['completed'],
+        "prediction_failures": pipeline['failed'],
+        "alert_emails": len(mailgun.messages),
+        "write_buffer_flushes": app.WRITE_BUFFER.stats().get('flushes')
+    }
+    return metrics, info
+
+def run_child(db_path, traffic_path, nodes):
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as result:
+        subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                        '--child', db_path, traffic_path, str(nodes), result.name],
+                       check=True, stdout=subprocess.DEVNULL)
+        return json.load(result)
+
+def best_of(runs):
+    # Highest throughput and lowest everything else across the runs
+    best = dict(runs[-1], metrics={})
+    for metric in runs[0]["metrics"]:
+        values = [run["metrics"][metric] for run in runs if metric in run["metrics"]]
+        best["metrics"][metric] = max(values) if metric.endswith('_per_s') else min(values)
+    return best
+
+def git_revision():
+    try:
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        rev = subprocess.run(['git', '-C', root, 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', '-C', root, 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return rev + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, threshold):
+    # Prints every metric next to the baseline; returns the regressions
+    regressions = []
+    print(f"\n{'scenario':<16} {'metric':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for key, scenario in results["scenarios"].items():
+        before = baseline["scenarios"].get(key)
+        if before is None:
+            print(f"{key:<16} not in baseline")
+            continue
+        for metric, value in scenario["metrics"].items():
+            old = before["metrics"].get(metric)
+            if old is None:
+                continue
+            change = (value - old) / old if old else 0.0
+            # Throughputs regress when they drop, everything else when it grows
+            worse = -change if metric.endswith('_per_s') else change
+            regressed = worse > threshold and not (metric.endswith('_ms') and abs(value - old) < NOISE_MS)
+            if regressed:
+                regressions.append((key, metric, old, value))
+            print(f"{key:<16} {metric:<28} {old:>12,.3f} {value:>12,.3f} {change:>+7.1%}"
+                  + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', default='10000x20,1000000x1000', help='ROWSxNODES,...')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=100, help='readings per synthetic request')
+    parser.add_argument('--replay', help='recorded webhook bodies, one JSON array per line')
+    parser.add_argument('--record', help='save the synthetic traffic to this file')
+    parser.add_argument('--reads', type=int, default=200, help='requests per read endpoint')
+    parser.add_argument('--unclassified', type=int, default=10000)
+    parser.add_argument('--predict-latency', type=float, default=0.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--dir', help='directory for the seeded databases')
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        db_path, traffic_path, nodes, result_path = args.child
+        metrics, info = run_scenario(args, db_path, traffic_path, int(nodes))
+        with open(result_path, 'w') as f:
+            json.dump({"metrics": metrics, "info": info}, f)
+        return
+
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+    results = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec='seconds'),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ('child', 'output', 'baseline', 'dir')}
+        },
+        "scenarios": {}
+    }
+    for rows, nodes in parse_scenarios(args.scenarios):
+        key = f"{rows}x{nodes}"
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            random.seed(1)
+            started = time.perf_counter()
+            seed(db_path, rows, nodes)
+            app.refresh_rollups()
+            checkpoint()
+            seeded = time.perf_counter() - started
+
+            traffic_path = args.replay
+            if not traffic_path:
+                traffic_path = os.path.join(tmp, 'traffic.jsonl')
+                write_traffic(traffic_path, args.requests, args.batch, nodes, random.Random(2))
+                if args.record:
+                    with open(traffic_path) as src, open(args.record, 'w') as dst:
+                        dst.write(src.read())
+            runs = []
+            run_path = os.path.join(tmp, 'run.db')
+            for _ in range(args.repeat):
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(run_path + suffix):
+                        os.unlink(run_path + suffix)
+                shutil.copyfile(db_path, run_path)
+                runs.append(run_child(run_path, traffic_path, nodes))
+            scenario = best_of(runs)
+        scenario.update(rows=rows, nodes=nodes, seed_seconds=round(seeded, 1))
+        results["scenarios"][key] = scenario
+
+        print(f"\n{key}: {rows:,} rows, {nodes:,} nodes (seeded in {seeded:.1f} s)")
+        for metric, value in scenario["metrics"].items():
+            print(f"  {metric:<28} {value:>12,.3f}")
+        print(f"  {json.dumps(scenario['info'])}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"baseline {baseline['meta'].get('revision')} from {baseline['meta'].get('created')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\nno regressions above {args.threshold:.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Benchmark: per-row webhook loop vs. bulk ingest path
+#
+# Usage: python benchmarks/bench_webhook_ingest.py [--sizes 10,1000,100000]
+#
+# Both paths run against a fresh temporary SQLite database, with predictions
+# from the local threshold rules instead of the Gradio model, so the
+# numbers reflect database work only.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+def make_payload(measurements, nodes=20):
+    base = int(time.time()) - measurements
+    payload = [{"nodeId": f"node_{i + 1}", "data": []} for i in range(nodes)]
+    for i in range(measurements):
+        payload[i % nodes]["data"].append({
+            "timestamp": base + i,
+            "tds": random.uniform(100, 1200),
+            "ph": random.uniform(6.0, 9.0),
+            "humidity": random.uniform(30, 90),
+            "temperature": random.uniform(20, 35)
+        })
+    return payload
+
+# The webhook loop as it was before the bulk ingest path, writing to the
+# single sensor_data table readings were kept in before partitioning
+LEGACY_TABLE = '''
+CREATE TABLE IF NOT EXISTS sensor_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT,
+    tds REAL,
+    ph REAL,
+    humidity REAL,
+    temp REAL,
+    status TEXT,
+    timestamp TIMESTAMP,
+    FOREIGN KEY (node_id) REFERENCES nodes (node_id)
+)
+'''
+
+def legacy_ingest(data):
+    conn = sqlite3.connect(app.DATABASE)
+    c = conn.cursor()
+    c.execute(LEGACY_TABLE)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_sensor_data_node_time ON sensor_data (node_id, timestamp)')
+    for node in data:
+        node_id = node.get('nodeId')
+        for measurement in node.get('data', []):
+            c.execute('SELECT node_id FROM nodes WHERE node_id = ?', (node_id,))
+            if not c.fetchone():
+                c.execute('''
+                INSERT INTO nodes (node_id, latitude, longitude, last_updated)
+                VALUES (?, ?, ?, ?)
+                ''', (node_id, 10.0 + random.random(), 106.0 + random.random(), datetime.now()))
+            prediction = app.threshold_status(measurement.get('tds', 0), measurement.get('ph', 0))
+            c.execute('''
+            INSERT INTO sensor_data
+            (node_id, tds, ph, humidity, temp, status, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                node_id,
+                measurement.get('tds'),
+                measurement.get('ph'),
+                measurement.get('humidity'),
+                measurement.get('temperature'),
+                prediction,
+                datetime.fromtimestamp(measurement.get('timestamp'))
+            ))
+    conn.commit()
+    conn.close()
+
+def run(label, func, payload, measurements):
+    with tempfile.TemporaryDirectory() as tmp:
+        app.DATABASE = os.path.join(tmp, 'bench.db')
+        app.init_db()
+        app.SETTINGS.set('email_enabled', False)
+        started = time.perf_counter()
+        func(payload)
+        app.WRITE_BUFFER.drain()  # until the readings are committed
+        elapsed = time.perf_counter() - started
+    print(f"{label:<8} {measurements:>8} rows  {elapsed * 1000:>10.1f} ms  {measurements / elapsed:>12.0f} rows/s")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10,1000,100000')
+    args = parser.parse_args()
+
+    for measurements in [int(size) for size in args.sizes.split(',')]:
+        payload = make_payload(measurements)
+        legacy = run('legacy', legacy_ingest, payload, measurements)
+        bulk = run('bulk', app.ingest_payload, payload, measurements)
+        print(f"speedup  {legacy / bulk:.1f}x\n")
+
+if __name__ == '__main__':
+    main()
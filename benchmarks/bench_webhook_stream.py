@@ -0,0 +1,103 @@
+# Benchmark: peak RSS of the webhook for growing payloads, streamed parsing
+# vs. loading the whole body with json.load (what request.json did)
+#
+# Usage: python benchmarks/bench_webhook_stream.py [--sizes 100,100000,1000000]
+#        [--nodes 20] [--format json|ndjson]
+#
+# Each payload is written to a temporary file and posted from a fresh
+# subprocess with a fresh database, so VmHWM (peak RSS, Linux only) covers
+# exactly one request. Predictions use the stub predictor.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+WORKER = '''
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+import app
+
+def peak_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+
+app.init_db()
+baseline = peak_rss()
+started = time.perf_counter()
+if {mode!r} == 'streamed':
+    with open({path!r}, 'rb') as f:
+        response = app.app.test_client().post('/api/webhook/data', input_stream=f, content_type={content_type!r},
+                                              headers={{'Content-Length': str(os.path.getsize({path!r}))}})
+    measurements = response.json['measurements']
+else:
+    with open({path!r}) as f:
+        measurements = app.ingest_payload(json.load(f))['measurements']
+print(json.dumps({{"measurements": measurements, "seconds": time.perf_counter() - started,
+                  "baseline": baseline, "peak": peak_rss()}}))
+'''
+
+def write_payload(path, measurements, nodes, fmt):
+    # Written measurement by measurement so the generator itself stays small
+    base = int(time.time()) - measurements
+    per_node = [measurements // nodes + (1 if i < measurements % nodes else 0) for i in range(nodes)]
+    with open(path, 'w') as f:
+        if fmt == 'json':
+            f.write('[')
+        for n, count in enumerate(per_node):
+            if fmt == 'json':
+                f.write(('' if n == 0 else ',') + f'{{"nodeId": "node_{n + 1}", "data": [')
+            for i in range(count):
+                measurement = {
+                    "timestamp": base + i,
+                    "tds": random.uniform(100, 1200),
+                    "ph": random.uniform(6.0, 9.0),
+                    "humidity": random.uniform(30, 90),
+                    "temperature": random.uniform(20, 35)
+                }
+                if fmt == 'json':
+                    f.write(('' if i == 0 else ',') + json.dumps(measurement))
+                else:
+                    measurement["nodeId"] = f"node_{n + 1}"
+                    f.write(json.dumps(measurement) + '\n')
+            if fmt == 'json':
+                f.write(']}')
+        if fmt == 'json':
+            f.write(']')
+
+def run(mode, path, fmt):
+    workdir = tempfile.mkdtemp()
+    content_type = 'application/json' if fmt == 'json' else 'application/x-ndjson'
+    env = dict(os.environ, DATABASE=os.path.join(workdir, 'bench.db'), PREDICTOR='stub')
+    script = WORKER.format(root=ROOT, mode=mode, path=path, content_type=content_type)
+    output = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='100,100000,1000000')
+    parser.add_argument('--nodes', type=int, default=20)
+    parser.add_argument('--format', choices=['json', 'ndjson'], default='json')
+    args = parser.parse_args()
+    
+    modes = ['streamed'] + (['json.load'] if args.format == 'json' else [])
+    print(f"{'measurements':>12}  {'mode':<9}  {'body MB':>8}  {'seconds':>8}  {'peak RSS delta MB':>17}")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        path = os.path.join(tempfile.mkdtemp(), f'payload.{args.format}')
+        write_payload(path, size, args.nodes, args.format)
+        for mode in modes:
+            result = run(mode, path, args.format)
+            assert result['measurements'] == size, result
+            print(f"{size:>12}  {mode:<9}  {os.path.getsize(path) / 1e6:>8.1f}  {result['seconds']:>8.2f}  "
+                  f"{(result['peak'] - result['baseline']) / 1e6:>17.1f}")
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# Benchmark: request throughput against the number of gunicorn workers
+#
+# Usage: python benchmarks/bench_workers.py [--workers 1,2,4] [--clients 16]
+#        [--duration 20] [--rows 200000]
+#
+# Seeds one temporary database, then for each worker count starts
+# gunicorn on create_app() and drives it from --clients client processes
+# for --duration seconds. The read mix is node details, 24h history and
+# the dashboard; a write thread posts one webhook batch per second, which
+# keeps the response caches honest. Needs gunicorn installed.
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import app  # noqa: E402
+from bench_latest_readings import seed  # noqa: E402
+
+NODES = 20
+
+def client(port, duration, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    done = errors = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        node = f"node_{random.randint(1, NODES)}"
+        path = random.choice([
+            f'/api/nodes/{node}',
+            f'/api/nodes/{node}/history?start={time.time() - 86400}&end={time.time()}',
+            '/api/dashboard'
+        ])
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    results.put((done, errors))
+
+def writer(port, duration):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        body = json.dumps([{"nodeId": f"node_{random.randint(1, NODES)}", "data": [{
+            "timestamp": time.time(), "tds": 300, "ph": 7.2, "humidity": 50, "temperature": 25
+        }]}])
+        conn.request('POST', '/api/webhook/data', body, {'Content-Type': 'application/json'})
+        conn.getresponse().read()
+        time.sleep(1)
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/settings/status')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError('server did not start')
+
+def run(path, workers, clients, duration, port):
+    env = dict(os.environ, DATABASE=path, PREDICTOR='stub')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', 'gthread',
+         '--threads', '4', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:create_app()'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=client, args=(port, duration, results)) for _ in range(clients)]
+        procs.append(multiprocessing.Process(target=writer, args=(port, duration)))
+        for p in procs:
+            p.start()
+        totals = [results.get() for _ in range(clients)]
+        for p in procs:
+            p.join()
+        return sum(t[0] for t in totals) / duration, sum(t[1] for t in totals)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+    
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed(path, args.rows, NODES)
+    # Fold the seeded rows into the rollups now, not during the first run
+    app.DATABASE = path
+    app.refresh_rollups()
+    print(f"{os.cpu_count()} CPUs, {args.clients} client processes, {args.duration:.0f}s per run")
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        rate, errors = run(path, workers, args.clients, args.duration, args.port)
+        baseline = baseline or rate
+        print(f"{workers:>2} workers  {rate:>8.0f} req/s  {rate / baseline:>4.1f}x  errors={errors}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# Benchmark: concurrent small writes committed one by one vs. through the
+# write-behind buffer
+#
+# Usage: python benchmarks/bench_write_buffer.py [--writers 16] [--batches 200]
+#        [--rows 10] [--nodes 1000] [--synchronous NORMAL|FULL]
+#
+# --writers threads each submit --batches chunks of --rows readings through
+# app.commit_rows, the way concurrent webhook requests from small gateways
+# do. Direct mode commits every chunk in its own transaction (buffer size
+# 0); buffered mode hands chunks to the write buffer and its writer thread
+# group-commits them. Reports submit latency percentiles, throughput up to
+# the last reading being committed, and the number of commits it took.
+# --synchronous FULL makes every commit wait for an fsync, as on hardware
+# that must not lose acknowledged readings.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+def make_chunks(args, writer):
+    start = datetime.now() - timedelta(seconds=args.batches * args.rows)
+    return [[(f"node_{random.randrange(args.nodes) + 1}", random.uniform(100, 500), random.uniform(6.0, 8.5),
+              random.uniform(30, 90), random.uniform(20, 35), start + timedelta(seconds=b * args.rows + i, microseconds=writer))
+             for i in range(args.rows)]
+            for b in range(args.batches)]
+
+def run(label, size, args, tmp):
+    app.DATABASE = os.path.join(tmp, f'{label}.db')
+    app.init_db()
+    app.SETTINGS.set('email_enabled', False)
+    app.DB_POOL_SIZE = max(app.DB_POOL_SIZE, args.writers + 2)
+    pool = app.get_pool()
+    app.WRITE_BUFFER = app.WriteBuffer(size, app.WRITE_BUFFER_FLUSH_ROWS, app.WRITE_BUFFER_FLUSH_INTERVAL,
+                                       max_batch=app.WRITE_BUFFER_MAX_BATCH)
+    with app.DB_STATS_LOCK:
+        commits_before = app.DB_STATS['write_transactions']
+    
+    random.seed(1)
+    chunks = [make_chunks(args, w) for w in range(args.writers)]
+    latencies = []
+    lock = threading.Lock()
+    def writer(own):
+        timings = []
+        for chunk in own:
+            started = time.perf_counter()
+            app.commit_rows(chunk)
+            timings.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(timings)
+    
+    # Every pooled connection gets the requested synchronous level
+    conns = [pool.acquire() for _ in range(pool.size)]
+    for conn in conns:
+        conn.execute(f'PRAGMA synchronous = {args.synchronous}')
+    for conn in conns:
+        conn.close()
+    
+    threads = [threading.Thread(target=writer, args=(own,)) for own in chunks]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    app.WRITE_BUFFER.drain()
+    elapsed = time.perf_counter() - started
+    
+    with app.DB_STATS_LOCK:
+        commits = app.DB_STATS['write_transactions'] - commits_before
+    rows = args.writers * args.batches * args.rows
+    conn = app.db_connect()
+    stored = sum(conn.execute(f'SELECT COUNT(*) FROM {name}').fetchone()[0] for name in app.PARTITIONS.route(conn))
+    conn.close()
+    assert stored == rows, (stored, rows)
+    print(f"{label:<9} {app.percentile(latencies, 50) * 1000:>8.2f} {app.percentile(latencies, 99) * 1000:>8.2f} "
+          f"{rows / elapsed:>10,.0f} {commits:>8,} {rows / max(commits, 1):>9.1f}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--synchronous', choices=['NORMAL', 'FULL'], default='NORMAL')
+    args = parser.parse_args()
+    
+    print(f"{args.writers} writers x {args.batches} chunks x {args.rows} readings, synchronous={args.synchronous}")
+    print(f"{'mode':<9} {'p50 ms':>8} {'p99 ms':>8} {'rows/s':>10} {'commits':>8} {'rows/commit':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        direct = run('direct', 0, args, tmp)
+        buffered = run('buffered', app.WRITE_BUFFER_SIZE or 100000, args, tmp)
+    print(f"speedup   {direct / buffered:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Local stand-in for the Mailgun messages API
+#
+# Usage: python benchmarks/fake_mailgun.py [--port 8025] [--latency 0.2]
+#        [--fail-rate 0.1]
+#
+# Point the app at it with MAILGUN_API_URL=http://127.0.0.1:8025/v3 (and any
+# non-empty MAILGUN_API_KEY / MAILGUN_DOMAIN). Every accepted POST is
+# printed with its recipient count. A --fail-rate share of requests is
+# answered with HTTP 503 to exercise retries.
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+class FakeMailgun(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, fail_rate=0.0, verbose=False):
+        super().__init__(address, FakeMailgunHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.messages = []
+        self.failures = 0
+
+class FakeMailgunHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        time.sleep(self.server.latency)
+        
+        if not self.path.endswith('/messages'):
+            self.reply(404, b'{"message": "Not found"}')
+            return
+        if random.random() < self.server.fail_rate:
+            with self.server.lock:
+                self.server.failures += 1
+            self.reply(503, b'{"message": "Service unavailable"}')
+            return
+        
+        fields = parse_qs(body)
+        with self.server.lock:
+            self.server.messages.append(fields)
+        if self.server.verbose:
+            print(f"{len(fields.get('to', []))} recipient(s): {fields.get('subject', [''])[0]}")
+        self.reply(200, b'{"id": "<fake@mailgun>", "message": "Queued. Thank you."}')
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_mailgun(port=0, latency=0.0, fail_rate=0.0, verbose=False):
+    server = FakeMailgun(('127.0.0.1', port), latency, fail_rate, verbose)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    
+    server = FakeMailgun(('127.0.0.1', args.port), args.latency, args.fail_rate, verbose=True)
+    print(f"Fake Mailgun listening on http://127.0.0.1:{args.port}/v3")
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
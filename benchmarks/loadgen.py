@@ -0,0 +1,74 @@
+# Synthetic load generator: drives the app at a configurable message rate
+#
+# Usage: python benchmarks/loadgen.py [--nodes 1000] [--rate 5000]
+#        [--batch-size 200] [--workers 4] [--pattern steady|burst|wave]
+#        [--target db|webhook] [--url http://host:5000/api/webhook/data]
+#        [--duration 30]
+#
+# With --target db the rows go straight into a temporary database through
+# the bulk ingest path. With --target webhook they are POSTed to --url; if
+# no --url is given a local server is started on a temporary database.
+# Prints throughput, batch latency percentiles and the error rate, and with
+# --target db the write buffer's flush stats.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=5000)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--pattern', choices=['steady', 'burst', 'wave'], default='steady')
+    parser.add_argument('--burst-factor', type=float, default=5.0)
+    parser.add_argument('--burst-period', type=float, default=10.0)
+    parser.add_argument('--burst-duration', type=float, default=2.0)
+    parser.add_argument('--target', choices=['db', 'webhook'], default='db')
+    parser.add_argument('--url')
+    parser.add_argument('--duration', type=float, default=30)
+    args = parser.parse_args()
+    
+    if args.target == 'db' or not args.url:
+        os.environ['DATABASE'] = os.path.join(tempfile.mkdtemp(), 'loadgen.db')
+        os.environ.setdefault('PREDICTOR', 'stub')
+    import app
+    if args.target == 'db' or not args.url:
+        app.init_db()
+    
+    url = args.url
+    if args.target == 'webhook' and not url:
+        from werkzeug.serving import make_server
+        app.PREDICTION_PIPELINE.start()
+        server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/api/webhook/data'
+    
+    generator = app.LoadGenerator(
+        nodes=args.nodes, rate=args.rate, batch_size=args.batch_size, workers=args.workers,
+        target=args.target, url=url, pattern=args.pattern, burst_factor=args.burst_factor,
+        burst_period=args.burst_period, burst_duration=args.burst_duration, duration=args.duration)
+    
+    done = threading.Event()
+    def report():
+        while not done.wait(5):
+            stats = generator.stats()
+            print(f"{stats['elapsed_seconds']:>7.1f}s  rows={stats['rows_sent']}  "
+                  f"rate={stats['achieved_rows_per_second']}/s  p95={stats['latency_p95_ms']}ms  "
+                  f"errors={stats['errors']}", flush=True)
+    threading.Thread(target=report, daemon=True).start()
+    generator.run(lambda: True)
+    done.set()
+    
+    print(json.dumps(generator.stats(), indent=2))
+    if args.target == 'db':
+        app.WRITE_BUFFER.drain()
+        print(json.dumps({"write_buffer": app.WRITE_BUFFER.stats()}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Shared fixtures. app reads its configuration at import, so the stub
+# predictor is selected here, before any test module imports it
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('PREDICTOR', 'stub')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+@pytest.fixture
+def database_path(tmp_path, monkeypatch):
+    # Points app at a new database file without creating it. The partition
+    # and response caches are keyed on schema_version and data_version,
+    # which repeat across files, so they are replaced too
+    monkeypatch.setattr(app, 'DATABASE', str(tmp_path / 'iot.db'))
+    monkeypatch.setattr(app, 'PARTITIONS', app.SensorPartitions(app.PARTITION_DAYS))
+    monkeypatch.setattr(app, 'RESPONSE_CACHE', app.ResponseCache())
+    return app.DATABASE
+
+@pytest.fixture
+def database(database_path):
+    # A fresh database per test
+    app.init_db()
+    return database_path
+
+@pytest.fixture
+def unbuffered(monkeypatch):
+    # Every chunk is committed before the request returns
+    monkeypatch.setattr(app.WRITE_BUFFER, 'capacity', 0)
+
+@pytest.fixture
+def stored(database_path):
+    # Reads every row across the partitions, oldest id first
+    def read(*columns):
+        conn = app.db_connect()
+        try:
+            rows = []
+            for _, _, name in app.PARTITIONS.list(conn):
+                rows.extend(conn.execute(f"SELECT {', '.join(columns or ('*',))} FROM {name}").fetchall())
+        finally:
+            conn.close()
+        return sorted(rows, key=lambda row: row[0])
+    return read
@@ -0,0 +1,18 @@
+# Node detail pages: /api/nodes/<node_id> pages readings newest first by a
+# (ts, id) cursor, with buffered readings merged into the first page
+#
+# Run with: python -m pytest tests
+from datetime import datetime
+
+import app
+
+def rows(node_id, start, count):
+    return [(node_id, 100.0 + i, 7.0, 55.0, 26.0, datetime.fromtimestamp(start + i)) for i in range(count)]
+
+def test_empty_cursor_is_the_first_page(database, unbuffered):
+    app.commit_rows(rows('node_1', 1700000000, 5))
+    client = app.app.test_client()
+    first = client.get('/api/nodes/node_1?limit=3').get_json()
+    assert client.get('/api/nodes/node_1?limit=3&cursor=').get_json() == first
+    assert [r['tds'] for r in first['sensor_data']] == [104.0, 103.0, 102.0]
+    assert client.get('/api/nodes/node_1?cursor=abc').status_code == 400
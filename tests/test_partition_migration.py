@@ -0,0 +1,123 @@
+# Upgrading a database created before partitioning: init_db moves the single
+# sensor_data table into weekly partitions, keeping ids and history
+#
+# Run with: python -m pytest tests
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+
+# The schema init_db created before readings were partitioned
+BASELINE_SCHEMA = '''
+CREATE TABLE nodes (
+    node_id TEXT PRIMARY KEY,
+    latitude REAL,
+    longitude REAL,
+    last_updated TIMESTAMP
+);
+CREATE TABLE sensor_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT,
+    tds REAL,
+    ph REAL,
+    humidity REAL,
+    temp REAL,
+    status TEXT,
+    timestamp TIMESTAMP,
+    FOREIGN KEY (node_id) REFERENCES nodes (node_id)
+);
+CREATE TABLE email_recipients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE,
+    last_notified TIMESTAMP
+);
+'''
+
+# Saturday 2024-01-06 to Tuesday 2024-01-09, across the week starting Monday 2024-01-08
+FIRST_READING = datetime(2024, 1, 6, 0, 0, 0, 250000)
+
+def readings():
+    # Timestamps as sqlite3's datetime adapter wrote them, with microseconds
+    statuses = ('GOOD', 'WARNING', 'BAD', 'PENDING')
+    rows = []
+    for hour in range(80):
+        for node_id in ('node_1', 'node_2'):
+            taken_at = FIRST_READING + timedelta(hours=hour, minutes=7 if node_id == 'node_2' else 0)
+            rows.append((node_id, 300.0 + hour, 7.0 + hour / 100, 55.0, 26.5, statuses[hour % 4], str(taken_at)))
+    return rows
+
+@pytest.fixture
+def baseline(database_path):
+    conn = sqlite3.connect(database_path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO nodes VALUES ('node_1', 10.7, 106.6, '2024-01-06 00:00:00')")
+    conn.execute("INSERT INTO nodes VALUES ('node_2', 10.8, 106.7, '2024-01-06 00:00:00')")
+    conn.executemany('''
+    INSERT INTO sensor_data (node_id, tds, ph, humidity, temp, status, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', readings())
+    # Deleted readings leave gaps, and AUTOINCREMENT never reuses their ids
+    conn.execute('DELETE FROM sensor_data WHERE id IN (5, 160)')
+    conn.commit()
+    before = conn.execute('SELECT id, node_id, tds, ph, humidity, temp, status, timestamp FROM sensor_data').fetchall()
+    conn.close()
+    return before
+
+def as_stored(row):
+    # The partitions keep whole seconds
+    taken_at = datetime.fromisoformat(row[7]).replace(microsecond=0)
+    return row[:7] + (taken_at.strftime('%Y-%m-%d %H:%M:%S'),)
+
+def test_migration_keeps_rows_and_ids(baseline, stored):
+    app.init_db()
+    after = stored('id', 'node_id', 'tds', 'ph', 'humidity', 'temp', 'status', "datetime(ts, 'unixepoch')")
+    assert len(after) == len(baseline) == 158
+    assert after == [as_stored(row) for row in baseline]
+
+    conn = app.db_connect()
+    try:
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'sensor_data'").fetchone() is None
+        assert [name for _, _, name in app.PARTITIONS.list(conn)] == ['sensor_data_p20240101', 'sensor_data_p20240108']
+        assert conn.execute('SELECT latitude FROM nodes WHERE node_id = ?', ('node_1',)).fetchone()[0] == 10.7
+    finally:
+        conn.close()
+
+    # Running it again changes nothing, and new readings continue after
+    # the highest id ever handed out, deleted ones included
+    app.init_db()
+    assert len(stored()) == 158
+    app.write_batch([('node_1', 1.0, 7.0, 55.0, 26.0, datetime(2024, 1, 9, 12))])
+    assert stored('id')[-1] == (161,)
+
+def test_node_history_across_the_week_boundary(baseline, unbuffered):
+    app.init_db()
+    client = app.app.test_client()
+    expected = sorted((as_stored(row) for row in baseline if row[1] == 'node_1'),
+                      key=lambda row: (row[7], row[0]), reverse=True)
+
+    # One page with everything, newest first
+    body = client.get('/api/nodes/node_1?limit=1000').get_json()
+    assert body['latitude'] == 10.7
+    assert [(r['id'], r['tds'], r['status'], r['timestamp']) for r in body['sensor_data']] == \
+        [(row[0], row[2], row[6], row[7]) for row in expected]
+    assert body['summary']['count'] == len(expected)
+    assert body['next_cursor'] is None
+
+    # Pages of 7 walk across both partitions without gaps or repeats
+    ids, url = [], '/api/nodes/node_1?limit=7'
+    while url:
+        page = client.get(url).get_json()
+        ids.extend(r['id'] for r in page['sensor_data'])
+        url = page['next_cursor'] and f"/api/nodes/node_1?limit=7&cursor={page['next_cursor']}"
+    assert ids == [row[0] for row in expected]
+
+    # A time window straddling Monday reads from both partitions
+    window = client.get('/api/nodes/node_1?limit=1000&start=2024-01-07T22:00:00&end=2024-01-08T02:00:00').get_json()
+    assert [r['timestamp'] for r in window['sensor_data']] == [
+        '2024-01-08 01:00:00', '2024-01-08 00:00:00', '2024-01-07 23:00:00', '2024-01-07 22:00:00']
+
+    # node_latest is rebuilt from the migrated rows
+    latest = {node['node_id']: node for node in client.get('/api/nodes').get_json()}
+    newest = max((row for row in baseline if row[1] == 'node_2'), key=lambda row: row[7])
+    assert (latest['node_2']['tds'], latest['node_2']['timestamp']) == (newest[2], as_stored(newest)[7])
@@ -0,0 +1,43 @@
+# Prediction cache: answers from the remote model are cached, the threshold
+# fallback used while it is unreachable is not
+#
+# Run with: python -m pytest tests
+import time
+
+import app
+
+class FakeClient:
+    def __init__(self, status):
+        self.status = status
+        self.calls = 0
+
+    def predict(self, tds, ph, humidity, temperature, api_name=None):
+        self.calls += 1
+        return self.status
+
+def cached(remote):
+    cache = app.PredictionCache(max_size=100, ttl=300)
+    predict = app.cached_predictor(
+        lambda rows: [remote.predict(*row) for row in rows], cache)
+    return predict, cache
+
+def test_fallback_answers_are_not_cached():
+    remote = app.RemotePredictor('http://gradio.invalid', retry_interval=3600)
+    remote.opened_at = time.monotonic()  # circuit open
+    predict, cache = cached(remote)
+    # Same quantum bin for ph (0.05 steps), opposite sides of the 6.5 threshold
+    assert predict([(100, 6.49, 50, 25)]) == ['BAD']
+    assert predict([(100, 6.51, 50, 25)]) == [app.threshold_status(100, 6.51)] == ['WARNING']
+    assert cache.stats()["size"] == 0
+
+    # Once the remote answers again, its answers are cached
+    remote.opened_at = None
+    remote.client = FakeClient('GOOD')
+    assert predict([(100, 6.51, 50, 25)]) == ['GOOD']
+    assert predict([(100, 6.52, 50, 25)]) == ['GOOD']
+    assert remote.client.calls == 1
+    assert cache.stats()["size"] == 1
+
+def test_fallback_status_stores_like_a_plain_status():
+    status = app.FallbackStatus('BAD')
+    assert status == 'BAD' and status in app.STATUS_LABELS
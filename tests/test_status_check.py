@@ -0,0 +1,21 @@
+# Status checker: classifies readings stored without a status, oldest id
+# first, and reports how far behind it is
+#
+# Run with: python -m pytest tests
+from datetime import datetime, timedelta
+
+import app
+
+def test_lag_is_the_age_of_the_oldest_reading(database, unbuffered, stored, monkeypatch):
+    monkeypatch.setattr(app, 'send_email_notification', lambda node_id, status: None)
+    now = datetime.now().replace(microsecond=0)
+    # The backfilled reading is two hours old but gets the highest id
+    app.commit_rows([('node_1', 100.0, 7.0, 55.0, 26.0, now - timedelta(minutes=5)),
+                     ('node_2', 100.0, 7.0, 55.0, 26.0, now - timedelta(minutes=1))], None)
+    app.commit_rows([('node_3', 100.0, 7.0, 55.0, 26.0, now - timedelta(hours=2))], None)
+
+    cursor, cycle = app.run_status_check(0)
+    assert cycle["rows_processed"] == 3
+    assert cursor == 3
+    assert 7200 <= cycle["lag_seconds"] < 7260
+    assert all(status in app.STATUS_LABELS for _, status in stored('id', 'status'))
@@ -0,0 +1,66 @@
+# Stream relay: workers follow node_latest changes made by other workers
+# through its version column, reading only the rows that moved
+#
+# Run with: python -m pytest tests
+from datetime import datetime, timedelta
+
+import app
+
+PARTITION = 'sensor_data_p20240108'
+NOON = datetime(2024, 1, 8, 12)
+
+def reading(node_id, seconds, tds=100.0):
+    return (node_id, tds, 7.0, 55.0, 26.0, NOON + timedelta(seconds=seconds))
+
+def relayed(rows):
+    return sorted((row['node_id'], row['tds'], row['status']) for row in rows)
+
+def test_only_changed_nodes_are_read(database):
+    app.write_batch([reading(f'node_{i}', 0) for i in range(1, 6)])  # ids 1-5
+    assert app.node_latest_since(None) == ([], 5)
+
+    # node_5's reading is older than its latest, so node_latest keeps the
+    # old one; the row at the watermark itself is read again
+    app.write_batch([reading('node_2', 1, 200.0), reading('node_4', 1, 400.0), reading('node_5', -60, 1.0)])
+    rows, watermark = app.node_latest_since(5)
+    assert relayed(rows) == [('node_2', 200.0, 'PENDING'), ('node_4', 400.0, 'PENDING'), ('node_5', 100.0, 'PENDING')]
+    assert watermark == 7
+
+    # A status-only commit moves the node whose latest reading changed
+    # status, and not node_5, whose older reading did
+    app.write_batch([], updates=[(PARTITION, 1, 'node_1', 'GOOD', 'PENDING'),
+                                 (PARTITION, 8, 'node_5', 'BAD', 'PENDING')])
+    rows, watermark = app.node_latest_since(watermark)
+    assert relayed(rows) == [('node_1', 100.0, 'GOOD'), ('node_4', 400.0, 'PENDING')]
+    assert watermark == 8
+
+    rows, watermark = app.node_latest_since(watermark)
+    assert relayed(rows) == [('node_1', 100.0, 'GOOD')]
+
+def test_init_db_adds_version_to_older_databases(database):
+    app.write_batch([reading('node_1', 0)])
+    # Put back the schema from before node_latest had a version
+    conn = app.db_connect()
+    conn.executescript(f'''
+    DROP INDEX node_latest_version;
+    DROP TRIGGER {PARTITION}_latest_insert;
+    DROP TRIGGER {PARTITION}_latest_status;
+    ALTER TABLE node_latest DROP COLUMN version;
+    CREATE TRIGGER {PARTITION}_latest_insert AFTER INSERT ON {PARTITION} WHEN NEW.node_id IS NOT NULL
+    BEGIN
+        INSERT INTO node_latest (node_id, sensor_id, tds, ph, humidity, temp, status, timestamp)
+        VALUES (NEW.node_id, NEW.id, NEW.tds, NEW.ph, NEW.humidity, NEW.temp, NEW.status, datetime(NEW.ts, 'unixepoch'))
+        ON CONFLICT (node_id) DO UPDATE SET sensor_id = excluded.sensor_id, status = excluded.status;
+    END;
+    CREATE TRIGGER {PARTITION}_latest_status AFTER UPDATE OF status ON {PARTITION}
+    BEGIN
+        UPDATE node_latest SET status = NEW.status WHERE node_id = NEW.node_id AND sensor_id = NEW.id;
+    END;
+    ''')
+    conn.close()
+
+    app.init_db()
+    app.write_batch([reading('node_2', 0)], updates=[(PARTITION, 1, 'node_1', 'GOOD', 'PENDING')])
+    rows, watermark = app.node_latest_since(0)
+    assert relayed(rows) == [('node_1', 100.0, 'GOOD'), ('node_2', 100.0, 'PENDING')]
+    assert watermark == 2
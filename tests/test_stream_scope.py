@@ -0,0 +1,57 @@
+# Dashboard stream scoping: /api/stream with bbox and nodes sends only the
+# updates for nodes in the viewport or named explicitly
+#
+# Run with: python -m pytest tests
+import json
+
+import pytest
+
+import app
+
+NODES = {'n0': (10.0, 106.0), 'n1': (10.5, 106.5), 'n2': (11.0, 107.0), 'n3': (20.0, 100.0)}
+
+@pytest.fixture
+def client(database, monkeypatch):
+    monkeypatch.setattr(app, 'STREAM_COALESCE_INTERVAL', 0)
+    conn = app.db_connect()
+    for node_id, (lat, lon) in NODES.items():
+        conn.execute('INSERT INTO nodes (node_id, latitude, longitude, last_updated) VALUES (?, ?, ?, 0)',
+                     (node_id, lat, lon))
+    conn.commit()
+    conn.close()
+    return app.app.test_client()
+
+def open_stream(client, query=''):
+    response = client.get('/api/stream' + query, buffered=False)
+    chunks = (c.decode('utf-8') if isinstance(c, bytes) else c for c in response.response)
+    assert next(chunks).startswith('retry:')
+    return response, chunks
+
+def node_ids(event):
+    return sorted(u['node_id'] for u in json.loads(event.split('data: ', 1)[1]))
+
+def update(node_id):
+    return {'node_id': node_id, 'tds': 100}
+
+def test_viewport_stream_skips_nodes_outside(client):
+    subscribers = app.EVENT_HUB.stats()['subscribers']
+    scoped, scoped_events = open_stream(client, f'?bbox=105.9,9.9,106.6,10.6&nodes=n3&since={app.EVENT_HUB.version}')
+    full, full_events = open_stream(client)
+    try:
+        app.EVENT_HUB.publish([update(n) for n in ('n0', 'n1', 'n2', 'n3', 'unplaced')])
+        event = next(scoped_events)
+        assert node_ids(event) == ['n0', 'n1', 'n3']
+        assert event.startswith(f'id: {app.EVENT_HUB.version}\n')
+        assert node_ids(next(full_events)) == ['n0', 'n1', 'n2', 'n3', 'unplaced']
+
+        # Nothing in scope changed: the scoped stream only keeps alive
+        app.EVENT_HUB.publish([update('n2')])
+        assert next(scoped_events) == ': keepalive\n\n'
+        assert node_ids(next(full_events)) == ['n2']
+    finally:
+        scoped.close()
+        full.close()
+    assert app.EVENT_HUB.stats()['subscribers'] == subscribers
+
+def test_malformed_bbox_is_rejected(client):
+    assert client.get('/api/stream?bbox=bad').status_code == 400
@@ -0,0 +1,77 @@
+# Webhook ingest: readings are validated while the body is parsed, so a bad
+# one ends the payload without storing any chunk twice
+#
+# Run with: python -m pytest tests
+import pytest
+
+import app
+
+def readings(count, start=1700000000):
+    return [{"timestamp": start + i, "tds": 500 + i, "ph": 7.2, "humidity": 55, "temperature": 26}
+            for i in range(count)]
+
+def post(client, data, node_id="node_1"):
+    response = client.post('/api/webhook/data', json=[{"nodeId": node_id, "data": data}])
+    return response.status_code, response.get_json()
+
+@pytest.fixture
+def client(database, unbuffered, monkeypatch):
+    monkeypatch.setattr(app, 'WEBHOOK_CHUNK_ROWS', 10)
+    return app.app.test_client()
+
+@pytest.mark.parametrize('value', ["abc", [512], {"v": 512}, True, "nan", "1e999"])
+def test_bad_value_stops_the_payload_once(client, stored, value):
+    data = readings(21)
+    data[15]["tds"] = value
+    status, body = post(client, data)
+    assert status == 400
+    assert 'Invalid tds' in body["error"]
+    # The chunk before the bad reading and the rows after it are each stored once
+    assert body["measurements"] == 15
+    assert body["progress"]["node_1"]["last_timestamp"] == 1700000014
+    assert [row[1] for row in stored('id', 'tds')] == [500.0 + i for i in range(15)]
+
+def test_numeric_strings_are_coerced(client, stored):
+    data = readings(3)
+    data[1].update(tds="512", ph=" 6.5 ")
+    status, body = post(client, data)
+    assert status == 200
+    assert body["measurements"] == 3
+    assert stored('id', 'tds', 'ph')[1][1:] == (512.0, 6.5)
+
+@pytest.mark.parametrize('change', [{"timestamp": None}, {"timestamp": "yesterday"}, {"timestamp": -5e10}])
+def test_reading_needs_a_timestamp(client, stored, change):
+    data = readings(2)
+    data[0].update(change)
+    status, body = post(client, data)
+    assert status == 400
+    assert stored() == []
+
+def test_bad_node_id_is_rejected(client, stored):
+    status, body = post(client, readings(2), node_id={"id": 1})
+    assert status == 400
+    assert 'nodeId' in body["error"]
+    assert stored() == []
+
+def test_detector_skips_values_that_are_not_numbers():
+    detector = app.AnomalyDetector(window=8)
+    rows = [(0, "512", None, [1], 26.0)] + [(ts, 500.0, 7.0, 55.0, 26.0) for ts in range(1, 12)]
+    with detector.lock:
+        assert detector.observe("node_1", rows) == []
+
+def test_storage_error_is_not_a_parse_error(client, stored, monkeypatch):
+    # The second chunk fails to commit: the request fails with 500 and
+    # nothing is stored twice or retried as leftover rows
+    commit_rows = app.commit_rows
+    calls = []
+    def failing_commit(rows, status=app.PENDING_STATUS):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise TypeError("cannot store chunk")
+        return commit_rows(rows, status)
+    monkeypatch.setattr(app, 'commit_rows', failing_commit)
+    status, body = post(client, readings(25))
+    assert status == 500
+    assert "cannot store chunk" in body["error"]
+    assert calls == [10, 10]
+    assert [row[1] for row in stored('id', 'tds')] == [500.0 + i for i in range(10)]
@@ -0,0 +1,100 @@
+# Streaming webhook parser: JSON arrays and NDJSON read through
+# JSONStreamReader, with chunk sizes small enough that values straddle reads
+#
+# Run with: python -m pytest tests
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import app  # noqa: E402
+
+def measurements(count, start=1700000000):
+    return [{"timestamp": start + i, "tds": 100 + i * 0.5, "ph": 7.25, "humidity": 55.0, "temperature": 26.5}
+            for i in range(count)]
+
+def parse(body, ndjson=False, **kwargs):
+    reader = app.JSONStreamReader(io.BytesIO(body.encode('utf-8')), **kwargs)
+    return list(app.iter_webhook_measurements(reader, ndjson))
+
+def expected(nodes):
+    return [(node["nodeId"], m) for node in nodes for m in node["data"]]
+
+NODES = [
+    {"nodeId": "node_1", "data": measurements(3)},
+    {"data": measurements(2, 1700001000), "nodeId": "nút_2"},  # data before nodeId, multi-byte id
+    {"nodeId": "node_3", "data": []}
+]
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 7, 64, 65536])
+def test_array_across_chunk_boundaries(read_size):
+    assert parse(json.dumps(NODES), read_size=read_size) == expected(NODES)
+
+@pytest.mark.parametrize('read_size', [1, 3, 7, 65536])
+def test_ndjson_across_chunk_boundaries(read_size):
+    body = '\n'.join(json.dumps(node) for node in NODES) + '\n'
+    assert parse(body, ndjson=True, read_size=read_size) == expected(NODES)
+
+def test_number_split_at_chunk_end():
+    # "12.5" read as "12" then ".5" must not decode as 12
+    body = '[{"nodeId":"n","data":[{"timestamp":1,"tds":12.5e1}]}]'
+    for read_size in range(1, len(body) + 1):
+        assert parse(body, read_size=read_size) == [("n", {"timestamp": 1, "tds": 125.0})]
+
+def test_ndjson_flat_measurements():
+    lines = [dict(m, nodeId="node_1") for m in measurements(3)]
+    body = '\n'.join(json.dumps(line) for line in lines)
+    assert parse(body, ndjson=True, read_size=5) == [("node_1", line) for line in lines]
+
+def test_ndjson_node_line_is_streamed():
+    # One node with a long data array on a single line: the reader holds a
+    # measurement at a time, not the line
+    node = {"nodeId": "node_1", "data": measurements(20000)}
+    body = json.dumps(node).encode('utf-8')
+    reader = app.JSONStreamReader(io.BytesIO(body), read_size=4096)
+    largest = count = 0
+    for node_id, measurement in app.iter_webhook_measurements(reader, ndjson=True):
+        assert node_id == "node_1"
+        largest = max(largest, len(reader.buf))
+        count += 1
+    assert count == 20000
+    assert largest < 4096 + 200
+    assert len(body) > 100 * largest
+
+def test_ndjson_malformed_line_keeps_earlier_lines():
+    body = json.dumps(NODES[0]) + '\n{"nodeId": "node_2", "data": [{"timestamp": 1,}]}\n'
+    reader = app.JSONStreamReader(io.BytesIO(body.encode('utf-8')), read_size=16)
+    parsed = []
+    with pytest.raises(ValueError):
+        for item in app.iter_webhook_measurements(reader, ndjson=True):
+            parsed.append(item)
+    assert parsed == expected(NODES[:1])
+
+@pytest.mark.parametrize('line', ['[1, 2]', '"text"', '42'])
+def test_ndjson_rejects_non_object_lines(line):
+    with pytest.raises(ValueError, match='object per line'):
+        parse(json.dumps(NODES[0]) + '\n' + line + '\n', ndjson=True)
+
+@pytest.mark.parametrize('body', [
+    '[{"nodeId": "n", "data": [{"timestamp": 1}]',  # truncated
+    '[{"nodeId": "n", "data": [{"timestamp": 1}]}] trailing',
+    '{"nodeId": "n"}'  # object where the array belongs
+])
+def test_array_malformed(body):
+    with pytest.raises(ValueError):
+        parse(body, read_size=4)
+
+def test_oversized_value_is_refused():
+    line = json.dumps({"nodeId": "n", "data": [{"timestamp": 1, "note": "x" * 5000}]})
+    with pytest.raises(app.PayloadTooLarge):
+        parse(line, ndjson=True, read_size=256, max_value=1024)
+    # the same line fits once the limit allows it
+    assert len(parse(line, ndjson=True, read_size=256, max_value=8192)) == 1
+
+def test_oversized_body_is_refused():
+    body = '\n'.join(json.dumps(node) for node in NODES)
+    with pytest.raises(app.PayloadTooLarge):
+        parse(body, ndjson=True, read_size=16, max_bytes=64)
@@ -0,0 +1,79 @@
+# Write buffer: rows are checked when they are submitted, and the journal
+# left by a process that died with readings buffered is replayed exactly
+# once by the next one
+#
+# Run with: python -m pytest tests
+import os
+from datetime import datetime
+
+import pytest
+
+import app
+
+def chunk(node_id, start, count=3):
+    return [(node_id, 100.0 + i, 7.0, 55.0, 26.0, datetime.fromtimestamp(start + i)) for i in range(count)]
+
+def idle_buffer():
+    # Journaled, and never due on its own within a test
+    return app.WriteBuffer(10000, 10 ** 6, 3600, journal='write')
+
+def crash(buffer):
+    # The process is gone: its flock is released and nothing is flushed
+    buffer.journal.close()
+    buffer.journal = None
+
+@pytest.mark.parametrize('row', [
+    ("node_1", "abc", 7.0, 55.0, 26.0, datetime(2024, 1, 1)),
+    ("node_1", 100.0, [7.0], 55.0, 26.0, datetime(2024, 1, 1)),
+    (None, 100.0, 7.0, 55.0, 26.0, datetime(2024, 1, 1)),
+    ("node_1", 100.0, 7.0, 55.0, 26.0, 1704067200),
+    ("node_1", 100.0, 7.0, 55.0, 26.0, datetime(1, 1, 1)),
+    ("node_1", 100.0, 7.0, 55.0, 26.0)
+])
+def test_submit_rejects_rows_that_cannot_be_stored(database, row):
+    buffer = idle_buffer()
+    with pytest.raises(ValueError):
+        buffer.submit(chunk("node_1", 1700000000) + [row])
+    assert buffer.stats()["depth"] == 0
+    assert buffer.thread is None  # rejected before the journal was opened
+
+def test_submit_rejects_mismatched_statuses(database):
+    with pytest.raises(ValueError):
+        idle_buffer().submit(chunk("node_1", 1700000000), ['GOOD'])
+
+def test_journal_is_replayed_after_a_crash(database, stored):
+    buffer = idle_buffer()
+    chunks = [chunk("node_1", 1700000000), chunk("node_2", 1700000100), chunk("node_1", 1700000200)]
+    for rows in chunks:
+        buffer.submit(rows)
+    path = buffer.journal_path
+
+    # The first entry reached the database with its journal position,
+    # then the process died halfway through appending another entry
+    app.write_batch(chunks[0], journal=(buffer.journal_key, 1))
+    buffer.journal.write(b'{"seq":4,"status":"PENDING","rows":[["node_3",1')
+    buffer.journal.flush()
+
+    # A journal still locked by a live process is left alone
+    idle_buffer().recover()
+    assert len(stored()) == 3
+
+    crash(buffer)
+    recovered = idle_buffer()
+    recovered.recover()
+    assert recovered.stats()["recovered"] == 6
+    assert not os.path.exists(path)
+
+    rows = stored('id', 'node_id', 'tds', 'ts')
+    assert [row[0] for row in rows] == list(range(1, 10))
+    assert [(row[1], row[2], row[3]) for row in rows] == [
+        (node_id, tds, app.reading_ts(timestamp)) for rows in chunks for node_id, tds, _, _, _, timestamp in rows]
+
+    # Positions are forgotten with the journal; a second recovery is a no-op
+    conn = app.db_connect()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM sensor_sequence WHERE name LIKE 'journal:%'").fetchone()[0] == 0
+    finally:
+        conn.close()
+    idle_buffer().recover()
+    assert len(stored()) == 9